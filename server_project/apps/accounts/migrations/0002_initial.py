@@ -0,0 +1,44 @@
+# Generated by Django 5.1.15 on 2026-10-19 00:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('database', '0001_initial'),
+        ('lectures', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='base_lecture_folder',
+            field=models.OneToOneField(blank=True, help_text='Base lecture folder for the publisher.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='user', to='lectures.lecturefolder'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='groups',
+            field=models.ManyToManyField(blank=True, help_text='The groups this user belongs to. A user will get all permissions granted to each of their groups.', related_name='user_set', related_query_name='user', to='auth.group', verbose_name='groups'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='user_permissions',
+            field=models.ManyToManyField(blank=True, help_text='Specific permissions for this user.', related_name='user_set', related_query_name='user', to='auth.permission', verbose_name='user permissions'),
+        ),
+        migrations.AddField(
+            model_name='groupprofile',
+            name='base_folder',
+            field=models.OneToOneField(blank=True, help_text='Base folder for the publisher group.', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='groupprofile', to='database.folder'),
+        ),
+        migrations.AddField(
+            model_name='groupprofile',
+            name='group',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='profile', to='auth.group'),
+        ),
+    ]
@@ -0,0 +1,88 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from apps.monitoring.metrics import COUNTER, registry
+
+VERSION_PREFIX = "version"
+# below the 250 characters memcached allows, with room for the key prefix
+MAX_KEY_LENGTH = 200
+
+registry.register(
+    "cache_requests_total",
+    COUNTER,
+    "Cache lookups by cached value and result (hit or miss).",
+)
+
+_MISSING = object()
+
+
+def get_versions(namespaces):
+    """
+    Get the current version of every namespace.
+
+    A namespace without a version, because it was never used or was evicted,
+    starts at the current time, so it never matches entries left over from
+    an earlier version.
+    """
+    keys = [f"{VERSION_PREFIX}:{namespace}" for namespace in namespaces]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def invalidate(*namespaces):
+    """
+    Bump the version of namespaces, which orphans every entry keyed by them.
+
+    Inside a transaction the bump waits for the commit. Bumped earlier, a
+    concurrent request would read the old rows and cache them under the new
+    version, where they would stay until they expire.
+    """
+    transaction.on_commit(lambda: _bump(namespaces))
+
+
+def _bump(namespaces):
+    for namespace in namespaces:
+        try:
+            cache.incr(f"{VERSION_PREFIX}:{namespace}")
+        except ValueError:
+            # no version yet, the next lookup starts a new one
+            pass
+
+
+def get_or_set(namespaces, name, compute, params=()):
+    """
+    Get ``name`` from the cache, computing and storing it on a miss.
+
+    The key holds the version of every namespace the value depends on, so
+    invalidating any of them makes the next lookup compute it again.
+    ``params`` tell apart values of the same name, like the tiles of an
+    image, which are counted together in cache_requests_total. Keys grown
+    too long by their params are hashed.
+
+    None isn't stored, so something missing, like the DZI of a slide whose
+    images are still being generated, is looked up again on the next call.
+    """
+    versions = get_versions(namespaces)
+    key = ":".join(
+        [name, *map(str, params)]
+        + [f"{namespace}={v}" for namespace, v in zip(namespaces, versions)]
+    )
+    if len(key) > MAX_KEY_LENGTH:
+        key = f"{name}:{hashlib.md5(key.encode()).hexdigest()}"
+
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        registry.inc("cache_requests_total", {"cache": name, "result": "miss"})
+        value = compute()
+        if value is not None:
+            cache.set(key, value)
+    else:
+        registry.inc("cache_requests_total", {"cache": name, "result": "hit"})
+    return value
@@ -0,0 +1,73 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from apps.database.models import Folder, Slide, Tag
+from apps.lectures.models import Lecture, LectureContent, LectureFolder
+from apps.slide_viewer.models import Annotation
+from .cache import invalidate
+
+
+@receiver(post_save, sender=Slide)
+@receiver(post_delete, sender=Slide)
+def invalidate_slide(sender, instance, **kwargs):
+    invalidate(f"slide:{instance.pk}", "slide-facets")
+    _invalidate_lectures(LectureContent.objects.filter(slide=instance.pk))
+
+
+@receiver(post_save, sender=Folder)
+@receiver(post_delete, sender=Folder)
+def invalidate_folder(sender, instance, **kwargs):
+    # a moved folder takes its slides to another group
+    invalidate("folder-tree", "slide-facets")
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag(sender, instance, **kwargs):
+    invalidate("slide-facets")
+
+
+@receiver(m2m_changed, sender=Tag.slides.through)
+def invalidate_tag_links(sender, action, **kwargs):
+    if action.startswith("post_"):
+        invalidate("slide-facets")
+
+
+@receiver(post_save, sender=Annotation)
+@receiver(post_delete, sender=Annotation)
+def invalidate_annotation(sender, instance, **kwargs):
+    invalidate(f"annotation:{instance.pk}")
+    _invalidate_lectures(LectureContent.objects.filter(annotation=instance.pk))
+
+
+@receiver(post_save, sender=Lecture)
+@receiver(post_delete, sender=Lecture)
+def invalidate_lecture(sender, instance, **kwargs):
+    invalidate(f"lecture:{instance.pk}")
+
+
+@receiver(post_save, sender=LectureFolder)
+@receiver(post_delete, sender=LectureFolder)
+def invalidate_lecture_folder(sender, instance, **kwargs):
+    invalidate("lecture-folder-tree")
+
+
+@receiver(post_save, sender=LectureContent)
+@receiver(post_delete, sender=LectureContent)
+def invalidate_lecture_content(sender, instance, **kwargs):
+    invalidate(f"lecture:{instance.lecture_id}")
+
+
+@receiver(m2m_changed, sender=Lecture.groups.through)
+def invalidate_lecture_groups(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if not reverse:
+        invalidate(f"lecture:{instance.pk}")
+    elif pk_set is not None:
+        invalidate(*(f"lecture:{pk}" for pk in pk_set))
+
+
+def _invalidate_lectures(contents):
+    lecture_ids = contents.values_list("lecture_id", flat=True).distinct()
+    invalidate(*(f"lecture:{pk}" for pk in lecture_ids))
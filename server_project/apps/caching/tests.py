@@ -0,0 +1,201 @@
+import os
+import warnings
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.cache.backends.base import CacheKeyWarning
+from django.test import TestCase
+from django.urls import reverse
+
+from apps.accounts.models import GroupProfile, User
+from apps.database.models import Folder, Slide
+from apps.lectures.models import Lecture, LectureContent
+from .cache import get_or_set
+
+
+class CacheInvalidationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.publisher_groups = []
+        for name in ("pathology", "anatomy"):
+            group = Group.objects.create(name=name)
+            GroupProfile.objects.create(
+                group=group, type=GroupProfile.TypeChoices.PUBLISHER
+            )
+            cls.publisher_groups.append(group)
+        cls.publisher = User.objects.create_user("pathologist", "Patho", "Logist")
+        cls.publisher.groups.add(cls.publisher_groups[0])
+        cls.publisher.save()  # creates the base lecture folder
+
+        students = Group.objects.create(name="students")
+        GroupProfile.objects.create(
+            group=students, type=GroupProfile.TypeChoices.VIEWER
+        )
+        cls.viewer = User.objects.create_user("student", "Stu", "Dent")
+        cls.viewer.groups.add(students)
+
+        base = cls.publisher_groups[0].profile.base_folder
+        cls.folder = Folder.objects.create(name="Liver", parent=base)
+        cls.public, cls.private = Slide.objects.bulk_create(
+            [
+                Slide(
+                    name="Cirrhosis",
+                    file="slides/cirrhosis.svs",
+                    image_root="images/cirrhosis",
+                    is_public=True,
+                    folder=cls.folder,
+                ),
+                Slide(name="Hepatitis", file="slides/hepatitis.svs", folder=base),
+            ]
+        )
+        cls.lecture = Lecture.objects.create(
+            name="Liver diseases",
+            author=cls.publisher,
+            folder=cls.publisher.base_lecture_folder,
+        )
+        LectureContent.objects.create(lecture=cls.lecture, order=1, slide=cls.public)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_permission_checks_are_not_cached(self):
+        folder = self.publisher_groups[0].profile.base_folder
+        slide = self.public
+        url = reverse("api:slide-dzi", kwargs={"pk": slide.pk})
+        self.client.force_login(self.viewer)
+        self.assertTrue(folder.user_can_edit(self.publisher))
+        self.assertNotEqual(self.client.get(url).status_code, 403)
+
+        # changes without signals, like those made by another worker
+        self.publisher.groups.through.objects.filter(user=self.publisher).delete()
+        Slide.objects.filter(pk=slide.pk).update(is_public=False)
+
+        self.assertFalse(folder.user_can_edit(self.publisher))
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_group_membership_changes_editable_folders(self):
+        folder = self.publisher_groups[1].profile.base_folder
+        self.assertFalse(folder.user_can_edit(self.publisher))
+
+        self.publisher.groups.add(self.publisher_groups[1])
+        self.assertTrue(folder.user_can_edit(self.publisher))
+
+        self.publisher_groups[1].user_set.remove(self.publisher)
+        self.assertFalse(folder.user_can_edit(self.publisher))
+
+    def test_folder_move_changes_editable_folders(self):
+        folder = self.folder
+        self.assertTrue(folder.user_can_edit(self.publisher))
+
+        folder.name = "Moved"
+        folder.parent = self.publisher_groups[1].profile.base_folder
+        folder.save()
+        self.assertFalse(folder.user_can_edit(self.publisher))
+
+    def test_dzi_is_cached_until_the_slide_changes(self):
+        slide = self.public
+        url = reverse("api:slide-dzi", kwargs={"pk": slide.pk})
+        self.client.force_login(self.viewer)
+
+        with TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            os.makedirs(slide.get_image_directory())
+            with open(slide.get_dzi_path(), "w") as f:
+                f.write("<Image/>")
+            self.assertEqual(self.client.get(url).content, b"<Image/>")
+
+            os.remove(slide.get_dzi_path())
+            self.assertEqual(self.client.get(url).content, b"<Image/>")
+
+            with self.captureOnCommitCallbacks(execute=True):
+                Slide.objects.get(pk=slide.pk).save()
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_missing_dzi_is_not_cached(self):
+        url = reverse("api:slide-dzi", kwargs={"pk": self.public.pk})
+        self.client.force_login(self.viewer)
+
+        with TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+            os.makedirs(self.public.get_image_directory())
+            with open(self.public.get_dzi_path(), "w") as f:
+                f.write("<Image/>")
+            self.assertEqual(self.client.get(url).content, b"<Image/>")
+
+    def test_repair_replaces_the_cached_dzi(self):
+        slide = self.public
+        url = reverse("api:slide-dzi", kwargs={"pk": slide.pk})
+        self.client.force_login(self.viewer)
+
+        def generate_images(openslide):
+            with open(slide.get_dzi_path(), "w") as f:
+                f.write('<Image Format="png"/>')
+
+        status = {
+            "needs_repair": True,
+            "file_exists": True,
+            "dzi_exists": False,
+            "metadata_valid": True,
+        }
+        with TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            os.makedirs(slide.get_image_directory())
+            with open(slide.get_dzi_path(), "w") as f:
+                f.write("<Image/>")
+            self.assertEqual(self.client.get(url).content, b"<Image/>")
+
+            with (
+                patch("apps.database.models.OpenSlide"),
+                patch.object(Slide, "check_integrity", return_value=status),
+                patch.object(Slide, "_delete_directory"),
+                patch.object(Slide, "_generate_images", side_effect=generate_images),
+                self.captureOnCommitCallbacks(execute=True),
+            ):
+                slide.repair(status)
+            self.assertEqual(self.client.get(url).content, b'<Image Format="png"/>')
+
+    def test_private_slide_stays_forbidden(self):
+        url = reverse("api:slide-dzi", kwargs={"pk": self.private.pk})
+        self.client.force_login(self.viewer)
+
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_lecture_contents_follow_their_slides(self):
+        lecture = self.lecture
+        content = lecture.get_contents()[0]
+
+        slide = Slide.objects.get(pk=content.slide_id)
+        slide.name = "Renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            slide.save()
+        self.assertEqual(lecture.get_contents()[0].slide.name, "Renamed")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            content.delete()
+        self.assertNotIn(content.pk, [c.pk for c in lecture.get_contents()])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            LectureContent.objects.create(lecture=lecture, slide=slide, order=99)
+        self.assertEqual(lecture.get_contents()[-1].order, 99)
+
+    def test_invalidation_waits_for_the_commit(self):
+        lecture = self.lecture
+        slide = Slide.objects.get(pk=lecture.get_contents()[0].slide_id)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            slide.name = "Renamed"
+            slide.save()
+            # another request would still get the committed contents
+            self.assertNotEqual(lecture.get_contents()[0].slide.name, "Renamed")
+        for callback in callbacks:
+            callback()
+        self.assertEqual(lecture.get_contents()[0].slide.name, "Renamed")
+
+    def test_long_params_are_hashed(self):
+        params = [",".join(map(str, range(1000)))]
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", CacheKeyWarning)
+            self.assertEqual(get_or_set(["tags"], "facets", lambda: 1, params), 1)
+            self.assertEqual(get_or_set(["tags"], "facets", lambda: 2, params), 1)
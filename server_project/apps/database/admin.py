@@ -18,9 +18,23 @@ class FolderAdmin(admin.ModelAdmin):
 @admin.register(Slide)
 class SlideAdmin(admin.ModelAdmin):
     list_display = ("name", "file", "folder", "created_at", "updated_at", "author")
+    list_filter = ("vendor", "objective_power")
     search_fields = ("name", "information")
     ordering = ("-created_at",)
-    readonly_fields = ("folder", "image_root", "metadata")
+    readonly_fields = (
+        "folder",
+        "image_root",
+        "metadata",
+        "properties",
+        "vendor",
+        "width",
+        "height",
+        "level_count",
+        "objective_power",
+        "mpp_x",
+        "mpp_y",
+        "file_size",
+    )
     prepopulated_fields = {"name": ("file",)}
 
 
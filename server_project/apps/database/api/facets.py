@@ -0,0 +1,43 @@
+from django.db.models import Count
+
+from apps.caching.cache import get_or_set
+from ..models import Tag
+
+
+def get_visibility_scope(user):
+    """Users in the same groups can view the same slides and share facets."""
+    if user.is_admin():
+        return "admin"
+    return ",".join(map(str, user.groups.order_by("id").values_list("id", flat=True)))
+
+
+def get_facets(queryset, scope, filters):
+    """
+    Get the tag counts of ``queryset``, cached per scope and filters.
+
+    Saving or deleting a slide, folder or tag, or linking tags to slides,
+    invalidates the cached counts.
+    """
+    filters = "&".join(f"{name}={value}" for name, value in sorted(filters.items()))
+    return get_or_set(
+        ["slide-facets"],
+        "slide-facets",
+        lambda: count_facets(queryset),
+        params=(scope, filters),
+    )
+
+
+def count_facets(queryset):
+    rows = (
+        Tag.slides.through.objects.filter(slide__in=queryset.values("id"))
+        .values("tag_id", "tag__name")
+        .annotate(count=Count("slide_id"))
+        .order_by("-count", "tag__name")
+    )
+    return {
+        "count": queryset.count(),
+        "tags": [
+            {"id": row["tag_id"], "name": row["tag__name"], "count": row["count"]}
+            for row in rows
+        ],
+    }
@@ -0,0 +1,58 @@
+import django_filters
+from django.db.models import Exists, OuterRef
+
+from ..models import Folder, Slide, Tag
+
+
+class NumberInFilter(django_filters.BaseInFilter, django_filters.NumberFilter):
+    pass
+
+
+class SlideFilter(django_filters.FilterSet):
+    tags = NumberInFilter(
+        method="filter_any_tag", help_text="Slides with any of these tag ids."
+    )
+    tags_all = NumberInFilter(
+        method="filter_all_tags", help_text="Slides with all of these tag ids."
+    )
+    folder_tree = django_filters.ModelChoiceFilter(
+        queryset=Folder.objects.all(),
+        method="filter_folder_tree",
+        help_text="Slides in this folder or any of its subfolders.",
+    )
+
+    class Meta:
+        model = Slide
+        fields = {
+            "folder": ["exact"],
+            "is_public": ["exact"],
+            "vendor": ["exact", "iexact"],
+            "objective_power": ["exact", "gte", "lte"],
+            "file_size": ["gte", "lte"],
+            "width": ["gte", "lte"],
+            "height": ["gte", "lte"],
+            "level_count": ["exact", "gte"],
+            "mpp_x": ["gte", "lte"],
+            "mpp_y": ["gte", "lte"],
+        }
+
+    def filter_any_tag(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.filter(Exists(_tagged(value)))
+
+    def filter_all_tags(self, queryset, name, value):
+        for tag_id in set(value):
+            queryset = queryset.filter(Exists(_tagged([tag_id])))
+        return queryset
+
+    def filter_folder_tree(self, queryset, name, value):
+        if value is None:
+            return queryset
+        return queryset.filter(folder__path__startswith=value.path)
+
+
+def _tagged(tag_ids):
+    return Tag.slides.through.objects.filter(
+        slide_id=OuterRef("pk"), tag_id__in=tag_ids
+    )
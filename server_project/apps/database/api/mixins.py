@@ -0,0 +1,38 @@
+class SparseFieldsetsMixin:
+    """
+    Let clients choose the fields they need with ``?fields=id,name``.
+
+    Fields listed in ``heavy_fields`` are left out of list responses unless
+    they are requested explicitly.
+    """
+
+    heavy_fields = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        request = self.context.get("request")
+        if request is None or request.method != "GET":
+            return
+
+        requested = get_requested_fields(request)
+        if requested:
+            omitted = set(self.fields) - requested
+        elif getattr(self.context.get("view"), "action", None) == "list":
+            omitted = set(self.heavy_fields)
+        else:
+            return
+
+        for name in omitted:
+            self.fields.pop(name, None)
+
+    @classmethod
+    def get_deferred_fields(cls, request):
+        """Get the heavy model fields a list request doesn't need to load."""
+        requested = get_requested_fields(request)
+        return [name for name in cls.heavy_fields if name not in requested]
+
+
+def get_requested_fields(request):
+    fields = request.query_params.get("fields", "")
+    return {name.strip() for name in fields.split(",") if name.strip()}
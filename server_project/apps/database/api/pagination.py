@@ -0,0 +1,20 @@
+from rest_framework import pagination
+
+
+class CursorPagination(pagination.CursorPagination):
+    """Paginate list endpoints by primary key, which never changes or repeats."""
+
+    ordering = "id"
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Break ties of a requested ordering by id, or rows sharing a value
+        could come back in a different order on the next page, repeating
+        some rows and skipping others.
+        """
+        ordering = tuple(super().get_ordering(request, queryset, view))
+        if not {"id", "-id", "pk", "-pk"} & set(ordering):
+            ordering += ("-id" if ordering[0].startswith("-") else "id",)
+        return ordering
@@ -1,10 +1,11 @@
 from django.urls import reverse
 from rest_framework import serializers
 
+from .mixins import SparseFieldsetsMixin
 from ..models import Slide, Folder
 
 
-class FolderSerializer(serializers.ModelSerializer):
+class FolderSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     author = serializers.CharField(source="author.username", default=None)
     url = serializers.SerializerMethodField()
 
@@ -28,6 +29,10 @@ class FolderSerializer(serializers.ModelSerializer):
         parent = attrs.get("parent")
         if parent and not parent.user_can_edit(user):
             errors["parent"] = "You don't have permission to edit this folder."
+        elif parent and self.instance and (
+            parent == self.instance or self.instance.is_children(parent)
+        ):
+            errors["parent"] = "Folder can't be moved into its own subfolder."
 
         if errors:
             raise serializers.ValidationError(errors)
@@ -38,7 +43,9 @@ class FolderSerializer(serializers.ModelSerializer):
         return reverse("api:folder-detail", kwargs={"pk": obj.pk})
 
 
-class SlideSerializer(serializers.ModelSerializer):
+class SlideSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    heavy_fields = ("metadata", "properties")
+
     author = serializers.CharField(source="author.username", default=None)
     thumbnail = serializers.SerializerMethodField()
     associated_image = serializers.SerializerMethodField()
@@ -58,13 +65,35 @@ class SlideSerializer(serializers.ModelSerializer):
             "thumbnail",
             "associated_image",
             "metadata",
+            "properties",
+            "vendor",
+            "width",
+            "height",
+            "level_count",
+            "objective_power",
+            "mpp_x",
+            "mpp_y",
+            "file_size",
             "is_public",
             "created_at",
             "updated_at",
             "url",
             "view_url",
         ]
-        read_only_fields = ["author", "image_root", "metadata"]
+        read_only_fields = [
+            "author",
+            "image_root",
+            "metadata",
+            "properties",
+            "vendor",
+            "width",
+            "height",
+            "level_count",
+            "objective_power",
+            "mpp_x",
+            "mpp_y",
+            "file_size",
+        ]
 
     def validate(self, attrs):
         user = self.context["request"].user
@@ -90,3 +119,73 @@ class SlideSerializer(serializers.ModelSerializer):
 
     def get_view_url(self, obj):
         return reverse("slide_viewer:slide-view", kwargs={"slide_id": obj.pk})
+
+
+class SlideListSerializer:
+    """
+    Serialize many slides with the same output as ``SlideSerializer``.
+
+    Rows are read with ``.values()`` and URLs are formatted from templates
+    reversed once per serializer, instead of building a model instance and
+    reversing four URLs for every slide.
+    """
+
+    url_fields = {
+        "thumbnail": ("api:slide-thumbnail", "pk"),
+        "associated_image": ("api:slide-associated-image", "pk"),
+        "url": ("api:slide-detail", "pk"),
+        "view_url": ("slide_viewer:slide-view", "slide_id"),
+    }
+    columns = {"author": "author__username", "folder": "folder_id"}
+
+    def __init__(self, context=None):
+        self.context = context or {}
+        self.fields = SlideSerializer(context=self.context).fields
+        self.request = self.context.get("request")
+
+    def get_rows(self, queryset, *extra_columns):
+        columns = {"id", *extra_columns}
+        for name in self.fields:
+            if name not in self.url_fields:
+                columns.add(self.columns.get(name, name))
+        return queryset.values(*columns)
+
+    def to_representation(self, rows):
+        converters = [
+            (name, *self._get_converter(name, field))
+            for name, field in self.fields.items()
+        ]
+        return [
+            {
+                name: None if row[column] is None else convert(row[column])
+                for name, column, convert in converters
+            }
+            for row in rows
+        ]
+
+    def serialize(self, queryset):
+        return self.to_representation(self.get_rows(queryset))
+
+    def _get_converter(self, name, field):
+        if name in self.url_fields:
+            return "id", _url_template(*self.url_fields[name]).format
+        if name in self.columns:
+            return self.columns[name], lambda value: value
+        if name == "file":
+            return "file", self._get_file_url
+        return name, field.to_representation
+
+    def _get_file_url(self, name):
+        if not name:
+            return None
+        url = Slide._meta.get_field("file").storage.url(name)
+        if self.request is not None:
+            return self.request.build_absolute_uri(url)
+        return url
+
+
+def _url_template(view_name, kwarg):
+    # any pk works, it is only there to be replaced by a placeholder
+    placeholder = 2**31 - 1
+    url = reverse(view_name, kwargs={kwarg: placeholder})
+    return url.replace(str(placeholder), "{}")
@@ -0,0 +1,49 @@
+import hashlib
+from collections import defaultdict
+
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from apps.caching.cache import get_or_set
+
+
+def get_tree(model, namespace, root_ids):
+    """
+    Get the nested tree below ``root_ids``, cached per root set.
+
+    Folder signals invalidate ``namespace`` whenever a folder is created,
+    renamed, moved or deleted.
+    """
+
+    def build():
+        rows = model.objects.order_by("name").values_list("id", "name", "parent_id")
+        return build_tree(rows, root_ids)
+
+    return get_or_set([namespace], namespace, build, params=root_ids)
+
+
+def build_tree(rows, root_ids):
+    """Nest ``(id, name, parent_id)`` rows below the given roots."""
+    nodes = {}
+    children = defaultdict(list)
+    for pk, name, parent_id in rows:
+        nodes[pk] = {"id": pk, "name": name, "subfolders": children[pk]}
+        children[parent_id].append(nodes[pk])
+    return [nodes[pk] for pk in root_ids if pk in nodes]
+
+
+def get_tree_etag(version, *parts):
+    digest = hashlib.md5(":".join(map(str, (version,) + parts)).encode())
+    return quote_etag(digest.hexdigest())
+
+
+def tree_response(request, etag, get_tree_data):
+    """Answer 304 if the client has this tree already, otherwise send it."""
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    client_etags = parse_etags(request.headers.get("If-None-Match", ""))
+    if "*" in client_etags or etag in (tag.removeprefix("W/") for tag in client_etags):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return Response(get_tree_data(), headers=headers)
@@ -1,30 +1,45 @@
 import logging
 import os
 
-from django.http import FileResponse
+from django.http import FileResponse, HttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets
 from rest_framework.decorators import action
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.filters import OrderingFilter
 from rest_framework.permissions import IsAuthenticated, DjangoModelPermissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from apps.slide_viewer.api.serializers import AnnotationSerializer
-from apps.slide_viewer.models import Annotation
-from .serializers import SlideSerializer, FolderSerializer
+from apps.caching.cache import get_versions
+from apps.slide_viewer.api.serializers import (
+    AnnotationSerializer,
+    get_encoding_param,
+    get_level_param,
+)
+from apps.slide_viewer.codec import decode_shape, encode_shape
+from apps.slide_viewer.models import Annotation, AnnotationShape
+from apps.slide_viewer.simplify import apply_level
+from .facets import get_facets, get_visibility_scope
+from .filters import SlideFilter
+from .serializers import SlideSerializer, SlideListSerializer, FolderSerializer
+from .trees import get_tree, get_tree_etag, tree_response
 from ..models import Slide, Folder
 
 logger = logging.getLogger("django")
 
+# A viewport showing more shapes than this is zoomed out too far to draw them.
+MAX_VIEWPORT_SHAPES = 5000
+
 
 class FolderViewSet(viewsets.ModelViewSet):
     serializer_class = FolderSerializer
     permission_classes = [IsAuthenticated, DjangoModelPermissions]
 
     def get_queryset(self):
-        return Folder.objects.viewable(self.request.user)
+        return Folder.objects.viewable(self.request.user).select_related("author")
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
@@ -72,18 +87,26 @@ class FolderViewSet(viewsets.ModelViewSet):
         if not request.user.has_perm("database.view_folder"):
             raise PermissionDenied("You don't have permission to view folders.")
 
-        root_folders = self.get_queryset().filter(parent=None)
-        tree = [self._get_tree_structure(folder) for folder in root_folders]
-
-        if request.user.is_admin():
-            tree = [
-                {
-                    "id": None,
-                    "name": "Root",
-                    "subfolders": tree,
-                }
-            ]
-        return Response(tree)
+        is_admin = request.user.is_admin()
+        root_ids = list(
+            self.get_queryset().filter(parent=None).values_list("id", flat=True)
+        )
+        (version,) = get_versions(["folder-tree"])
+
+        def get_tree_data():
+            tree = get_tree(Folder, "folder-tree", root_ids)
+            if is_admin:
+                tree = [
+                    {
+                        "id": None,
+                        "name": "Root",
+                        "subfolders": tree,
+                    }
+                ]
+            return tree
+
+        etag = get_tree_etag(version, is_admin, *root_ids)
+        return tree_response(request, etag, get_tree_data)
 
     @action(detail=True, methods=["get"])
     def items(self, request, pk):
@@ -96,7 +119,7 @@ class FolderViewSet(viewsets.ModelViewSet):
         return Response(
             {
                 "subfolders": FolderSerializer(subfolders, many=True).data,
-                "slides": SlideSerializer(slides, many=True).data,
+                "slides": SlideListSerializer().serialize(slides),
             }
         )
 
@@ -104,22 +127,25 @@ class FolderViewSet(viewsets.ModelViewSet):
         if not folder.user_can_edit(self.request.user):
             raise PermissionDenied("You don't have permission to edit this folder.")
 
-    def _get_tree_structure(self, folder):
-        return {
-            "id": folder.id,
-            "name": folder.name,
-            "subfolders": [
-                self._get_tree_structure(sub) for sub in folder.subfolders.all()
-            ],
-        }
-
 
 class SlideViewSet(viewsets.ModelViewSet):
     serializer_class = SlideSerializer
     permission_classes = [IsAuthenticated, DjangoModelPermissions]
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_class = SlideFilter
+    ordering_fields = [
+        "name",
+        "created_at",
+        "updated_at",
+        "vendor",
+        "width",
+        "height",
+        "objective_power",
+        "file_size",
+    ]
 
     def get_queryset(self):
-        return Slide.objects.viewable(self.request.user)
+        return Slide.objects.viewable(self.request.user).select_related("author")
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
@@ -158,16 +184,97 @@ class SlideViewSet(viewsets.ModelViewSet):
         )
         return Response(data)
 
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = SlideListSerializer(self.get_serializer_context())
+        # the paginator reads the sort key from the rows
+        ordering = self.paginator.get_ordering(request, queryset, self)
+        rows = serializer.get_rows(queryset, *(name.lstrip("-") for name in ordering))
+        page = self.paginate_queryset(rows)
+        return self.get_paginated_response(serializer.to_representation(page))
+
+    @action(detail=False, methods=["get"])
+    def facets(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        filters = {
+            name: ",".join(request.query_params.getlist(name))
+            for name in SlideFilter.base_filters
+            if name in request.query_params
+        }
+        scope = get_visibility_scope(request.user)
+        return Response(get_facets(queryset, scope, filters))
+
     @action(detail=True, methods=["get"])
     def annotations(self, request, pk):
-        if not request.user.has_perm("database.view_annotation"):
+        if not request.user.has_perm("slide_viewer.view_annotation"):
             raise PermissionDenied(
                 "You don't have permission to view slide annotations."
             )
 
+        slide = self.get_object()
+        annotations = Annotation.objects.viewable_by_slide(
+            request.user, slide
+        ).select_related("author")
+        context = {
+            "level": get_level_param(request),
+            "compact": get_encoding_param(request),
+        }
+        serializer = AnnotationSerializer(annotations, many=True, context=context)
+        return Response(serializer.data)
+
+    @action(detail=True, methods=["get"])
+    def shapes(self, request, pk):
+        """
+        Get the annotation shapes intersecting a viewport.
+
+        ``bbox`` is ``min_x,min_y,max_x,max_y`` in the coordinates of the
+        shapes' points, ``annotation`` optionally limits the shapes to one
+        annotation, ``scale`` picks a level of detail and ``encoding=compact``
+        encodes the points. At most MAX_VIEWPORT_SHAPES shapes are returned,
+        and ``truncated`` tells whether there were more.
+        """
+        if not request.user.has_perm("slide_viewer.view_annotation"):
+            raise PermissionDenied(
+                "You don't have permission to view slide annotations."
+            )
+
+        try:
+            min_x, min_y, max_x, max_y = map(
+                float, request.query_params.get("bbox", "").split(",")
+            )
+        except ValueError:
+            raise ValidationError({"bbox": "Expected min_x,min_y,max_x,max_y."})
+
+        level = get_level_param(request)
+        compact = get_encoding_param(request)
         slide = self.get_object()
         annotations = Annotation.objects.viewable_by_slide(request.user, slide)
-        return Response(AnnotationSerializer(annotations, many=True).data)
+        if "annotation" in request.query_params:
+            try:
+                annotation_id = int(request.query_params["annotation"])
+            except ValueError:
+                raise ValidationError({"annotation": "Expected an annotation id."})
+            annotations = annotations.filter(pk=annotation_id)
+
+        shapes = AnnotationShape.objects.intersecting(slide, min_x, min_y, max_x, max_y)
+        shapes = shapes.filter(annotation__in=annotations)
+        columns = ["annotation_id", "data"]
+        if level is not None:
+            columns.append(f"levels__{level}")
+        rows = list(shapes.values_list(*columns)[: MAX_VIEWPORT_SHAPES + 1])
+
+        results = []
+        for annotation, data, *points in rows[:MAX_VIEWPORT_SHAPES]:
+            if points:
+                data = apply_level(data, points[0])
+            data = encode_shape(data) if compact else decode_shape(data)
+            results.append({**data, "annotation": annotation})
+        return Response(
+            {
+                "results": results,
+                "truncated": len(rows) > MAX_VIEWPORT_SHAPES,
+            }
+        )
 
     @action(detail=True, methods=["get"])
     def thumbnail(self, request, pk):
@@ -205,13 +312,12 @@ class DZIView(APIView):
         slide = get_object_or_404(Slide, id=pk)
         _check_slide_view_permission(request.user, slide)
 
-        path = slide.get_dzi_path()
-
-        if not os.path.exists(path):
-            logger.error(f"DZI file not found: {path}")
+        dzi = slide.get_dzi()
+        if dzi is None:
+            logger.error(f"DZI file not found: {slide.get_dzi_path()}")
             return Response({"error": "DZI file not found"}, status=404)
 
-        return FileResponse(open(path, "rb"), content_type="application/xml")
+        return HttpResponse(dzi, content_type="application/xml")
 
 
 class TileView(APIView):
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from openslide import OpenSlide
+
+from apps.database.models import Slide
+
+
+class Command(BaseCommand):
+    help = (
+        "Read the OpenSlide properties of slides ingested before they were "
+        "stored, and fill the metadata columns."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Also read slides whose properties are already stored.",
+        )
+
+    def handle(self, *args, **options):
+        slides = Slide.objects.all()
+        if not options["all"]:
+            slides = slides.filter(properties__isnull=True)
+
+        updated = failed = 0
+        for slide in slides.iterator():
+            try:
+                with OpenSlide(slide.file.path) as openslide:
+                    slide._save_metadata(openslide)
+                updated += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"Slide {slide.name} (id={slide.id}): {e}")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Updated {updated} slides, {failed} failed.")
+        )
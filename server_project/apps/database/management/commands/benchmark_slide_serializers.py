@@ -0,0 +1,77 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from apps.database.api.serializers import SlideListSerializer, SlideSerializer
+from apps.database.models import Slide
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure how many slides per second SlideSerializer and "
+        "SlideListSerializer turn into list responses."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--generate",
+            type=int,
+            default=0,
+            help="Add this many throwaway slides first. They are rolled back "
+            "when the benchmark ends.",
+        )
+        parser.add_argument("--limit", type=int, help="Serialize at most this many.")
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options["generate"]:
+                    Slide.objects.bulk_create(
+                        Slide(name=f"Benchmark {i}", file=f"slides/benchmark_{i}.svs")
+                        for i in range(options["generate"])
+                    )
+                self.benchmark(options["limit"], options["repeat"])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def benchmark(self, limit, repeat):
+        queryset = Slide.objects.select_related("author")[:limit]
+        rows = queryset.count()
+        if not rows:
+            raise CommandError("No slides to serialize. Pass --generate.")
+
+        request = Request(
+            APIRequestFactory().get("/api/database/slides/", HTTP_HOST="localhost")
+        )
+        context = {"request": request}
+
+        def serialize_instances():
+            return SlideSerializer(queryset, many=True, context=context).data
+
+        def serialize_rows():
+            return SlideListSerializer(context).serialize(queryset)
+
+        before = self.measure(serialize_instances, rows, repeat)
+        after = self.measure(serialize_rows, rows, repeat)
+        self.stdout.write(f"SlideSerializer:     {before:>10,.0f} rows/s")
+        self.stdout.write(f"SlideListSerializer: {after:>10,.0f} rows/s")
+        self.stdout.write(
+            self.style.SUCCESS(f"{after / before:.1f}x faster over {rows} slides.")
+        )
+
+    def measure(self, serialize, rows, repeat):
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            serialize()
+            best = min(best, time.perf_counter() - started)
+        return rows / best
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.database.models import Folder
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the materialized path and base folder of every folder, "
+        "e.g. after adding the columns to an existing database."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = Folder.objects.rebuild_paths()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt paths of {count} folders."))
@@ -0,0 +1,68 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.database.models import Slide
+from apps.database.trash import collector, get_size, get_trash_directory, move_to_trash
+
+IMAGES_DIRECTORY = "images"
+
+
+class Command(BaseCommand):
+    help = (
+        "Report image directories without a matching slide and what is left "
+        "in the trash, and with --reclaim, move the orphans to the trash and "
+        "empty it at the throttled rate of settings.TRASH."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reclaim",
+            action="store_true",
+            help="Remove the orphaned directories and the trash.",
+        )
+
+    def handle(self, *args, **options):
+        orphans = self.get_orphans()
+        trash_directory = get_trash_directory()
+        trash = []
+        if os.path.isdir(trash_directory):
+            trash = sorted(
+                os.path.join(trash_directory, entry)
+                for entry in os.listdir(trash_directory)
+            )
+
+        for label, paths in (("Orphaned", orphans), ("Trashed", trash)):
+            files = size = 0
+            for path in paths:
+                path_files, path_size = get_size(path)
+                files += path_files
+                size += path_size
+                self.stdout.write(
+                    f"{path}: {path_files} files, {path_size / 1e6:.1f} MB"
+                )
+            self.stdout.write(
+                f"{label}: {len(paths)} directories, {files} files, "
+                f"{size / 1e6:.1f} MB"
+            )
+
+        if options["reclaim"]:
+            for path in orphans:
+                move_to_trash(path, collect=False)
+            removed = collector.collect()
+            self.stdout.write(self.style.SUCCESS(f"Removed {removed} files."))
+
+    def get_orphans(self):
+        images_directory = os.path.join(settings.MEDIA_ROOT, IMAGES_DIRECTORY)
+        if not os.path.isdir(images_directory):
+            return []
+        image_roots = set(Slide.objects.values_list("image_root", flat=True))
+        # slides just created, whose image_root isn't saved yet
+        pks = {str(pk) for pk in Slide.objects.values_list("pk", flat=True)}
+        return sorted(
+            os.path.join(images_directory, entry)
+            for entry in os.listdir(images_directory)
+            if os.path.join(IMAGES_DIRECTORY, entry) not in image_roots
+            and entry not in pks
+        )
@@ -0,0 +1,90 @@
+# Generated by Django 5.1.15 on 2026-10-19 02:04
+
+import django.db.models.deletion
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def fill_folder_paths(apps, schema_editor):
+    # the same walk as FolderManager.rebuild_paths, on the historical model
+    Folder = apps.get_model("database", "Folder")
+    children = defaultdict(list)
+    for pk, parent_id in Folder.objects.order_by().values_list("id", "parent_id"):
+        children[parent_id].append(pk)
+
+    folders = []
+    stack = [(pk, f"{pk}/", pk) for pk in children[None]]
+    while stack:
+        pk, path, base_folder_id = stack.pop()
+        folders.append(Folder(id=pk, path=path, base_folder_id=base_folder_id))
+        stack.extend(
+            (child, f"{path}{child}/", base_folder_id) for child in children[pk]
+        )
+    Folder.objects.bulk_update(folders, ["path", "base_folder"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='folder',
+            name='base_folder',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='database.folder'),
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text="Ids from the base folder down to this folder, like '1/4/9/'.", max_length=255),
+        ),
+        migrations.AddField(
+            model_name='slide',
+            name='file_size',
+            field=models.BigIntegerField(db_index=True, default=0, help_text='Size of the slide file in bytes.'),
+        ),
+        migrations.AddField(
+            model_name='slide',
+            name='height',
+            field=models.PositiveIntegerField(default=0, help_text='Height of the full resolution level in pixels, 0 if unknown.'),
+        ),
+        migrations.AddField(
+            model_name='slide',
+            name='level_count',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='slide',
+            name='mpp_x',
+            field=models.FloatField(blank=True, help_text='Microns per pixel.', null=True),
+        ),
+        migrations.AddField(
+            model_name='slide',
+            name='mpp_y',
+            field=models.FloatField(blank=True, help_text='Microns per pixel.', null=True),
+        ),
+        migrations.AddField(
+            model_name='slide',
+            name='objective_power',
+            field=models.FloatField(db_index=True, default=0, help_text='Magnification of the scan, 0 if unknown.'),
+        ),
+        migrations.AddField(
+            model_name='slide',
+            name='properties',
+            field=models.JSONField(blank=True, help_text='All OpenSlide properties of the slide file.', null=True),
+        ),
+        migrations.AddField(
+            model_name='slide',
+            name='vendor',
+            field=models.CharField(blank=True, db_index=True, help_text='Format vendor detected by OpenSlide, e.g. aperio or hamamatsu.', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='slide',
+            name='width',
+            field=models.PositiveIntegerField(default=0, help_text='Width of the full resolution level in pixels, 0 if unknown.'),
+        ),
+        migrations.RunPython(fill_folder_paths, migrations.RunPython.noop),
+    ]
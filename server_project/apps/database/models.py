@@ -1,11 +1,18 @@
 import os
-import shutil
+from collections import defaultdict
 
 from django.conf import settings
+from django.contrib.auth.models import Group
 from django.db import models
-from openslide import OpenSlide
+from django.db.models import Q, Value
+from django.db.models.functions import Concat, Substr
+from openslide import PROPERTY_NAME_OBJECTIVE_POWER, PROPERTY_NAME_VENDOR, OpenSlide
 from openslide.deepzoom import DeepZoomGenerator
 
+from apps.caching.cache import get_or_set, invalidate
+from apps.lectures.models import LectureContent
+from .trash import move_to_trash
+
 
 class FolderManager(models.Manager):
     def base_folders(self):
@@ -19,19 +26,36 @@ class FolderManager(models.Manager):
     def editable(self, user):
         if user.is_admin():
             return self.all()
-        folders = self.editable_base_folders(user)
-        for folder in self.editable_base_folders(user):
-            folders |= self.descendents(folder)
-        return folders
+        return self.filter(base_folder__groupprofile__group__in=user.groups.all())
 
     def viewable(self, user):
         return self.all()
 
     def descendents(self, folder):
-        folders = folder.subfolders.all()
-        for subfolder in folder.subfolders.all():
-            folders |= self.descendents(subfolder)
-        return folders
+        return self.filter(path__startswith=folder.path).exclude(pk=folder.pk)
+
+    def ancestors(self, folder):
+        return self.filter(pk__in=folder.get_ancestor_ids())
+
+    def rebuild_paths(self):
+        """Recompute the materialized paths and base folders of every folder"""
+        children = defaultdict(list)
+        for pk, parent_id in self.order_by().values_list("id", "parent_id"):
+            children[parent_id].append(pk)
+
+        folders = []
+        stack = [(pk, f"{pk}/", pk) for pk in children[None]]
+        while stack:
+            pk, path, base_folder_id = stack.pop()
+            folders.append(Folder(id=pk, path=path, base_folder_id=base_folder_id))
+            stack.extend(
+                (child, f"{path}{child}/", base_folder_id) for child in children[pk]
+            )
+        self.bulk_update(folders, ["path", "base_folder"], batch_size=500)
+        # bulk_update() sends no signals, and base folders decide who can
+        # view private slides
+        invalidate("slide-facets")
+        return len(folders)
 
 
 class Folder(models.Model):
@@ -55,6 +79,21 @@ class Folder(models.Model):
         blank=True,
         null=True,
     )
+    path = models.CharField(
+        max_length=255,
+        blank=True,
+        db_index=True,
+        editable=False,
+        help_text="Ids from the base folder down to this folder, like '1/4/9/'.",
+    )
+    base_folder = models.ForeignKey(
+        "self",
+        on_delete=models.CASCADE,
+        related_name="+",
+        blank=True,
+        null=True,
+        editable=False,
+    )
 
     objects = FolderManager()
 
@@ -66,9 +105,26 @@ class Folder(models.Model):
         return self.get_full_path()
 
     def save(self, *args, **kwargs):
+        old = None
+        if self.pk:
+            old = Folder.objects.filter(pk=self.pk).values("path", "parent_id").first()
+        moved = not old or not old["path"] or old["parent_id"] != self.parent_id
+
+        if moved and old and self.parent_id:
+            if Folder.objects.filter(
+                pk=self.parent_id, path__startswith=old["path"]
+            ).exists():
+                raise Exception("Folder can't be moved into its own subfolder.")
+
         super().save(*args, **kwargs)
-        for slide in self.get_all_slides():
-            slide.update_lectures()
+        if moved:
+            self._update_path(old["path"] if old else None)
+
+        if moved and old:
+            # the subtree may now belong to another group
+            LectureContent.objects.invalid().filter(
+                slide__folder__path__startswith=self.path
+            ).delete()
 
     def delete(self, *args, **kwargs):
         if not self.is_empty():
@@ -76,9 +132,14 @@ class Folder(models.Model):
         super().delete(*args, **kwargs)
 
     def get_full_path(self):
-        if self.parent:
-            return f"{self.parent.get_full_path()}/{self.name}"
-        return self.name
+        if not self.parent_id:
+            return self.name
+        names = dict(Folder.objects.ancestors(self).values_list("id", "name"))
+        return "/".join([names[pk] for pk in self.get_ancestor_ids()] + [self.name])
+
+    def get_ancestor_ids(self):
+        """Get the ids of the ancestors, from the base folder down to the parent"""
+        return [int(pk) for pk in self.path.split("/")[:-2]]
 
     def is_base_folder(self):
         """Check if this folder is a base folder"""
@@ -86,46 +147,58 @@ class Folder(models.Model):
 
     def get_base_folder(self):
         """Get the root folder of this folder's hierarchy"""
-        current_folder = self
-        while current_folder.parent:
-            current_folder = current_folder.parent
-        return current_folder
+        if self.base_folder_id == self.pk:
+            return self
+        return self.base_folder
 
     def get_group(self):
         """Get the group of this folder"""
-        return self.get_base_folder().groupprofile.group
+        return Group.objects.get(profile__base_folder=self.base_folder_id)
 
     def user_can_edit(self, user):
         """Check if the user can edit this folder"""
         if user.is_admin():
             return True
-        return self.get_group() in user.groups.all()
+        return user.groups.filter(profile__base_folder=self.base_folder_id).exists()
 
     def get_all_slides(self, recursive=False):
         """Get all slides in this folder and its subfolders"""
-        slides = list(self.slides.all())
         if recursive:
-            for subfolder in self.subfolders.all():
-                slides.extend(subfolder.get_all_slides(recursive=True))
-        return slides
+            return list(Slide.objects.filter(folder__path__startswith=self.path))
+        return list(self.slides.all())
 
     def is_empty(self):
         """Check if the folder and the subfolders don't have slides"""
-        if self.slides.exists():
-            return False
-        for subfolder in self.subfolders.all():
-            if not subfolder.is_empty():
-                return False
-        return True
+        return not Slide.objects.filter(folder__path__startswith=self.path).exists()
 
     def is_children(self, folder):
         """Check if the folder is a subfolder of this folder"""
-        current_folder = folder.parent
-        while current_folder:
-            if current_folder == self:
-                return True
-            current_folder = current_folder.parent
-        return False
+        return folder.pk != self.pk and folder.path.startswith(self.path)
+
+    def _update_path(self, old_path):
+        """Set the materialized path and base folder, and move the subtree along"""
+        if self.parent_id:
+            parent = Folder.objects.values("path", "base_folder_id").get(
+                pk=self.parent_id
+            )
+            path = f"{parent['path']}{self.pk}/"
+            base_folder_id = parent["base_folder_id"]
+        else:
+            path = f"{self.pk}/"
+            base_folder_id = self.pk
+
+        Folder.objects.filter(pk=self.pk).update(
+            path=path, base_folder_id=base_folder_id
+        )
+        if old_path:
+            Folder.objects.filter(path__startswith=old_path).exclude(
+                pk=self.pk
+            ).update(
+                path=Concat(Value(path), Substr("path", len(old_path) + 1)),
+                base_folder_id=base_folder_id,
+            )
+        self.path = path
+        self.base_folder_id = base_folder_id
 
 
 class SlideManager(models.Manager):
@@ -149,19 +222,18 @@ class SlideManager(models.Manager):
         """Get slides that are accessible to the user"""
         if user.is_admin():
             return self.all()
-        slides = self.none()
-        for folder in Folder.objects.editable(user):
-            slides |= folder.slides
-        return slides
+        return self.filter(_editable_by(user))
 
     def viewable(self, user):
         """Get slides that are accessible to the user"""
         if user.is_admin():
             return self.all()
-        slides = self.root_slides().filter(is_public=True)
-        for folder in Folder.objects.viewable(user):
-            slides |= self.viewable_by_folder(user, folder)
-        return slides
+        return self.filter(Q(is_public=True) | _editable_by(user))
+
+
+def _editable_by(user):
+    """Condition on slides whose folder belongs to one of the user's groups"""
+    return Q(folder__base_folder__groupprofile__group__in=user.groups.all())
 
 
 class Slide(models.Model):
@@ -185,6 +257,38 @@ class Slide(models.Model):
         help_text="Relative path to the image directory.",
     )
     metadata = models.JSONField(blank=True, null=True)
+    properties = models.JSONField(
+        blank=True,
+        null=True,
+        help_text="All OpenSlide properties of the slide file.",
+    )
+    vendor = models.CharField(
+        max_length=50,
+        blank=True,
+        db_index=True,
+        help_text="Format vendor detected by OpenSlide, e.g. aperio or hamamatsu.",
+    )
+    width = models.PositiveIntegerField(
+        default=0,
+        help_text="Width of the full resolution level in pixels, 0 if unknown.",
+    )
+    height = models.PositiveIntegerField(
+        default=0,
+        help_text="Height of the full resolution level in pixels, 0 if unknown.",
+    )
+    level_count = models.PositiveSmallIntegerField(default=0)
+    objective_power = models.FloatField(
+        default=0,
+        db_index=True,
+        help_text="Magnification of the scan, 0 if unknown.",
+    )
+    mpp_x = models.FloatField(blank=True, null=True, help_text="Microns per pixel.")
+    mpp_y = models.FloatField(blank=True, null=True, help_text="Microns per pixel.")
+    file_size = models.BigIntegerField(
+        default=0,
+        db_index=True,
+        help_text="Size of the slide file in bytes.",
+    )
     is_public = models.BooleanField(
         default=False,
         help_text="Whether the slide is public or not.",
@@ -241,13 +345,18 @@ class Slide(models.Model):
 
             self.update_lectures()
 
+            # image_root and metadata are written with update(), which sends
+            # no signal, so drop what was cached while the slide was processed
+            invalidate(f"slide:{self.pk}")
+
         except Exception as e:
             raise Exception(f"Failed to save slide: {str(e)}")
 
     def delete(self, *args, **kwargs):
         try:
             self.file.delete(False)
-            self._delete_directory(self.get_image_directory())
+            if self.image_root:
+                self._delete_directory(self.get_image_directory())
             super().delete(*args, **kwargs)
         except Exception as e:
             raise Exception(f"Failed to delete slide: {str(e)}")
@@ -327,6 +436,8 @@ class Slide(models.Model):
                 if not status["metadata_valid"]:
                     self._save_metadata(slide)
 
+            # the files and the update() above send no post_save
+            invalidate(f"slide:{self.pk}")
             return self.check_integrity()
 
         except Exception as e:
@@ -335,9 +446,8 @@ class Slide(models.Model):
             )
 
     def update_lectures(self):
-        for lecture_content in self.lecture_contents.all():
-            if not self.user_can_view(lecture_content.lecture.author):
-                lecture_content.delete()
+        """Remove the slide from lectures whose author can't view it anymore"""
+        LectureContent.objects.invalid().filter(slide=self).delete()
 
     def get_group(self):
         """Get the group of this slide"""
@@ -365,6 +475,12 @@ class Slide(models.Model):
         """Get the path to the DZI file"""
         return os.path.join(settings.MEDIA_ROOT, self.image_root, "image.dzi")
 
+    def get_dzi(self):
+        """Get the content of the DZI file, cached, or None if it doesn't exist"""
+        return get_or_set(
+            [f"slide:{self.pk}"], "dzi", lambda: _read_file(self.get_dzi_path())
+        )
+
     def get_tile_directory(self):
         """Get the path to the tiles directory"""
         return os.path.join(settings.MEDIA_ROOT, self.image_root, "image_files")
@@ -423,15 +539,32 @@ class Slide(models.Model):
         """Extract and save metadata from the slide"""
 
         try:
-            full_metadata = slide.properties
-            metadata = {
-                "mpp-x": float(full_metadata.get("openslide.mpp-x")),
-                "mpp-y": float(full_metadata.get("openslide.mpp-y")),
-                "sourceLens": int(full_metadata.get("hamamatsu.SourceLens")),
-                "created": full_metadata.get("hamamatsu.Created"),
+            properties = dict(slide.properties)
+            mpp_x = _to_number(float, properties.get("openslide.mpp-x"))
+            mpp_y = _to_number(float, properties.get("openslide.mpp-y"))
+            objective_power = properties.get(PROPERTY_NAME_OBJECTIVE_POWER)
+            fields = {
+                "metadata": {
+                    "mpp-x": mpp_x,
+                    "mpp-y": mpp_y,
+                    "sourceLens": _to_number(
+                        int, properties.get("hamamatsu.SourceLens")
+                    ),
+                    "created": properties.get("hamamatsu.Created"),
+                },
+                "properties": properties,
+                "vendor": properties.get(PROPERTY_NAME_VENDOR, ""),
+                "width": slide.dimensions[0],
+                "height": slide.dimensions[1],
+                "level_count": slide.level_count,
+                "objective_power": _to_number(float, objective_power) or 0,
+                "mpp_x": mpp_x,
+                "mpp_y": mpp_y,
+                "file_size": self.file.size,
             }
-            Slide.objects.filter(pk=self.pk).update(metadata=metadata)
-            self.metadata = metadata  # Update instance attribute
+            Slide.objects.filter(pk=self.pk).update(**fields)
+            for name, value in fields.items():  # Update instance attributes
+                setattr(self, name, value)
         except Exception as e:
             raise Exception(f"Failed to save metadata: {str(e)}")
 
@@ -456,7 +589,7 @@ class Slide(models.Model):
     def _verify_metadata(self):
         """Verify metadata is complete"""
 
-        if not self.metadata:
+        if not self.metadata or self.properties is None:
             return False
 
         required_fields = {"mpp-x", "mpp-y", "sourceLens", "created"}
@@ -465,12 +598,28 @@ class Slide(models.Model):
     @staticmethod
     def _delete_directory(image_directory):
         try:
-            if os.path.exists(image_directory):
-                shutil.rmtree(image_directory)
+            # removed in the background, a slide can have hundreds of
+            # thousands of tiles
+            move_to_trash(image_directory)
         except Exception as e:
             raise Exception(f"Failed to delete image directory: {str(e)}")
 
 
+def _read_file(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _to_number(number_type, value):
+    """Convert a slide property, None if it is missing or malformed"""
+    try:
+        return number_type(value)
+    except (TypeError, ValueError):
+        return None
+
+
 class Tag(models.Model):
     id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=100, unique=True)
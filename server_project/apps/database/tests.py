@@ -1,3 +1,1010 @@
+import json
+import os
+import random
+import time
+from collections import Counter
+from io import StringIO
+from itertools import product
+from tempfile import TemporaryDirectory
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from apps.accounts.models import GroupProfile, User
+from apps.lectures.models import Lecture, LectureContent
+from apps.slide_viewer.models import Annotation
+from .api.pagination import CursorPagination
+from .api.serializers import SlideListSerializer, SlideSerializer
+from .api.views import SlideViewSet
+from .models import Folder, Slide, Tag
+from .trash import collector, get_trash_directory, move_to_trash
+
+
+class LargeDatasetTestCase(TestCase):
+    """
+    Base class generating a department-sized data set once per test class.
+
+    Every publisher group gets a folder tree ``FOLDER_DEPTH`` levels deep
+    below its base folder. Slides, annotations and lectures are spread over
+    it with a fixed seed, so query counts are reproducible.
+    """
+
+    PUBLISHER_GROUPS = 4
+    FOLDER_DEPTH = 4
+    FOLDER_BRANCHING = 3
+    SLIDES = 2000
+    TAGS = 20
+    ANNOTATIONS = 2000
+    LECTURES = 200
+    LECTURE_CONTENTS = 5
+
+    # Upper bounds per request. They don't depend on the data set size, so
+    # a query per row or per folder makes the tests fail.
+    MAX_QUERIES = 15
+    MAX_SECONDS = 2.0
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(0)
+
+        cls.admin = User.objects.create_superuser("admin", "Admin", "User")
+
+        cls.publisher_groups = []
+        for i in range(cls.PUBLISHER_GROUPS):
+            group = Group.objects.create(name=f"publisher {i}")
+            GroupProfile.objects.create(
+                group=group, type=GroupProfile.TypeChoices.PUBLISHER
+            )
+            cls.publisher_groups.append(group)
+        cls.publisher = User.objects.create_user("publisher", "Pub", "Lisher")
+        cls.publisher.groups.add(cls.publisher_groups[0])
+        cls.publisher.save()  # creates the base lecture folder
+
+        viewer_group = Group.objects.create(name="viewer")
+        GroupProfile.objects.create(
+            group=viewer_group, type=GroupProfile.TypeChoices.VIEWER
+        )
+        cls.viewer = User.objects.create_user("viewer", "View", "Er")
+        cls.viewer.groups.add(viewer_group)
+
+        folders = []
+        for group in cls.publisher_groups:
+            level = [group.profile.base_folder]
+            folders.extend(level)
+            for depth in range(cls.FOLDER_DEPTH):
+                level = [
+                    Folder.objects.create(
+                        name=f"Folder {depth}-{i}", parent=parent, author=cls.admin
+                    )
+                    for parent in level
+                    for i in range(cls.FOLDER_BRANCHING)
+                ]
+                folders.extend(level)
+        cls.deepest_folder = folders[-1]
+
+        authors = [cls.admin, cls.publisher]
+        slides = Slide.objects.bulk_create(
+            Slide(
+                name=f"Slide {i}",
+                file=f"slides/slide_{i}.svs",
+                image_root=f"images/{i}",
+                information="Generated slide",
+                metadata={"mpp-x": 0.25, "mpp-y": 0.25, "sourceLens": 40},
+                is_public=rng.random() < 0.5,
+                author=rng.choice(authors),
+                folder=rng.choice(folders + [None]),
+            )
+            for i in range(cls.SLIDES)
+        )
+        Slide.objects.bulk_create(
+            Slide(
+                name=f"Slide in deepest folder {i}",
+                file=f"slides/deep_{i}.svs",
+                is_public=bool(i % 2),
+                folder=cls.deepest_folder,
+            )
+            for i in range(20)
+        )
+
+        tags = Tag.objects.bulk_create(Tag(name=f"Tag {i}") for i in range(cls.TAGS))
+        Tag.slides.through.objects.bulk_create(
+            Tag.slides.through(tag_id=tag.id, slide_id=slide.id)
+            for slide in slides
+            for tag in rng.sample(tags, 2)
+        )
+
+        Annotation.objects.bulk_create(
+            Annotation(
+                name=f"Annotation {i}",
+                description="Generated annotation",
+                data=[{"type": "point", "points": [[i, i]]}],
+                author=rng.choice(authors + [cls.viewer]),
+                slide=rng.choice(slides),
+            )
+            for i in range(cls.ANNOTATIONS)
+        )
+
+        lecture_folder = cls.publisher.base_lecture_folder
+        lectures = Lecture.objects.bulk_create(
+            Lecture(
+                name=f"Lecture {i}",
+                description="Generated lecture",
+                author=cls.publisher,
+                folder=lecture_folder,
+                is_active=rng.random() < 0.7,
+            )
+            for i in range(cls.LECTURES)
+        )
+        Lecture.groups.through.objects.bulk_create(
+            Lecture.groups.through(lecture_id=lecture.id, group_id=viewer_group.id)
+            for lecture in lectures
+        )
+        public_slides = [slide for slide in slides if slide.is_public]
+        LectureContent.objects.bulk_create(
+            LectureContent(lecture=lecture, order=order, slide=slide)
+            for lecture in lectures
+            for order, slide in enumerate(
+                rng.sample(public_slides, cls.LECTURE_CONTENTS), start=1
+            )
+        )
+
+    def setUp(self):
+        # cached values would outlive the rolled back data of earlier tests
+        cache.clear()
+
+    def assertBoundedRequest(self, user, url, max_queries=None, status_code=200):
+        """Request ``url`` as ``user`` and check its query count and duration."""
+        max_queries = max_queries or self.MAX_QUERIES
+        self.client.force_login(user)
+
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = self.client.get(url)
+            elapsed = time.perf_counter() - started
+
+        self.assertEqual(response.status_code, status_code)
+        self.assertLessEqual(
+            len(queries),
+            max_queries,
+            f"{url} took {len(queries)} queries for {user.username}",
+        )
+        self.assertLess(
+            elapsed, self.MAX_SECONDS, f"{url} took {elapsed:.2f}s for {user.username}"
+        )
+        return response
+
+
+class FolderQueryCountTests(LargeDatasetTestCase):
+    def test_folder_tree_admin(self):
+        self.assertBoundedRequest(self.admin, reverse("api:folder-tree"))
+
+    def test_folder_tree_publisher(self):
+        self.assertBoundedRequest(self.publisher, reverse("api:folder-tree"))
+
+    def test_folder_list_admin(self):
+        self.assertBoundedRequest(self.admin, reverse("api:folder-list"))
+
+    def test_folder_list_publisher(self):
+        self.assertBoundedRequest(self.publisher, reverse("api:folder-list"))
+
+    def test_folder_items_admin(self):
+        url = reverse("api:folder-items", kwargs={"pk": self.deepest_folder.pk})
+        self.assertBoundedRequest(self.admin, url)
+
+    def test_folder_items_publisher(self):
+        url = reverse("api:folder-items", kwargs={"pk": self.deepest_folder.pk})
+        self.assertBoundedRequest(self.publisher, url)
+
+
+class FolderTreeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "Admin", "User")
+        groups = []
+        for name in ("pathology", "anatomy"):
+            group = Group.objects.create(name=name)
+            GroupProfile.objects.create(
+                group=group, type=GroupProfile.TypeChoices.PUBLISHER
+            )
+            groups.append(group)
+        cls.publisher = User.objects.create_user("pathologist", "Patho", "Logist")
+        cls.publisher.groups.add(groups[0])
+
+        base = groups[0].profile.base_folder
+        liver = Folder.objects.create(name="Liver", parent=base)
+        Folder.objects.create(name="Cirrhosis", parent=liver)
+        cls.kidney = Folder.objects.create(name="Kidney", parent=base)
+        Folder.objects.create(name="Skull", parent=groups[1].profile.base_folder)
+
+    def setUp(self):
+        cache.clear()
+
+    def subtree(self, folder):
+        return {
+            "id": folder.id,
+            "name": folder.name,
+            "subfolders": [self.subtree(sub) for sub in folder.subfolders.all()],
+        }
+
+    def test_tree_matches_folder_hierarchy(self):
+        self.client.force_login(self.publisher)
+        response = self.client.get(reverse("api:folder-tree"))
+
+        expected = [self.subtree(folder) for folder in Folder.objects.base_folders()]
+        self.assertEqual(response.json(), expected)
+
+    def test_unchanged_tree_is_not_modified(self):
+        self.client.force_login(self.publisher)
+        url = reverse("api:folder-tree")
+        etag = self.client.get(url)["ETag"]
+
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_rename_changes_the_tree(self):
+        self.client.force_login(self.publisher)
+        url = reverse("api:folder-tree")
+        etag = self.client.get(url)["ETag"]
+
+        self.kidney.name = "Renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kidney.save()
+
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertIn("Renamed", response.content.decode())
+
+    def test_delete_changes_the_tree(self):
+        self.client.force_login(self.admin)
+        url = reverse("api:folder-tree")
+        etag = self.client.get(url)["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kidney.delete()
+
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+
+
+class SlideQueryCountTests(LargeDatasetTestCase):
+    def test_slide_list_admin(self):
+        self.assertBoundedRequest(self.admin, reverse("api:slide-list"))
+
+    def test_slide_list_publisher(self):
+        self.assertBoundedRequest(self.publisher, reverse("api:slide-list"))
+
+    def test_slide_list_viewer(self):
+        self.assertBoundedRequest(self.viewer, reverse("api:slide-list"))
+
+    def test_slide_detail_viewer(self):
+        slide = Slide.objects.filter(folder=self.deepest_folder, is_public=True)[0]
+        url = reverse("api:slide-detail", kwargs={"pk": slide.pk})
+        self.assertBoundedRequest(self.viewer, url)
+
+    def test_slide_facets_admin(self):
+        self.assertBoundedRequest(self.admin, reverse("api:slide-facets"))
+
+    def test_slide_facets_publisher(self):
+        self.assertBoundedRequest(self.publisher, reverse("api:slide-facets"))
+
+    def test_slide_facets_viewer(self):
+        self.assertBoundedRequest(self.viewer, reverse("api:slide-facets"))
+
+
+class ViewableSlidesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "Admin", "User")
+        groups = []
+        for name in ("pathology", "anatomy"):
+            group = Group.objects.create(name=name)
+            GroupProfile.objects.create(
+                group=group, type=GroupProfile.TypeChoices.PUBLISHER
+            )
+            groups.append(group)
+        cls.publisher = User.objects.create_user("pathologist", "Patho", "Logist")
+        cls.publisher.groups.add(groups[0])
+
+        students = Group.objects.create(name="students")
+        GroupProfile.objects.create(
+            group=students, type=GroupProfile.TypeChoices.VIEWER
+        )
+        cls.viewer = User.objects.create_user("student", "Stu", "Dent")
+        cls.viewer.groups.add(students)
+
+        # a public and a private slide at the root, in the publisher's base
+        # folder, in one of its subfolders and in another group's folder
+        base = groups[0].profile.base_folder
+        folders = [
+            None,
+            base,
+            Folder.objects.create(name="Liver", parent=base),
+            groups[1].profile.base_folder,
+        ]
+        Slide.objects.bulk_create(
+            Slide(
+                name=f"Slide {i}",
+                file=f"slides/{i}.svs",
+                is_public=is_public,
+                folder=folder,
+            )
+            for i, (folder, is_public) in enumerate(product(folders, (True, False)))
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def legacy_viewable(self, user):
+        """The per-folder union that SlideManager.viewable used to build"""
+        if user.is_admin():
+            return Slide.objects.all()
+        slides = Slide.objects.root_slides().filter(is_public=True)
+        for folder in Folder.objects.all():
+            slides |= Slide.objects.viewable_by_folder(user, folder)
+        return slides
+
+    def test_viewable_matches_legacy_semantics(self):
+        for user in (self.admin, self.publisher, self.viewer):
+            with self.subTest(user=user.username):
+                self.assertQuerySetEqual(
+                    Slide.objects.viewable(user),
+                    self.legacy_viewable(user),
+                    ordered=False,
+                )
+
+    def test_viewable_matches_user_can_view(self):
+        for user in (self.admin, self.publisher, self.viewer):
+            with self.subTest(user=user.username):
+                expected = {
+                    slide.pk
+                    for slide in Slide.objects.all()
+                    if slide.user_can_view(user)
+                }
+                viewable = Slide.objects.viewable(user).values_list("pk", flat=True)
+                self.assertEqual(set(viewable), expected)
+
+    def test_editable_matches_user_can_edit(self):
+        for user in (self.admin, self.publisher, self.viewer):
+            with self.subTest(user=user.username):
+                expected = {
+                    slide.pk
+                    for slide in Slide.objects.all()
+                    if slide.user_can_edit(user)
+                }
+                editable = Slide.objects.editable(user).values_list("pk", flat=True)
+                self.assertEqual(set(editable), expected)
+
+    def test_viewable_is_a_single_query(self):
+        with self.assertNumQueries(1):
+            list(Slide.objects.viewable(self.viewer))
+
+
+class SlideListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "Admin", "User")
+        group = Group.objects.create(name="pathology")
+        GroupProfile.objects.create(
+            group=group, type=GroupProfile.TypeChoices.PUBLISHER
+        )
+        students = Group.objects.create(name="students")
+        GroupProfile.objects.create(
+            group=students, type=GroupProfile.TypeChoices.VIEWER
+        )
+        cls.viewer = User.objects.create_user("student", "Stu", "Dent")
+        cls.viewer.groups.add(students)
+
+        Slide.objects.bulk_create(
+            Slide(
+                name=f"Slide {i}",
+                file=f"slides/{i}.svs",
+                metadata={"mpp-x": 0.25, "mpp-y": 0.25, "sourceLens": 40},
+                is_public=i % 3 != 0,
+                folder=group.profile.base_folder,
+            )
+            for i in range(10)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_pages_cover_viewable_slides_once(self):
+        self.client.force_login(self.viewer)
+        url = f"{reverse('api:slide-list')}?page_size=2"
+
+        ids = []
+        while url:
+            page = self.client.get(url).json()
+            ids.extend(slide["id"] for slide in page["results"])
+            url = page["next"]
+
+        viewable = Slide.objects.viewable(self.viewer).values_list("id", flat=True)
+        self.assertEqual(ids, sorted(viewable))
+
+    def test_list_omits_metadata(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("api:slide-list"))
+
+        slide = response.json()["results"][0]
+        self.assertNotIn("metadata", slide)
+        self.assertIn("thumbnail", slide)
+
+    def test_sparse_fieldset(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(
+            reverse("api:slide-list"), {"fields": "id,name,metadata"}
+        )
+
+        slide = response.json()["results"][0]
+        self.assertEqual(set(slide), {"id", "name", "metadata"})
+
+    def test_detail_keeps_metadata(self):
+        self.client.force_login(self.admin)
+        slide = Slide.objects.first()
+        response = self.client.get(reverse("api:slide-detail", kwargs={"pk": slide.pk}))
+
+        self.assertIn("metadata", response.json())
+
+
+class SlideListSerializerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        admin = User.objects.create_superuser("admin", "Admin", "User")
+        group = Group.objects.create(name="pathology")
+        GroupProfile.objects.create(
+            group=group, type=GroupProfile.TypeChoices.PUBLISHER
+        )
+        cls.publisher = User.objects.create_user("pathologist", "Patho", "Logist")
+        cls.publisher.groups.add(group)
+
+        base = group.profile.base_folder
+        liver = Folder.objects.create(name="Liver", parent=base)
+        cirrhosis, hepatitis, _ = Slide.objects.bulk_create(
+            [
+                Slide(
+                    name="Cirrhosis",
+                    file="slides/cirrhosis.svs",
+                    image_root="images/cirrhosis",
+                    information="Nodular liver",
+                    metadata={"mpp-x": 0.25, "mpp-y": 0.25, "sourceLens": 40},
+                    is_public=True,
+                    author=cls.publisher,
+                    folder=liver,
+                ),
+                Slide(
+                    name="Hepatitis",
+                    file="slides/hepatitis.svs",
+                    author=admin,
+                    folder=base,
+                ),
+                # no author or folder
+                Slide(
+                    name="Steatosis",
+                    file="slides/steatosis.svs",
+                    metadata={"openslide.vendor": "aperio"},
+                    is_public=True,
+                ),
+            ]
+        )
+        liver_tag, inflammation = Tag.objects.bulk_create(
+            [Tag(name="Liver"), Tag(name="Inflammation")]
+        )
+        cirrhosis.tags.add(liver_tag, inflammation)
+        hepatitis.tags.add(inflammation)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_context(self, params=None, action="list"):
+        request = Request(APIRequestFactory().get("/", params))
+        return {"request": request, "view": SimpleNamespace(action=action)}
+
+    def assertSameOutput(self, queryset, context):
+        expected = SlideSerializer(queryset, many=True, context=context).data
+        actual = SlideListSerializer(context).serialize(queryset)
+        self.assertEqual(
+            json.loads(json.dumps(actual)), json.loads(json.dumps(expected))
+        )
+
+    def test_parity_without_context(self):
+        self.assertSameOutput(Slide.objects.all(), {})
+
+    def test_parity_in_list_view(self):
+        self.assertSameOutput(Slide.objects.all(), self.get_context())
+
+    def test_parity_in_detail_view(self):
+        context = self.get_context(action="retrieve")
+        self.assertSameOutput(Slide.objects.all(), context)
+
+    def test_parity_with_sparse_fieldset(self):
+        context = self.get_context({"fields": "id,url,author,folder,created_at"})
+        self.assertSameOutput(Slide.objects.all(), context)
+
+    def test_listing_is_a_single_query(self):
+        serializer = SlideListSerializer(self.get_context())
+        with self.assertNumQueries(1):
+            serializer.serialize(Slide.objects.viewable(self.publisher))
+
+
+class SlideFacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        groups = []
+        for name in ("pathology", "anatomy"):
+            group = Group.objects.create(name=name)
+            GroupProfile.objects.create(
+                group=group, type=GroupProfile.TypeChoices.PUBLISHER
+            )
+            groups.append(group)
+        cls.publisher = User.objects.create_user("pathologist", "Patho", "Logist")
+        cls.publisher.groups.add(groups[0])
+
+        students = Group.objects.create(name="students")
+        GroupProfile.objects.create(
+            group=students, type=GroupProfile.TypeChoices.VIEWER
+        )
+        cls.viewer = User.objects.create_user("student", "Stu", "Dent")
+        cls.viewer.groups.add(students)
+
+        cls.base_folder = groups[0].profile.base_folder
+        liver = Folder.objects.create(name="Liver", parent=cls.base_folder)
+        other = groups[1].profile.base_folder
+        kidney, lung, heart = Tag.objects.bulk_create(
+            [Tag(name="Kidney"), Tag(name="Lung"), Tag(name="Heart")]
+        )
+        fixtures = [
+            (None, True, [kidney]),
+            (None, False, [kidney, lung]),
+            (cls.base_folder, True, [kidney, lung]),
+            (cls.base_folder, False, [lung, heart]),
+            (liver, True, [heart]),
+            (liver, False, [kidney, lung, heart]),
+            (other, True, [lung, heart]),
+            (other, False, [kidney]),
+        ]
+        slides = Slide.objects.bulk_create(
+            Slide(
+                name=f"Slide {i}",
+                file=f"slides/{i}.svs",
+                is_public=is_public,
+                folder=folder,
+            )
+            for i, (folder, is_public, _) in enumerate(fixtures)
+        )
+        for slide, (_, _, tags) in zip(slides, fixtures):
+            slide.tags.add(*tags)
+
+    def setUp(self):
+        cache.clear()
+
+    def list_ids(self, user, **params):
+        self.client.force_login(user)
+        params["page_size"] = 1000
+        response = self.client.get(reverse("api:slide-list"), params)
+        return {slide["id"] for slide in response.json()["results"]}
+
+    def tag_ids(self, slide):
+        return {tag.id for tag in slide.tags.all()}
+
+    def test_filter_by_any_and_all_tags(self):
+        first, second = Tag.objects.all()[:2]
+        slides = Slide.objects.viewable(self.viewer).prefetch_related("tags")
+
+        self.assertEqual(
+            self.list_ids(self.viewer, tags=f"{first.id},{second.id}"),
+            {s.id for s in slides if self.tag_ids(s) & {first.id, second.id}},
+        )
+        self.assertEqual(
+            self.list_ids(self.viewer, tags_all=f"{first.id},{second.id}"),
+            {s.id for s in slides if self.tag_ids(s) >= {first.id, second.id}},
+        )
+
+    def test_filter_by_folder_tree_and_visibility(self):
+        folder = self.base_folder
+        subtree = Folder.objects.descendents(folder) | Folder.objects.filter(
+            pk=folder.pk
+        )
+        expected = Slide.objects.viewable(self.publisher).filter(
+            folder__in=subtree, is_public=False
+        )
+
+        self.assertEqual(
+            self.list_ids(self.publisher, folder_tree=folder.id, is_public=False),
+            set(expected.values_list("id", flat=True)),
+        )
+
+    def test_facets_count_the_filtered_slides(self):
+        tag = Tag.objects.first()
+        slides = Slide.objects.viewable(self.viewer).prefetch_related("tags")
+        slides = [s for s in slides if tag.id in self.tag_ids(s)]
+
+        self.client.force_login(self.viewer)
+        response = self.client.get(reverse("api:slide-facets"), {"tags": tag.id})
+
+        counts = Counter(tag_id for s in slides for tag_id in self.tag_ids(s))
+        facets = response.json()
+        self.assertEqual(facets["count"], len(slides))
+        self.assertEqual(
+            {facet["id"]: facet["count"] for facet in facets["tags"]}, counts
+        )
+
+    def test_facets_are_cached_until_tags_change(self):
+        self.client.force_login(self.viewer)
+        url = reverse("api:slide-facets")
+        first = self.client.get(url).json()
+
+        with CaptureQueriesContext(connection) as cached:
+            self.assertEqual(self.client.get(url).json(), first)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tag = Tag.objects.create(name="Liver")
+            tag.slides.add(Slide.objects.filter(is_public=True).first())
+
+        with CaptureQueriesContext(connection) as counted:
+            facets = self.client.get(url).json()
+        self.assertLess(len(cached), len(counted))
+        self.assertIn({"id": tag.id, "name": "Liver", "count": 1}, facets["tags"])
+
+    def test_facets_are_cached_until_a_tag_is_renamed(self):
+        self.client.force_login(self.viewer)
+        url = reverse("api:slide-facets")
+        tag = Tag.objects.filter(slides__is_public=True).first()
+        self.client.get(url)
+
+        tag.name = "Renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.save()
+
+        facets = self.client.get(url).json()
+        self.assertIn("Renamed", [facet["name"] for facet in facets["tags"]])
+
+
+class SlideMetadataTests(TestCase):
+    GB = 1024**3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "Admin", "User")
+        # pairs of slides share a file size, so orderings need a tiebreaker
+        Slide.objects.bulk_create(
+            Slide(
+                name=f"Slide {i}",
+                file=f"slides/{i}.svs",
+                vendor="aperio" if i % 2 else "hamamatsu",
+                objective_power=40 if i % 3 else 20,
+                file_size=i // 2 * cls.GB,
+            )
+            for i in range(12)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def list_ids(self, **params):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("api:slide-list"), params)
+        return [slide["id"] for slide in response.json()["results"]]
+
+    def test_save_metadata_fills_typed_columns(self):
+        slide = Slide.objects.first()
+        openslide = SimpleNamespace(
+            properties={
+                "openslide.vendor": "aperio",
+                "openslide.objective-power": "20",
+                "openslide.mpp-x": "0.4990",
+                "openslide.mpp-y": "0.4990",
+                "aperio.AppMag": "20",
+            },
+            dimensions=(46000, 32914),
+            level_count=3,
+        )
+
+        with TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            os.makedirs(os.path.join(media_root, "slides"))
+            with open(slide.file.path, "wb") as f:
+                f.write(b"0" * 1000)
+            slide._save_metadata(openslide)
+
+        slide = Slide.objects.get(pk=slide.pk)
+        self.assertEqual(slide.properties, openslide.properties)
+        self.assertEqual(slide.vendor, "aperio")
+        self.assertEqual(slide.width, 46000)
+        self.assertEqual(slide.height, 32914)
+        self.assertEqual(slide.level_count, 3)
+        self.assertEqual(slide.objective_power, 20.0)
+        self.assertEqual(slide.mpp_x, 0.499)
+        self.assertEqual(slide.file_size, 1000)
+        self.assertEqual(slide.metadata["sourceLens"], None)
+
+    def test_filter_by_metadata(self):
+        expected = Slide.objects.filter(
+            vendor="aperio", objective_power=40, file_size__gt=2 * self.GB
+        ).order_by("-file_size")
+
+        ids = self.list_ids(
+            vendor="aperio",
+            objective_power=40,
+            file_size__gte=2 * self.GB + 1,
+            ordering="-file_size",
+        )
+        self.assertEqual(ids, list(expected.values_list("id", flat=True)))
+
+    def test_pages_follow_the_requested_ordering(self):
+        self.client.force_login(self.admin)
+        url = reverse("api:slide-list")
+        params = {"ordering": "file_size", "fields": "id", "page_size": 5}
+
+        ids = []
+        while url:
+            page = self.client.get(url, params).json()
+            ids.extend(slide["id"] for slide in page["results"])
+            url, params = page["next"], None
+
+        expected = Slide.objects.order_by("file_size", "id")
+        self.assertEqual(ids, list(expected.values_list("id", flat=True)))
+
+    def test_orderings_are_broken_by_id(self):
+        pagination = CursorPagination()
+        for ordering, expected in [
+            (None, ("id",)),
+            ("vendor", ("vendor", "id")),
+            ("-vendor,name", ("-vendor", "name", "-id")),
+            ("-file_size", ("-file_size", "-id")),
+        ]:
+            with self.subTest(ordering=ordering):
+                params = {"ordering": ordering} if ordering else {}
+                request = Request(APIRequestFactory().get("/", params))
+                self.assertEqual(
+                    tuple(
+                        pagination.get_ordering(
+                            request, Slide.objects.all(), SlideViewSet()
+                        )
+                    ),
+                    expected,
+                )
+
+    def test_list_omits_properties(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("api:slide-list"))
+        self.assertNotIn("properties", response.json()["results"][0])
+
+
+class DatabaseViewQueryCountTests(LargeDatasetTestCase):
+    def test_database_root_admin(self):
+        self.assertBoundedRequest(self.admin, reverse("database:database"))
+
+    def test_database_root_publisher(self):
+        self.assertBoundedRequest(self.publisher, reverse("database:database"))
+
+    def test_database_deepest_folder_publisher(self):
+        url = f"{reverse('database:database')}?folder={self.deepest_folder.pk}"
+        self.assertBoundedRequest(self.publisher, url)
+
+    def test_database_viewer_forbidden(self):
+        self.assertBoundedRequest(
+            self.viewer, reverse("database:database"), status_code=403
+        )
+
+
+class FolderPathTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.group = Group.objects.create(name="pathology")
+        GroupProfile.objects.create(
+            group=self.group, type=GroupProfile.TypeChoices.PUBLISHER
+        )
+        self.other_group = Group.objects.create(name="anatomy")
+        GroupProfile.objects.create(
+            group=self.other_group, type=GroupProfile.TypeChoices.PUBLISHER
+        )
+        self.base = self.group.profile.base_folder
+        self.child = Folder.objects.create(name="Liver", parent=self.base)
+        self.grandchild = Folder.objects.create(name="Cirrhosis", parent=self.child)
+
+    def test_paths_follow_the_hierarchy(self):
+        self.assertEqual(self.base.path, f"{self.base.pk}/")
+        self.assertEqual(
+            self.grandchild.path,
+            f"{self.base.pk}/{self.child.pk}/{self.grandchild.pk}/",
+        )
+        self.assertEqual(self.grandchild.get_full_path(), "Pathology/Liver/Cirrhosis")
+        self.assertEqual(self.grandchild.get_base_folder(), self.base)
+        self.assertTrue(self.base.is_children(self.grandchild))
+        self.assertFalse(self.grandchild.is_children(self.base))
+        self.assertQuerySetEqual(
+            Folder.objects.descendents(self.base),
+            [self.grandchild, self.child],
+            ordered=False,
+        )
+
+    def test_move_updates_the_subtree(self):
+        other_base = self.other_group.profile.base_folder
+        self.child.parent = other_base
+        self.child.save()
+
+        self.grandchild.refresh_from_db()
+        self.assertEqual(
+            self.grandchild.path,
+            f"{other_base.pk}/{self.child.pk}/{self.grandchild.pk}/",
+        )
+        self.assertEqual(self.grandchild.base_folder, other_base)
+        self.assertEqual(self.grandchild.get_group(), self.other_group)
+
+        user = User.objects.create_user("anatomist", "Ana", "Tomist")
+        user.groups.add(self.other_group)
+        self.assertTrue(self.grandchild.user_can_edit(user))
+        self.assertIn(self.grandchild, Folder.objects.editable(user))
+
+    def test_move_into_own_subfolder_is_rejected(self):
+        self.child.parent = self.grandchild
+        with self.assertRaises(Exception):
+            self.child.save()
+
+        self.child.refresh_from_db()
+        self.assertEqual(self.child.parent, self.base)
+
+    def test_rebuild_paths(self):
+        Folder.objects.update(path="", base_folder=None)
+        Folder.objects.rebuild_paths()
+
+        self.grandchild.refresh_from_db()
+        self.assertEqual(
+            self.grandchild.path,
+            f"{self.base.pk}/{self.child.pk}/{self.grandchild.pk}/",
+        )
+        self.assertEqual(self.grandchild.base_folder, self.base)
+
+
+class FolderSaveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        groups = []
+        for name in ("pathology", "anatomy"):
+            group = Group.objects.create(name=name)
+            GroupProfile.objects.create(
+                group=group, type=GroupProfile.TypeChoices.PUBLISHER
+            )
+            groups.append(group)
+        self.pathology, self.anatomy = groups
+
+        self.publisher = User.objects.create_user("pathologist", "Patho", "Logist")
+        self.publisher.groups.add(self.pathology)
+        self.publisher.save()
+
+        self.folder = Folder.objects.create(
+            name="Liver", parent=self.pathology.profile.base_folder
+        )
+        subfolder = Folder.objects.create(name="Cirrhosis", parent=self.folder)
+        self.private_slide, self.public_slide = Slide.objects.bulk_create(
+            [
+                Slide(name="Private", file="slides/private.svs", folder=subfolder),
+                Slide(
+                    name="Public",
+                    file="slides/public.svs",
+                    folder=subfolder,
+                    is_public=True,
+                ),
+            ]
+        )
+        Slide.objects.bulk_create(
+            Slide(name=f"Slide {i}", file=f"slides/{i}.svs", folder=self.folder)
+            for i in range(500)
+        )
+
+        self.lecture = Lecture.objects.create(
+            name="Liver diseases",
+            author=self.publisher,
+            folder=self.publisher.base_lecture_folder,
+        )
+        LectureContent.objects.create(
+            lecture=self.lecture, order=1, slide=self.private_slide
+        )
+        LectureContent.objects.create(
+            lecture=self.lecture, order=2, slide=self.public_slide
+        )
+
+    def test_rename_doesnt_revalidate_slides(self):
+        self.folder.name = "Hepatology"
+        with self.assertNumQueries(2):
+            self.folder.save()
+
+        self.assertEqual(self.lecture.contents.count(), 2)
+
+    def test_move_removes_slides_the_author_cant_view(self):
+        self.folder.parent = self.anatomy.profile.base_folder
+        self.folder.save()
+
+        self.assertQuerySetEqual(
+            self.lecture.contents.values_list("slide", flat=True),
+            [self.public_slide.pk],
+        )
+
+    def test_move_within_the_group_keeps_lectures(self):
+        other = Folder.objects.create(
+            name="Kidney", parent=self.pathology.profile.base_folder
+        )
+        self.folder.parent = other
+        self.folder.save()
+
+        self.assertEqual(self.lecture.contents.count(), 2)
+
+
+class SlideTrashTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        (cls.slide,) = Slide.objects.bulk_create(
+            [Slide(name="Liver", file="slides/liver.svs", image_root="images/liver")]
+        )
+
+    def setUp(self):
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings = self.settings(MEDIA_ROOT=media_root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.media_root = media_root.name
+
+    def make_image_directory(self, name, tiles=1):
+        directory = os.path.join(self.media_root, "images", name)
+        level_directory = os.path.join(directory, "image_files", "0")
+        os.makedirs(level_directory)
+        for i in range(tiles):
+            with open(os.path.join(level_directory, f"{i}_0.jpeg"), "w"):
+                pass
+        return directory
+
+    def test_trash_is_collected_at_the_throttled_rate(self):
+        directory = self.make_image_directory("1", tiles=300)
+        target = move_to_trash(directory, collect=False)
+        self.assertFalse(os.path.exists(directory))
+        self.assertTrue(os.path.isdir(target))
+
+        with self.settings(TRASH={"FILES_PER_SECOND": 1000}):
+            start = time.perf_counter()
+            self.assertEqual(collector.collect(), 300)
+            self.assertGreaterEqual(time.perf_counter() - start, 0.25)
+        self.assertEqual(os.listdir(get_trash_directory()), [])
+
+    def test_files_removed_by_another_collector_are_not_counted(self):
+        directory = self.make_image_directory("1", tiles=3)
+        move_to_trash(directory, collect=False)
+        unlink = os.unlink
+
+        def unlink_twice(path):
+            if path.endswith("0_0.jpeg"):
+                unlink(path)
+            unlink(path)
+
+        with patch("apps.database.trash.os.unlink", side_effect=unlink_twice):
+            self.assertEqual(collector.collect(), 2)
+        self.assertEqual(os.listdir(get_trash_directory()), [])
+
+    def test_delete_without_image_directory(self):
+        self.slide.image_root = ""
+        self.slide.delete()
+        self.assertTrue(os.path.isdir(self.media_root))
+        self.assertFalse(os.path.exists(get_trash_directory()))
+
+    def test_reclaim_orphaned_image_directories(self):
+        used = self.make_image_directory(os.path.basename(self.slide.image_root))
+        orphan = self.make_image_directory("orphan", tiles=3)
+
+        output = StringIO()
+        call_command("reclaim_image_directories", stdout=output)
+        self.assertIn("Orphaned: 1 directories, 3 files", output.getvalue())
+        self.assertTrue(os.path.isdir(orphan))
 
-# Create your tests here.
+        call_command("reclaim_image_directories", "--reclaim", stdout=StringIO())
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.isdir(used))
+        self.assertEqual(os.listdir(get_trash_directory()), [])
@@ -0,0 +1,139 @@
+"""
+Deferred deletion of slide image directories.
+
+Removing a directory of hundreds of thousands of tiles takes minutes, so a
+directory is renamed into the trash, which is atomic and instant on the
+filesystem of MEDIA_ROOT, and a background thread removes it later, a
+limited number of files per second so that it doesn't starve the tile reads
+of the viewers. Whatever a restart interrupts is collected by the next
+thread, or by ``manage.py reclaim_image_directories``.
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+logger = logging.getLogger("django")
+
+TRASH_DIRECTORY = ".trash"
+BATCH_SIZE = 100  # files removed between pauses
+
+
+def get_trash_directory():
+    return os.path.join(settings.MEDIA_ROOT, TRASH_DIRECTORY)
+
+
+def move_to_trash(path, collect=True):
+    """
+    Move a directory, if it exists, into the trash, and unless ``collect`` is
+    False, wake the collector. Return where it was moved.
+    """
+    trash_directory = get_trash_directory()
+    os.makedirs(trash_directory, exist_ok=True)
+    name = os.path.basename(os.path.normpath(path))
+    target = os.path.join(trash_directory, f"{name}-{uuid.uuid4().hex}")
+    try:
+        os.rename(path, target)
+    except FileNotFoundError:
+        return None
+    if collect:
+        collector.wake()
+    return target
+
+
+def get_size(path):
+    """Get the number of files and bytes under a directory."""
+    files = size = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+                files += 1
+            except FileNotFoundError:
+                pass
+    return files, size
+
+
+class TrashCollector:
+    """Remove the trash in a daemon thread, at most ``files_per_second``"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    @property
+    def files_per_second(self):
+        return getattr(settings, "TRASH", {}).get("FILES_PER_SECOND", 1000)
+
+    def wake(self):
+        """Start collecting, in a thread started on the first call."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="trash-collector", daemon=True
+                )
+                self._thread.start()
+        self._wake.set()
+
+    def collect(self):
+        """Remove everything in the trash, throttled; return the files removed."""
+        trash_directory = get_trash_directory()
+        try:
+            entries = os.listdir(trash_directory)
+        except FileNotFoundError:
+            return 0
+        removed = 0
+        for entry in entries:
+            removed += self._remove(os.path.join(trash_directory, entry))
+        return removed
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                removed = self.collect()
+                logger.info(f"TrashCollector: removed {removed} files")
+            except Exception as e:
+                logger.error(f"TrashCollector: {e}")
+
+    def _remove(self, path):
+        removed = 0
+        started = time.monotonic()
+        # children first, so directories are empty when they are removed
+        for root, directories, names in os.walk(path, topdown=False):
+            for name in names:
+                try:
+                    os.unlink(os.path.join(root, name))
+                except FileNotFoundError:
+                    # another worker's collector got there first
+                    continue
+                removed += 1
+                if removed % BATCH_SIZE == 0:
+                    # sleep off whatever was faster than the rate
+                    ahead = removed / self.files_per_second - (
+                        time.monotonic() - started
+                    )
+                    if ahead > 0:
+                        time.sleep(ahead)
+            for name in directories:
+                try:
+                    os.rmdir(os.path.join(root, name))
+                except FileNotFoundError:
+                    pass
+        try:
+            if os.path.isdir(path):
+                os.rmdir(path)
+            else:
+                os.unlink(path)
+        except FileNotFoundError:
+            pass
+        return removed
+
+
+collector = TrashCollector()
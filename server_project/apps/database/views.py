@@ -49,13 +49,13 @@ class DatabaseView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
         return context
 
     def _generate_breadcrumbs(self, folder):
-        breadcrumbs = []
-        current = folder
+        breadcrumbs = [{"id": "", "name": "Root"}]
+        if not folder:
+            return breadcrumbs
 
-        while current:
-            breadcrumbs.append({"id": current.id, "name": current.name})
-            current = current.parent
-        breadcrumbs.append({"id": "", "name": "Root"})
-
-        breadcrumbs.reverse()
+        names = dict(Folder.objects.ancestors(folder).values_list("id", "name"))
+        breadcrumbs.extend(
+            {"id": pk, "name": names[pk]} for pk in folder.get_ancestor_ids()
+        )
+        breadcrumbs.append({"id": folder.id, "name": folder.name})
         return breadcrumbs
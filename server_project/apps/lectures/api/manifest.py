@@ -0,0 +1,95 @@
+"""
+The manifest of a lecture: everything the lecture viewer needs to open it,
+in one response instead of several requests per slide.
+
+The manifest is built once per version of the lecture, which changes with
+the lecture, its contents and their slides and annotations, and is shared by
+everyone viewing the lecture. Contents whose slide a viewer can't see are
+left out per request.
+"""
+
+from django.urls import reverse
+
+from apps.slide_viewer.codec import decode_shape, encode_shape
+from apps.slide_viewer.overlay import DZI_NAMESPACE, parse_dzi
+
+
+def build_manifest(lecture, compact):
+    """Get the manifest of a lecture, with encoded points if ``compact``."""
+    return {
+        "id": lecture.pk,
+        "name": lecture.name,
+        "description": lecture.description,
+        "author": lecture.author.username if lecture.author else None,
+        "updated_at": lecture.updated_at.isoformat(),
+        "contents": [
+            {
+                "id": content.pk,
+                "order": content.order,
+                "slide": _get_slide(content.slide),
+                "annotation": _get_annotation(content.annotation, compact),
+            }
+            for content in lecture.get_contents()
+        ],
+    }
+
+
+def get_tile_source(slide):
+    """
+    Get the DZI of a slide as an OpenSeadragon JSON tile source, or None if
+    the slide has no valid DZI.
+    """
+    try:
+        geometry = parse_dzi(slide.get_dzi())
+    except ValueError:
+        return None
+    dzi_url = reverse("api:slide-dzi", kwargs={"pk": slide.pk})
+    return {
+        "Image": {
+            "xmlns": DZI_NAMESPACE,
+            # where OpenSeadragon would look for the tiles of the DZI file
+            "Url": dzi_url.removesuffix(".dzi/") + "_files/",
+            "Format": geometry["format"],
+            "Overlap": geometry["overlap"],
+            "TileSize": geometry["tile_size"],
+            "Size": {"Width": geometry["width"], "Height": geometry["height"]},
+        }
+    }
+
+
+def _get_slide(slide):
+    return {
+        "id": slide.pk,
+        "name": slide.name,
+        "information": slide.information,
+        "is_public": slide.is_public,
+        "width": slide.width,
+        "height": slide.height,
+        "mpp_x": slide.mpp_x,
+        "mpp_y": slide.mpp_y,
+        "objective_power": slide.objective_power,
+        "vendor": slide.vendor,
+        "thumbnail": reverse("api:slide-thumbnail", kwargs={"pk": slide.pk}),
+        "associated_image": reverse(
+            "api:slide-associated-image", kwargs={"pk": slide.pk}
+        ),
+        "view_url": reverse("slide_viewer:slide-view", kwargs={"slide_id": slide.pk}),
+        "dzi": get_tile_source(slide),
+    }
+
+
+def _get_annotation(annotation, compact):
+    if annotation is None:
+        return None
+    data = annotation.data
+    if isinstance(data, list):
+        code = encode_shape if compact else decode_shape
+        data = [code(shape) for shape in data]
+    return {
+        "id": annotation.pk,
+        "name": annotation.name,
+        "description": annotation.description,
+        "author": annotation.author.username if annotation.author else None,
+        "version": annotation.version,
+        "data": data,
+    }
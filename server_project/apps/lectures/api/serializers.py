@@ -1,9 +1,13 @@
+from django.db import transaction
 from rest_framework import serializers
 
+from apps.database.api.mixins import SparseFieldsetsMixin
+from apps.database.models import Slide
+from apps.slide_viewer.models import Annotation
 from ..models import Lecture, LectureContent, LectureFolder
 
 
-class LectureFolderSerializer(serializers.ModelSerializer):
+class LectureFolderSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     author = serializers.CharField(source="author.username", default=None)
 
     class Meta:
@@ -33,12 +37,18 @@ class LectureFolderSerializer(serializers.ModelSerializer):
 
 
 class LectureContentSerializer(serializers.ModelSerializer):
+    # ids, checked together for all contents by LectureSerializer.validate()
+    slide = serializers.IntegerField(source="slide_id")
+    annotation = serializers.IntegerField(
+        source="annotation_id", allow_null=True, required=False
+    )
+
     class Meta:
         model = LectureContent
         fields = ["id", "slide", "annotation", "order"]
 
 
-class LectureSerializer(serializers.ModelSerializer):
+class LectureSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     author = serializers.CharField(source="author.username", default=None)
     contents = LectureContentSerializer(many=True, required=False)
 
@@ -67,14 +77,41 @@ class LectureSerializer(serializers.ModelSerializer):
             errors["folder"] = "You don't have permission to edit this folder."
 
         contents = attrs.get("contents", [])
+        orders = [content["order"] for content in contents]
+        if len(set(orders)) < len(orders):
+            errors["contents"] = "Contents must have distinct orders."
+
+        slide_ids = {content["slide_id"] for content in contents}
+        annotation_ids = {
+            content["annotation_id"]
+            for content in contents
+            if content.get("annotation_id")
+        }
+        viewable_slides = _get_ids(Slide.objects.viewable(user), slide_ids)
+        viewable_annotations = _get_ids(
+            Annotation.objects.viewable(user), annotation_ids
+        )
+        # only ids that can't be viewed are looked up again, to tell why
+        hidden_slides = slide_ids - viewable_slides
+        missing_slides = hidden_slides - _get_ids(Slide.objects.all(), hidden_slides)
+        hidden_annotations = annotation_ids - viewable_annotations
+        missing_annotations = hidden_annotations - _get_ids(
+            Annotation.objects.all(), hidden_annotations
+        )
         for index, content in enumerate(contents):
-            slide = content.get("slide")
-            annotation = content.get("annotation")
-            if slide and not slide.user_can_view(user):
+            slide = content["slide_id"]
+            annotation = content.get("annotation_id")
+            if slide in missing_slides:
+                errors[f"contents[{index}].slide"] = "This slide does not exist."
+            elif slide not in viewable_slides:
                 errors[f"contents[{index}].slide"] = (
                     "You don't have permission to view this slide."
                 )
-            if annotation and not annotation.user_can_view(user):
+            if annotation in missing_annotations:
+                errors[f"contents[{index}].annotation"] = (
+                    "This annotation does not exist."
+                )
+            elif annotation and annotation not in viewable_annotations:
                 errors[f"contents[{index}].annotation"] = (
                     "You don't have permission to view this annotation."
                 )
@@ -85,22 +122,30 @@ class LectureSerializer(serializers.ModelSerializer):
         return super().validate(attrs)
 
     def create(self, validated_data):
-        contents_data = validated_data.pop("contents", [])
-
-        lecture = super().create(validated_data)
-
-        for content in contents_data:
-            LectureContent.objects.create(lecture=lecture, **content)
+        contents = validated_data.pop("contents", [])
 
+        with transaction.atomic():
+            lecture = super().create(validated_data)
+            self._set_contents(lecture, contents)
         return lecture
 
     def update(self, instance, validated_data):
-        contents_data = validated_data.pop("contents", [])
-        lecture = super().update(instance, validated_data)
+        contents = validated_data.pop("contents", None)
 
-        lecture.contents.all().delete()
-        for content in contents_data:
-            LectureContent.objects.create(lecture=lecture, **content)
+        with transaction.atomic():
+            if contents is not None:
+                self._set_contents(instance, contents)
+            return super().update(instance, validated_data)
 
-        lecture.save()
-        return lecture
+    def _set_contents(self, lecture, contents):
+        try:
+            LectureContent.objects.set_contents(lecture, contents)
+        except ValueError as e:
+            raise serializers.ValidationError({"contents": str(e)})
+
+
+def _get_ids(queryset, ids):
+    """Get which of ``ids`` are in a queryset, in one query."""
+    if not ids:
+        return set()
+    return set(queryset.filter(pk__in=ids).values_list("pk", flat=True))
@@ -8,6 +8,11 @@ from rest_framework.exceptions import PermissionDenied
 from rest_framework.permissions import IsAuthenticated, DjangoModelPermissions
 from rest_framework.response import Response
 
+from apps.caching.cache import get_or_set, get_versions
+from apps.database.api.trees import get_tree, get_tree_etag, tree_response
+from apps.database.models import Slide
+from apps.slide_viewer.api.serializers import get_encoding_param
+from .manifest import build_manifest
 from .serializers import LectureSerializer, LectureFolderSerializer
 from ..models import Lecture, LectureFolder
 
@@ -19,7 +24,9 @@ class LectureFolderViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated, DjangoModelPermissions]
 
     def get_queryset(self):
-        return LectureFolder.objects.viewable(self.request.user)
+        return LectureFolder.objects.viewable(self.request.user).select_related(
+            "author"
+        )
 
     def perform_create(self, serializer):
         folder = serializer.save(author=self.request.user)
@@ -65,18 +72,18 @@ class LectureFolderViewSet(viewsets.ModelViewSet):
         if not request.user.has_perm("lectures.view_lecturefolder"):
             raise PermissionDenied("You do not have permission to view folders.")
 
-        root_folders = self.get_queryset().filter(parent=None)
-        tree = [self._get_tree_structure(folder) for folder in root_folders]
-        return Response(tree)
-
-    def _get_tree_structure(self, folder):
-        return {
-            "id": folder.id,
-            "name": folder.name,
-            "subfolders": [
-                self._get_tree_structure(sub) for sub in folder.subfolders.all()
-            ],
-        }
+        root_ids = list(
+            LectureFolder.objects.editable_base_folders(request.user).values_list(
+                "id", flat=True
+            )
+        )
+        (version,) = get_versions(["lecture-folder-tree"])
+        etag = get_tree_etag(version, *root_ids)
+        return tree_response(
+            request,
+            etag,
+            lambda: get_tree(LectureFolder, "lecture-folder-tree", root_ids),
+        )
 
     def _check_edit_permissions(self, folder):
         if not folder.user_can_edit(self.request.user):
@@ -88,7 +95,11 @@ class LectureViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated, DjangoModelPermissions]
 
     def get_queryset(self):
-        return Lecture.objects.viewable(self.request.user)
+        queryset = Lecture.objects.viewable(self.request.user).select_related("author")
+        if self.action == "manifest":
+            # the contents come from the cached manifest
+            return queryset
+        return queryset.prefetch_related("contents", "groups")
 
     def perform_create(self, serializer):
         lecture = serializer.save(author=self.request.user)
@@ -148,6 +159,54 @@ class LectureViewSet(viewsets.ModelViewSet):
             }
         )
 
+    @action(detail=True, methods=["get"])
+    def manifest(self, request, pk=None):
+        """
+        Get the lecture with its contents in order, each with its slide's
+        metadata, DZI tile source and image URLs and its annotation's shapes,
+        so the lecture viewer opens it with one request.
+
+        The manifest is cached per version of the lecture and answered with
+        an ETag, so reopening an unchanged lecture costs a 304.
+        """
+        lecture = self.get_object()
+        compact = get_encoding_param(request)
+        namespace = f"lecture:{lecture.pk}"
+        manifest = get_or_set(
+            [namespace],
+            "lecture-manifest",
+            lambda: build_manifest(lecture, compact),
+            params=(compact,),
+        )
+
+        hidden = self._get_hidden_slides(manifest)
+        (version,) = get_versions([namespace])
+        etag = get_tree_etag(version, compact, *sorted(hidden))
+        return tree_response(
+            request,
+            etag,
+            lambda: {
+                **manifest,
+                "contents": [
+                    content
+                    for content in manifest["contents"]
+                    if content["slide"]["id"] not in hidden
+                ],
+            },
+        )
+
+    def _get_hidden_slides(self, manifest):
+        """Get the ids of the private slides of a manifest the user can't view."""
+        private = {
+            content["slide"]["id"]
+            for content in manifest["contents"]
+            if not content["slide"]["is_public"]
+        }
+        if not private or self.request.user.is_admin():
+            return set()
+        viewable = Slide.objects.viewable(self.request.user).filter(pk__in=private)
+        return private - set(viewable.values_list("pk", flat=True))
+
     def _check_edit_permissions(self, lecture):
         if not lecture.user_can_edit(self.request.user):
             raise PermissionDenied("You do not have permission to edit this lecture.")
\ No newline at end of file
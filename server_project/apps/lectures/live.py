@@ -0,0 +1,272 @@
+"""
+Live lectures: a presenter's viewport, broadcast over WebSockets to the
+viewers of a lecture.
+
+A presenter sends its viewport as JSON, ``{"slide", "center", "zoom",
+"annotation"}``, with the center in level-0 pixels of the slide. Viewers get
+it back as ``{"type": "viewport", ...}``, and ``{"type": "end"}`` when the
+last presenter leaves.
+
+Messages go through an in-process channel layer, so every connection of a
+lecture must be served by the same process: run a single ASGI worker for
+``/ws/``. Rapid updates are coalesced twice. A lecture broadcasts at most
+once per ``BROADCAST_INTERVAL``, the latest viewport, encoded once for all
+its viewers, and a viewer who can't keep up only gets the latest broadcast,
+so a classroom costs a bounded amount of work whatever the presenter sends.
+"""
+
+import asyncio
+import json
+import re
+from collections import Counter, defaultdict
+from importlib import import_module
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import aget_user
+from django.http import QueryDict
+from django.http.cookie import parse_cookie
+from django.http.request import split_domain_port, validate_host
+
+from .models import Lecture
+
+PATH = re.compile(r"^/ws/lectures/(?P<pk>\d+)/live/$")
+BROADCAST_INTERVAL = 0.05  # seconds
+MAX_MESSAGE_SIZE = 1024  # characters
+
+
+class Subscription:
+    """The latest message of a group, not yet received by a subscriber"""
+
+    def __init__(self):
+        self.message = None
+        self.event = asyncio.Event()
+
+    def put(self, message):
+        # a message not received yet is stale, replace it
+        self.message = message
+        self.event.set()
+
+    async def get(self):
+        await self.event.wait()
+        self.event.clear()
+        message, self.message = self.message, None
+        return message
+
+
+class InProcessChannelLayer:
+    """
+    Groups of subscribers within a process, for single-node deployments.
+
+    A group keeps its last message, for subscribers joining later, and
+    publishes at most once per ``interval``.
+    """
+
+    def __init__(self, interval=BROADCAST_INTERVAL):
+        self.interval = interval
+        self.groups = defaultdict(set)
+        self.retained = {}
+        self.pending = {}
+        self.published_at = {}
+
+    def subscribe(self, group):
+        subscription = Subscription()
+        self.groups[group].add(subscription)
+        if group in self.retained:
+            subscription.put(self.retained[group])
+        return subscription
+
+    def unsubscribe(self, group, subscription):
+        self.groups[group].discard(subscription)
+        if not self.groups[group]:
+            del self.groups[group]
+
+    def publish(self, group, message):
+        """Publish a message now, or with the next broadcast of the group."""
+        loop = asyncio.get_running_loop()
+        scheduled = group in self.pending
+        self.pending[group] = message
+        if scheduled:
+            return
+        wait = self.published_at.get(group, -self.interval) + self.interval
+        wait -= loop.time()
+        if wait > 0:
+            loop.call_later(wait, self._flush, group)
+        else:
+            self._flush(group)
+
+    def clear(self, group, message):
+        """Publish a last message now and forget the group's state."""
+        self.pending.pop(group, None)
+        self.retained.pop(group, None)
+        self.published_at.pop(group, None)
+        text = json.dumps(message)
+        for subscription in self.groups.get(group, ()):
+            subscription.put(text)
+
+    def _flush(self, group):
+        if group not in self.pending:
+            # cleared while waiting
+            return
+        text = json.dumps(self.pending.pop(group))
+        self.retained[group] = text
+        self.published_at[group] = asyncio.get_running_loop().time()
+        for subscription in self.groups.get(group, ()):
+            subscription.put(text)
+
+
+channel_layer = InProcessChannelLayer()
+presenters = Counter()
+
+
+async def live_lecture_application(scope, receive, send):
+    """ASGI application of the live lecture WebSockets."""
+    match = PATH.match(scope["path"])
+    message = await receive()
+    if message["type"] != "websocket.connect":
+        return
+    if not match or not _is_allowed_origin(scope):
+        await send({"type": "websocket.close", "code": 4403})
+        return
+
+    user = await _get_user(scope)
+    query = QueryDict(scope.get("query_string", b""))
+    connection = await sync_to_async(_get_connection)(
+        user, int(match["pk"]), query.get("role") == "present"
+    )
+    if connection is None:
+        await send({"type": "websocket.close", "code": 4403})
+        return
+
+    await send({"type": "websocket.accept"})
+    group = f"lecture-{match['pk']}"
+    if connection["present"]:
+        await _present(group, connection, receive, send)
+    else:
+        await _follow(group, receive, send)
+
+
+async def _present(group, connection, receive, send):
+    presenters[group] += 1
+    try:
+        while True:
+            message = await receive()
+            if message["type"] != "websocket.receive":
+                break
+            try:
+                viewport = _parse_viewport(message.get("text"), connection)
+            except ValueError as e:
+                await send({"type": "websocket.send", "text": _error(e)})
+                continue
+            channel_layer.publish(group, {"type": "viewport", **viewport})
+    finally:
+        presenters[group] -= 1
+        if not presenters[group]:
+            del presenters[group]
+            channel_layer.clear(group, {"type": "end"})
+
+
+async def _follow(group, receive, send):
+    subscription = channel_layer.subscribe(group)
+
+    async def forward():
+        while True:
+            text = await subscription.get()
+            await send({"type": "websocket.send", "text": text})
+
+    async def disconnect():
+        # viewers only listen, anything they send is ignored
+        while (await receive())["type"] == "websocket.receive":
+            pass
+
+    tasks = [asyncio.create_task(forward()), asyncio.create_task(disconnect())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        channel_layer.unsubscribe(group, subscription)
+
+
+def _is_allowed_origin(scope):
+    """Whether the handshake comes from this site, like a CSRF check."""
+    headers = dict(scope.get("headers", ()))
+    origin = headers.get(b"origin")
+    if origin is None:
+        # not a browser, it can't be riding a viewer's session cookie
+        return True
+    host, _ = split_domain_port(re.sub(r"^\w+://", "", origin.decode("latin-1")))
+    allowed_hosts = settings.ALLOWED_HOSTS
+    if settings.DEBUG and not allowed_hosts:
+        allowed_hosts = [".localhost", "127.0.0.1", "[::1]"]
+    return bool(host) and validate_host(host, allowed_hosts)
+
+
+async def _get_user(scope):
+    headers = dict(scope.get("headers", ()))
+    cookies = parse_cookie(headers.get(b"cookie", b"").decode("latin-1"))
+    engine = import_module(settings.SESSION_ENGINE)
+    session = engine.SessionStore(cookies.get(settings.SESSION_COOKIE_NAME))
+    return await aget_user(SimpleNamespace(session=session))
+
+
+def _get_connection(user, pk, present):
+    """Get what a user may do in a live lecture, None if they can't join it."""
+    if not user.is_authenticated or not user.has_perm("lectures.view_lecture"):
+        return None
+    lecture = Lecture.objects.filter(pk=pk).first()
+    if lecture is None or not lecture.user_can_view(user):
+        return None
+    if present and not lecture.user_can_edit(user):
+        return None
+
+    contents = [
+        (content.slide_id, content.annotation_id)
+        for content in lecture.get_contents()
+    ]
+    return {
+        "present": present,
+        "slides": {slide_id for slide_id, _ in contents},
+        "annotations": {pair for pair in contents if pair[1] is not None},
+    }
+
+
+def _parse_viewport(text, connection):
+    if not text or len(text) > MAX_MESSAGE_SIZE:
+        raise ValueError("Expected a viewport.")
+    try:
+        viewport = json.loads(text)
+        slide, center, zoom = viewport["slide"], viewport["center"], viewport["zoom"]
+        annotation = viewport.get("annotation")
+    except (json.JSONDecodeError, KeyError, TypeError):
+        raise ValueError("Expected a viewport.")
+
+    if not _is_id(slide) or slide not in connection["slides"]:
+        raise ValueError("The slide is not in the lecture.")
+    if annotation is not None and (
+        not _is_id(annotation)
+        or (slide, annotation) not in connection["annotations"]
+    ):
+        raise ValueError("The annotation is not in the lecture.")
+    if (
+        not isinstance(center, list)
+        or len(center) != 2
+        or not all(_is_number(value) for value in center)
+    ):
+        raise ValueError("The center must be a pair of numbers.")
+    if not _is_number(zoom) or zoom <= 0:
+        raise ValueError("The zoom must be a positive number.")
+    return {"slide": slide, "center": center, "zoom": zoom, "annotation": annotation}
+
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _error(e):
+    return json.dumps({"type": "error", "detail": str(e)})
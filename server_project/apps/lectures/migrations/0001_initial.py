@@ -0,0 +1,67 @@
+# Generated by Django 5.1.15 on 2026-10-19 00:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('database', '0001_initial'),
+        ('slide_viewer', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LectureFolder',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=250)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('author', models.ForeignKey(blank=True, db_column='created_by', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lecture_folders', to=settings.AUTH_USER_MODEL)),
+                ('parent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='subfolders', to='lectures.lecturefolder')),
+            ],
+            options={
+                'ordering': ('name',),
+                'unique_together': {('name', 'parent')},
+            },
+        ),
+        migrations.CreateModel(
+            name='Lecture',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('author', models.ForeignKey(blank=True, db_column='created_by', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lectures', to=settings.AUTH_USER_MODEL)),
+                ('groups', models.ManyToManyField(blank=True, related_name='lectures', to='auth.group')),
+                ('folder', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lectures', to='lectures.lecturefolder')),
+            ],
+            options={
+                'ordering': ('created_at',),
+            },
+        ),
+        migrations.CreateModel(
+            name='LectureContent',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('order', models.PositiveSmallIntegerField(help_text='Order inside the lecture')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('annotation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lecture_contents', to='slide_viewer.annotation')),
+                ('lecture', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='contents', to='lectures.lecture')),
+                ('slide', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='lecture_contents', to='database.slide')),
+            ],
+            options={
+                'ordering': ('created_at',),
+                'unique_together': {('lecture', 'order')},
+            },
+        ),
+    ]
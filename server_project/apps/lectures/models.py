@@ -1,5 +1,16 @@
 from django.conf import settings
-from django.db import models
+from django.contrib.auth.models import Group
+from django.db import models, transaction
+from django.db.models import (
+    BooleanField,
+    Exists,
+    ExpressionWrapper,
+    OuterRef,
+    Q,
+    Value,
+)
+
+from apps.caching.cache import get_or_set, invalidate
 
 
 class LectureFolderManager(models.Manager):
@@ -117,10 +128,23 @@ class LectureManager(models.Manager):
     def viewable(self, user, include_editable=True):
         if user.is_admin():
             return self.all()
-        viewable = self.filter(groups__in=user.groups.all(), is_active=True)
+        # Exists rather than a join, so a lecture shared with several of the
+        # user's groups is listed once
+        enrolled = Lecture.groups.through.objects.filter(
+            lecture=OuterRef("pk"), group__in=user.groups.all()
+        )
+        viewable = Q(Exists(enrolled), is_active=True)
         if include_editable:
-            viewable |= self.editable(user)
-        return viewable
+            viewable |= Q(author=user)
+        return self.filter(viewable)
+
+    def annotate_editable(self, lectures, user):
+        """Annotate lectures with whether the user can edit them, as is_editable"""
+        if user.is_admin():
+            editable = Value(True)
+        else:
+            editable = ExpressionWrapper(Q(author=user), output_field=BooleanField())
+        return lectures.annotate(is_editable=editable)
 
     def editable_by_folder(self, user, folder):
         if not folder:
@@ -189,10 +213,7 @@ class Lecture(models.Model):
         return self.author == user
 
     def user_is_enrolled(self, user):
-        for group in self.groups.all():
-            if group in user.groups.all():
-                return True
-        return False
+        return self.groups.filter(pk__in=user.groups.values("pk")).exists()
 
     def user_can_view(self, user):
         return self.user_can_edit(user) or (
@@ -202,6 +223,128 @@ class Lecture(models.Model):
     def get_slides(self):
         return self.contents.values_list("slide", flat=True)
 
+    def get_contents(self):
+        """Get the contents in order with their slides and annotations, cached"""
+        return get_or_set(
+            [f"lecture:{self.pk}"],
+            "lecture-contents",
+            lambda: list(
+                self.contents.select_related("slide", "annotation__author").order_by(
+                    "order"
+                )
+            ),
+        )
+
+
+class LectureContentManager(models.Manager):
+    # the largest order, the maximum of a PositiveSmallIntegerField
+    MAX_ORDER = 32767
+
+    def invalid(self):
+        """Get contents whose slide can't be viewed by the lecture author anymore"""
+        author_can_edit = Group.objects.filter(
+            user=OuterRef("lecture__author"),
+            profile__base_folder=OuterRef("slide__folder__base_folder"),
+        )
+        return (
+            self.filter(slide__is_public=False)
+            .exclude(lecture__author__is_staff=True)
+            .exclude(Exists(author_can_edit))
+        )
+
+    def set_contents(self, lecture, contents):
+        """
+        Make the contents of a lecture match dicts of slide_id, annotation_id
+        and order, with a few bulk queries in one transaction.
+
+        Rows already at their order are left alone and rows only moving to
+        another order keep their id. The checks of save() are made for all
+        the contents at once: slides must be viewable by the lecture author,
+        annotations not on their slide or not viewable by the author are
+        dropped.
+        """
+        slide_model = self.model._meta.get_field("slide").related_model
+        annotation_model = self.model._meta.get_field("annotation").related_model
+        slide_ids = {content["slide_id"] for content in contents}
+        annotation_ids = {
+            content["annotation_id"]
+            for content in contents
+            if content.get("annotation_id")
+        }
+        slides = slide_model.objects.filter(pk__in=slide_ids)
+        annotations = annotation_model.objects.filter(pk__in=annotation_ids)
+        if lecture.author:
+            slides = slides & slide_model.objects.viewable(lecture.author)
+            annotations = annotations & annotation_model.objects.viewable(
+                lecture.author
+            )
+        if slide_ids - set(slides.values_list("pk", flat=True)):
+            raise ValueError("Slide must be viewable by the lecture author")
+        annotation_slides = dict(annotations.values_list("pk", "slide_id"))
+
+        wanted = [
+            LectureContent(
+                lecture=lecture,
+                order=content["order"],
+                slide_id=content["slide_id"],
+                annotation_id=(
+                    content.get("annotation_id")
+                    if annotation_slides.get(content.get("annotation_id"))
+                    == content["slide_id"]
+                    else None
+                ),
+            )
+            for content in contents
+        ]
+
+        existing = {content.order: content for content in lecture.contents.all()}
+        unmatched = []
+        for content in wanted:
+            current = existing.get(content.order)
+            if current and _content_key(current) == _content_key(content):
+                del existing[content.order]
+            else:
+                unmatched.append(content)
+
+        leftover = {}
+        for current in existing.values():
+            leftover.setdefault(_content_key(current), []).append(current)
+        moved, created = [], []
+        for content in unmatched:
+            rows = leftover.get(_content_key(content))
+            if rows:
+                row = rows.pop()
+                moved.append((row, content.order))
+            else:
+                created.append(content)
+        deleted = [row.pk for rows in leftover.values() for row in rows]
+
+        with transaction.atomic():
+            if deleted:
+                self.filter(pk__in=deleted).delete()
+            if moved:
+                self._move(moved, used={*existing, *(c.order for c in wanted)})
+            self.bulk_create(created)
+        invalidate(f"lecture:{lecture.pk}")
+
+    def _move(self, moved, used):
+        rows = [row for row, _ in moved]
+        if {order for _, order in moved} & {row.order for row in rows}:
+            # orders are unique per lecture, so swapped rows step aside first
+            spare = (
+                order for order in range(self.MAX_ORDER, 0, -1) if order not in used
+            )
+            for row in rows:
+                row.order = next(spare)
+            self.bulk_update(rows, ["order"])
+        for row, order in moved:
+            row.order = order
+        self.bulk_update(rows, ["order"])
+
+
+def _content_key(content):
+    return content.slide_id, content.annotation_id
+
 
 class LectureContent(models.Model):
     id = models.AutoField(primary_key=True)
@@ -229,6 +372,8 @@ class LectureContent(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = LectureContentManager()
+
     class Meta:
         unique_together = ("lecture", "order")
         ordering = ("created_at",)
@@ -1,3 +1,498 @@
-from django.test import TestCase
+import json
+import os
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from apps.accounts.models import GroupProfile, User
+from apps.database.models import Slide
+from apps.database.tests import LargeDatasetTestCase
+from apps.slide_viewer.models import Annotation
+from . import live
+from .models import Lecture, LectureContent, LectureFolder
+
+
+class LectureQueryCountTests(LargeDatasetTestCase):
+    def test_lecture_list_admin(self):
+        self.assertBoundedRequest(self.admin, reverse("api:lecture-list"))
+
+    def test_lecture_list_publisher(self):
+        self.assertBoundedRequest(self.publisher, reverse("api:lecture-list"))
+
+    def test_lecture_list_viewer(self):
+        self.assertBoundedRequest(self.viewer, reverse("api:lecture-list"))
+
+    def test_lecture_folder_tree_publisher(self):
+        self.assertBoundedRequest(self.publisher, reverse("api:lecture-folder-tree"))
+
+    def test_lecture_bulletins_viewer(self):
+        self.assertBoundedRequest(self.viewer, reverse("lectures:lecture-bulletins"))
+
+    def test_lecture_bulletins_publisher(self):
+        self.assertBoundedRequest(
+            self.publisher, reverse("lectures:lecture-bulletins")
+        )
+
+    def test_lecture_database_publisher(self):
+        folder = self.publisher.base_lecture_folder
+        url = f"{reverse('lectures:lecture-database')}?folder={folder.pk}"
+        self.assertBoundedRequest(self.publisher, url)
+
+    def test_lecture_manifest_viewer(self):
+        lecture = Lecture.objects.filter(is_active=True).first()
+        url = reverse("api:lecture-manifest", kwargs={"pk": lecture.pk})
+        self.assertBoundedRequest(self.viewer, url)
+
+
+class LectureListingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.group = Group.objects.create(name="pathology")
+        GroupProfile.objects.create(
+            group=cls.group, type=GroupProfile.TypeChoices.PUBLISHER
+        )
+        cls.publisher = User.objects.create_user("pathologist", "Patho", "Logist")
+        cls.publisher.groups.add(cls.group)
+        cls.publisher.save()  # creates the base lecture folder
+
+        students = Group.objects.create(name="students")
+        GroupProfile.objects.create(
+            group=students, type=GroupProfile.TypeChoices.VIEWER
+        )
+        cls.viewer = User.objects.create_user("student", "Stu", "Dent")
+        cls.viewer.groups.add(students)
+
+        # more than a page of folders and lectures, some of them inactive
+        folder = cls.publisher.base_lecture_folder
+        for name in ("Liver", "Kidney", "Lung"):
+            LectureFolder.objects.create(name=name, author=cls.publisher, parent=folder)
+        lectures = Lecture.objects.bulk_create(
+            Lecture(
+                name=f"Lecture {i}",
+                author=cls.publisher,
+                folder=folder,
+                is_active=i % 10 != 0,
+            )
+            for i in range(60)
+        )
+        Lecture.groups.through.objects.bulk_create(
+            Lecture.groups.through(lecture_id=lecture.id, group_id=students.id)
+            for lecture in lectures
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def get_names(self, user, url, **params):
+        """Get the names listed on every page of ``url``."""
+        self.client.force_login(user)
+        names, page = [], 1
+        while page:
+            response = self.client.get(url, {**params, "page": page})
+            self.assertEqual(response.status_code, 200)
+            names += [item.name for item in response.context["object_list"]]
+            page_obj = response.context["page_obj"]
+            page = page_obj.next_page_number() if page_obj.has_next() else None
+        return names
+
+    def test_bulletins_list_shared_lectures_once(self):
+        lecture = Lecture.objects.filter(is_active=True).first()
+        lecture.groups.add(self.group)
+        self.viewer.groups.add(self.group)
+
+        url = reverse("lectures:lecture-bulletins")
+        names = self.get_names(self.viewer, url)
+        active = Lecture.objects.filter(is_active=True)
+        self.assertEqual(len(names), active.count())
+        self.assertEqual(len(set(names)), len(names))
+
+    def test_database_pages_folders_then_lectures(self):
+        folder = self.publisher.base_lecture_folder
+        url = reverse("lectures:lecture-database")
+        names = self.get_names(self.publisher, url, folder=folder.pk)
+
+        folders = sorted(folder.subfolders.values_list("name", flat=True))
+        lectures = sorted(
+            folder.lectures.values_list("name", flat=True), key=str.lower
+        )
+        self.assertEqual(names, folders + lectures)
+
+
+class LectureUpdateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        groups = []
+        for name in ("pathology", "anatomy"):
+            group = Group.objects.create(name=name)
+            GroupProfile.objects.create(
+                group=group, type=GroupProfile.TypeChoices.PUBLISHER
+            )
+            groups.append(group)
+        cls.publisher = User.objects.create_user("pathologist", "Patho", "Logist")
+        cls.publisher.groups.add(groups[0])
+        cls.publisher.save()  # creates the base lecture folder
+
+        cls.slides = Slide.objects.bulk_create(
+            Slide(name=f"Slide {i}", file=f"slides/{i}.svs", is_public=True)
+            for i in range(61)
+        )
+        (cls.private,) = Slide.objects.bulk_create(
+            [
+                Slide(
+                    name="Private",
+                    file="slides/private.svs",
+                    folder=groups[1].profile.base_folder,
+                )
+            ]
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.lecture = Lecture.objects.create(
+            name="Histology",
+            author=self.publisher,
+            folder=self.publisher.base_lecture_folder,
+        )
+        LectureContent.objects.bulk_create(
+            LectureContent(lecture=self.lecture, order=order, slide=slide)
+            for order, slide in enumerate(self.slides[:60], start=1)
+        )
+        self.url = reverse("api:lecture-detail", kwargs={"pk": self.lecture.pk})
+        self.client.force_login(self.publisher)
+
+    def _get_contents(self):
+        return list(
+            self.lecture.contents.order_by("order").values_list("id", "slide_id")
+        )
+
+    def _patch(self, slides, **content):
+        contents = [
+            {"order": order, "slide": slide, **content}
+            for order, slide in enumerate(slides, start=1)
+        ]
+        return self.client.patch(
+            self.url, {"contents": contents}, content_type="application/json"
+        )
+
+    def test_reorder_keeps_ids_with_few_queries(self):
+        before = self._get_contents()
+        slides = [slide for _, slide in before]
+        slides[0], slides[-1] = slides[-1], slides[0]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self._patch(slides)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(queries), 25)
+
+        after = self._get_contents()
+        self.assertEqual([slide for _, slide in after], slides)
+        self.assertEqual({pk for pk, _ in after}, {pk for pk, _ in before})
+
+    def test_reverse_add_and_remove(self):
+        before = self._get_contents()
+        slides = [slide for _, slide in reversed(before[1:])]
+        slides.append(self.slides[60].pk)
+        response = self._patch(slides)
+        self.assertEqual(response.status_code, 200)
+
+        after = self._get_contents()
+        self.assertEqual([slide for _, slide in after], slides)
+        self.assertNotIn(before[0][0], {pk for pk, _ in after})
+        self.assertEqual(len(response.json()["contents"]), 60)
+
+    def test_annotations_must_be_on_their_slide(self):
+        first, second = self.slides[:2]
+        annotation = Annotation.objects.create(
+            name="Nucleus", author=self.publisher, slide=first
+        )
+        response = self._patch([first.pk, second.pk], annotation=annotation.pk)
+        self.assertEqual(response.status_code, 200)
+        contents = self.lecture.contents.order_by("order")
+        self.assertEqual(
+            [content.annotation_id for content in contents], [annotation.pk, None]
+        )
+
+    def test_invalid_contents(self):
+        contents = [{"order": 1, "slide": slide.pk} for slide in self.slides[:2]]
+        response = self.client.patch(
+            self.url, {"contents": contents}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+        response = self._patch([self.private.pk])
+        self.assertEqual(response.status_code, 400)
+        response = self._patch([10**6])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(self._get_contents()), 60)
+
+    def test_patch_without_contents_keeps_them(self):
+        response = self.client.patch(
+            self.url, {"name": "Renamed"}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self._get_contents()), 60)
+
+
+class LectureManifestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        group = Group.objects.create(name="pathology")
+        GroupProfile.objects.create(
+            group=group, type=GroupProfile.TypeChoices.PUBLISHER
+        )
+        cls.publisher = User.objects.create_user("pathologist", "Patho", "Logist")
+        cls.publisher.groups.add(group)
+        cls.publisher.save()  # creates the base lecture folder
+
+        students = Group.objects.create(name="students")
+        GroupProfile.objects.create(
+            group=students, type=GroupProfile.TypeChoices.VIEWER
+        )
+        cls.viewer = User.objects.create_user("student", "Stu", "Dent")
+        cls.viewer.groups.add(students)
+
+        cls.public = Slide.objects.bulk_create(
+            Slide(
+                name=f"Slide {i}",
+                file=f"slides/{i}.svs",
+                image_root=f"images/{i}",
+                is_public=True,
+            )
+            for i in range(2)
+        )
+        (cls.private,) = Slide.objects.bulk_create(
+            [
+                Slide(
+                    name="Private",
+                    file="slides/private.svs",
+                    folder=group.profile.base_folder,
+                )
+            ]
+        )
+
+    def setUp(self):
+        cache.clear()
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings = self.settings(MEDIA_ROOT=media_root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        os.makedirs(self.public[0].get_image_directory())
+        with open(self.public[0].get_dzi_path(), "w") as f:
+            f.write(
+                '<Image Format="jpeg" Overlap="1" TileSize="254" '
+                'xmlns="http://schemas.microsoft.com/deepzoom/2008">'
+                '<Size Height="800" Width="1000"/></Image>'
+            )
+
+        self.annotation = Annotation.objects.create(
+            name="Gland",
+            data=[{"type": "polygon", "points": [[0, 0], [10, 0], [10, 10]]}],
+            author=self.publisher,
+            slide=self.public[1],
+        )
+        self.lecture = Lecture.objects.create(
+            name="Histology",
+            author=self.publisher,
+            folder=self.publisher.base_lecture_folder,
+            is_active=True,
+        )
+        self.lecture.groups.set(self.viewer.groups.all())
+        LectureContent.objects.bulk_create(
+            [
+                LectureContent(lecture=self.lecture, order=3, slide=self.public[0]),
+                LectureContent(
+                    lecture=self.lecture,
+                    order=1,
+                    slide=self.public[1],
+                    annotation=self.annotation,
+                ),
+                LectureContent(lecture=self.lecture, order=2, slide=self.private),
+            ]
+        )
+        self.url = reverse("api:lecture-manifest", kwargs={"pk": self.lecture.pk})
+
+    def test_manifest(self):
+        self.client.force_login(self.publisher)
+        response = self.client.get(self.url)
+        contents = response.json()["contents"]
+        self.assertEqual([content["order"] for content in contents], [1, 2, 3])
+        self.assertEqual(
+            contents[0]["annotation"]["data"][0]["points"],
+            [[0, 0], [10, 0], [10, 10]],
+        )
+        self.assertIsNone(contents[0]["slide"]["dzi"])
+        image = contents[2]["slide"]["dzi"]["Image"]
+        self.assertEqual(image["Size"], {"Width": 1000, "Height": 800})
+        self.assertEqual(
+            (image["Format"], image["Overlap"], image["TileSize"]), ("jpeg", 1, 254)
+        )
+        # OpenSeadragon appends <level>/<col>_<row>.<format> to the URL
+        match = resolve(f"{image['Url']}10/0_0.jpeg/")
+        self.assertEqual(match.url_name, "slide-tiles")
+        self.assertEqual(match.kwargs["pk"], self.public[0].pk)
+
+    def test_private_slides_are_left_out(self):
+        self.client.force_login(self.viewer)
+        response = self.client.get(self.url)
+        slides = [content["slide"]["id"] for content in response.json()["contents"]]
+        self.assertEqual(slides, [self.public[1].pk, self.public[0].pk])
+
+    def test_cached_and_answered_with_etag(self):
+        self.client.force_login(self.viewer)
+        etag = self.client.get(self.url)["ETag"]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(
+            [q for q in queries if "lectures_lecturecontent" in q["sql"]]
+        )
+
+        self.annotation.name = "Renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.annotation.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        annotation = response.json()["contents"][0]["annotation"]
+        self.assertEqual(annotation["name"], "Renamed")
+
+
+class LiveLectureTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        group = Group.objects.create(name="pathology")
+        GroupProfile.objects.create(
+            group=group, type=GroupProfile.TypeChoices.PUBLISHER
+        )
+        cls.publisher = User.objects.create_user("pathologist", "Patho", "Logist")
+        cls.publisher.groups.add(group)
+        cls.publisher.save()  # creates the base lecture folder
+
+        students = Group.objects.create(name="students")
+        GroupProfile.objects.create(
+            group=students, type=GroupProfile.TypeChoices.VIEWER
+        )
+        cls.viewer = User.objects.create_user("student", "Stu", "Dent")
+        cls.viewer.groups.add(students)
+
+        cls.slides = Slide.objects.bulk_create(
+            Slide(name=f"Slide {i}", file=f"slides/{i}.svs", is_public=True)
+            for i in range(2)
+        )
+
+    def setUp(self):
+        cache.clear()
+        for name, value in (
+            ("channel_layer", live.InProcessChannelLayer()),
+            ("presenters", live.Counter()),
+        ):
+            patcher = patch.object(live, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.lecture = Lecture.objects.create(
+            name="Histology",
+            author=self.publisher,
+            folder=self.publisher.base_lecture_folder,
+            is_active=True,
+        )
+        self.lecture.groups.add(*self.viewer.groups.all())
+        LectureContent.objects.create(
+            lecture=self.lecture, order=1, slide=self.slides[0]
+        )
+        self.sessions = {}
+        for user in (self.publisher, self.viewer):
+            client = Client()
+            client.force_login(user)
+            self.sessions[user] = client.cookies[settings.SESSION_COOKIE_NAME].value
+
+    async def connect(self, user, present=False, origin=None):
+        cookie = f"{settings.SESSION_COOKIE_NAME}={self.sessions[user]}"
+        headers = [(b"cookie", cookie.encode())]
+        if origin:
+            headers.append((b"origin", origin.encode()))
+        communicator = ApplicationCommunicator(
+            live.live_lecture_application,
+            {
+                "type": "websocket",
+                "path": f"/ws/lectures/{self.lecture.pk}/live/",
+                "query_string": b"role=present" if present else b"",
+                "headers": headers,
+            },
+        )
+        await communicator.send_input({"type": "websocket.connect"})
+        return communicator, await communicator.receive_output(1)
+
+    async def disconnect(self, communicator):
+        await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+        await communicator.wait(1)
+
+    async def send_viewport(self, communicator, **viewport):
+        viewport = {
+            "slide": self.slides[0].pk,
+            "center": [10, 20],
+            "zoom": 1,
+            **viewport,
+        }
+        await communicator.send_input(
+            {"type": "websocket.receive", "text": json.dumps(viewport)}
+        )
+
+    async def receive(self, communicator):
+        return json.loads((await communicator.receive_output(1))["text"])
+
+    async def test_viewers_get_the_latest_viewport(self):
+        presenter, accepted = await self.connect(self.publisher, present=True)
+        self.assertEqual(accepted["type"], "websocket.accept")
+        viewer, accepted = await self.connect(self.viewer)
+        self.assertEqual(accepted["type"], "websocket.accept")
+
+        for zoom in range(1, 6):
+            await self.send_viewport(presenter, zoom=zoom)
+        self.assertEqual((await self.receive(viewer))["zoom"], 1)
+        # the updates within an interval are coalesced into the last one
+        self.assertEqual(
+            await self.receive(viewer),
+            {
+                "type": "viewport",
+                "slide": self.slides[0].pk,
+                "center": [10, 20],
+                "zoom": 5,
+                "annotation": None,
+            },
+        )
+        self.assertTrue(await viewer.receive_nothing(0.1))
+
+        # viewers joining later start from the current viewport
+        late, _ = await self.connect(self.viewer)
+        self.assertEqual((await self.receive(late))["zoom"], 5)
+
+        await self.disconnect(presenter)
+        self.assertEqual(await self.receive(viewer), {"type": "end"})
+        await self.disconnect(viewer)
+        await self.disconnect(late)
+
+    async def test_invalid_viewport(self):
+        presenter, _ = await self.connect(self.publisher, present=True)
+        await self.send_viewport(presenter, slide=self.slides[1].pk)
+        self.assertEqual((await self.receive(presenter))["type"], "error")
+        await self.send_viewport(presenter, zoom=0)
+        self.assertEqual((await self.receive(presenter))["type"], "error")
+        await self.disconnect(presenter)
+
+    async def test_viewers_cannot_present(self):
+        _, closed = await self.connect(self.viewer, present=True)
+        self.assertEqual(closed, {"type": "websocket.close", "code": 4403})
+
+    async def test_other_origins_are_rejected(self):
+        _, closed = await self.connect(self.viewer, origin="https://example.org")
+        self.assertEqual(closed["type"], "websocket.close")
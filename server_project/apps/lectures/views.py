@@ -4,8 +4,11 @@ from django.contrib.auth.mixins import (
     PermissionRequiredMixin,
 )
 from django.contrib.auth.models import Group
+from django.db.models import CharField, Count, Value
+from django.db.models.functions import Lower
 from django.shortcuts import redirect, get_object_or_404
 from django.urls import reverse_lazy
+from django.utils.functional import cached_property
 from django.views.generic import ListView
 
 from apps.accounts.models import GroupProfile
@@ -17,22 +20,43 @@ class LectureBulletinsView(LoginRequiredMixin, PermissionRequiredMixin, ListView
     template_name = "lectures/lectures.html"
     context_object_name = "lectures"
     permission_required = "lectures.view_lecture"
+    paginate_by = 50
 
     def get_queryset(self):
-        if self.request.user.is_admin():
-            lectures = Lecture.objects.filter(is_active=True)
-        else:
-            lectures = Lecture.objects.viewable(self.request.user, False)
-            lectures |= Lecture.objects.editable(self.request.user).filter(
-                is_active=True
-            )
-        return sorted(lectures, key=lambda x: x.updated_at, reverse=True)
+        lectures = Lecture.objects.viewable(self.request.user).filter(is_active=True)
+        lectures = Lecture.objects.annotate_editable(lectures, self.request.user)
+        return lectures.annotate(slides_count=Count("contents")).order_by(
+            "-updated_at", "-pk"
+        )
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        for lecture in context["lectures"]:
-            lecture.is_editable = lecture.user_can_edit(self.request.user)
-        return context
+
+class _Concatenation:
+    """Querysets one after another, counted and sliced in the database"""
+
+    def __init__(self, *querysets):
+        self.querysets = querysets
+
+    @cached_property
+    def sizes(self):
+        return [queryset.count() for queryset in self.querysets]
+
+    def count(self):
+        return sum(self.sizes)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        start, stop = index.start or 0, index.stop
+        items = []
+        for queryset, size in zip(self.querysets, self.sizes):
+            if stop is not None and stop <= 0:
+                break
+            if start < size:
+                items += queryset[start:stop]
+            start = max(start - size, 0)
+            stop = None if stop is None else stop - size
+        return items
 
 
 class LectureDatabaseView(
@@ -41,6 +65,7 @@ class LectureDatabaseView(
     template_name = "lectures/lecture_database.html"
     context_object_name = "items"
     permission_required = ["lectures.view_lecturefolder", "lectures.view_lecture"]
+    paginate_by = 50
 
     def get_folder(self):
         folder_id = self.request.GET.get("folder")
@@ -74,23 +99,24 @@ class LectureDatabaseView(
             subfolders = current.subfolders.all()
         else:
             subfolders = LectureFolder.objects.base_folders()
+        subfolders = subfolders.annotate(
+            type=Value("folder", output_field=CharField())
+        ).order_by(Lower("name"), "pk")
 
         lectures = Lecture.objects.viewable_by_folder(self.request.user, current)
+        lectures = (
+            Lecture.objects.annotate_editable(lectures, self.request.user)
+            .annotate(type=Value("lecture", output_field=CharField()))
+            .order_by(Lower("name"), "pk")
+        )
 
-        for folder in subfolders:
-            folder.type = "folder"
-
-        for lecture in lectures:
-            lecture.type = "lecture"
-            lecture.is_editable = lecture.user_can_edit(self.request.user)
-
-        items = list(subfolders) + list(lectures)
-        return sorted(items, key=lambda x: (x.type, x.name.lower()))
+        return _Concatenation(subfolders, lectures)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         current = self.get_folder()
         context["current_folder"] = current
+        context["page_query"] = f"folder={current.id}&" if current else ""
         context["breadcrumbs"] = self._generate_breadcrumbs(current)
         return context
 
@@ -124,8 +150,7 @@ class LectureView(
         return lecture.user_can_view(self.request.user)
 
     def get_queryset(self):
-        contents = self.get_lecture().contents.all()
-        return sorted(contents, key=lambda x: x.order)
+        return self.get_lecture().get_contents()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -150,8 +175,7 @@ class LectureEditView(
         return lecture.user_can_edit(self.request.user)
 
     def get_queryset(self):
-        contents = self.get_lecture().contents.all()
-        return sorted(contents, key=lambda x: x.order)
+        return self.get_lecture().get_contents()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
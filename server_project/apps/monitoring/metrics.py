@@ -0,0 +1,292 @@
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger("django")
+
+COUNTER = "counter"
+HISTOGRAM = "histogram"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# the merged counts of workers that have exited
+ARCHIVE_NAME = "archive.json"
+
+
+class MetricsRegistry:
+    """
+    In-process counters and histograms that can be merged across processes.
+
+    Each uWSGI worker keeps its own registry and periodically writes a
+    snapshot to ``directory``, named after its pid. Collecting folds the
+    snapshots of workers that have exited into one archive, so the directory
+    holds a file per live worker and totals never go down, then sums them,
+    so the exported values cover the whole server, not only the worker that
+    happens to answer the scrape.
+    """
+
+    def __init__(self, directory=None, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._metrics = {}
+        self._last_flush = 0.0
+
+    def register(self, name, kind, help_text, buckets=None):
+        with self._lock:
+            self._metrics.setdefault(
+                name,
+                {"type": kind, "help": help_text, "buckets": buckets, "samples": {}},
+            )
+
+    def inc(self, name, labels, amount=1):
+        key = _label_key(labels)
+        with self._lock:
+            samples = self._metrics[name]["samples"]
+            samples[key] = samples.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        key = _label_key(labels)
+        with self._lock:
+            metric = self._metrics[name]
+            sample = metric["samples"].get(key)
+            if sample is None:
+                # one count per bucket, then sum and count
+                sample = metric["samples"][key] = [0] * (len(metric["buckets"]) + 2)
+            for i, bound in enumerate(metric["buckets"]):
+                if value <= bound:
+                    sample[i] += 1
+            sample[-2] += value
+            sample[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: {
+                    "type": metric["type"],
+                    "help": metric["help"],
+                    "buckets": metric["buckets"],
+                    "samples": [
+                        [list(key), list(value) if isinstance(value, list) else value]
+                        for key, value in metric["samples"].items()
+                    ],
+                }
+                for name, metric in self._metrics.items()
+            }
+
+    def flush(self, force=False):
+        """Write this process' snapshot, at most once per ``flush_interval``."""
+        if not self.directory:
+            return
+        # a request finding another thread flushing doesn't wait for it
+        if not self._flush_lock.acquire(blocking=force):
+            return
+        try:
+            now = time.monotonic()
+            if not force and now - self._last_flush < self.flush_interval:
+                return
+            self._last_flush = now
+            # the pid of the worker, not of the master it was forked from
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{os.getpid()}.json")
+            _write_json(path, self.snapshot())
+        except OSError as e:
+            logger.error(f"MetricsRegistry: failed to write snapshot: {e}")
+        finally:
+            self._flush_lock.release()
+
+    def collect(self):
+        """Merge the snapshots of every process into one snapshot."""
+        if not self.directory:
+            return self.snapshot()
+
+        self.flush(force=True)
+        with open(os.path.join(self.directory, ".lock"), "w") as lock:
+            # another worker answering a scrape mustn't see a snapshot both
+            # archived and not removed yet, or archive it twice
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._archive_exited()
+            paths = self._get_snapshot_paths()
+            return _merge(_read_json(path) for path in paths)
+
+    def _get_snapshot_paths(self):
+        # the archive and a snapshot per pid, any other file isn't ours
+        return [
+            path
+            for path in glob.glob(os.path.join(self.directory, "*.json"))
+            if os.path.basename(path) == ARCHIVE_NAME or _get_pid(path)
+        ]
+
+    def _archive_exited(self):
+        """Fold the snapshots of processes that have exited into the archive."""
+        archive_path = os.path.join(self.directory, ARCHIVE_NAME)
+        exited = [
+            path
+            for path in self._get_snapshot_paths()
+            if path != archive_path and not _is_running(_get_pid(path))
+        ]
+        if exited:
+            snapshots = [_read_json(path) for path in [archive_path, *exited]]
+            _write_json(archive_path, _merge(snapshots))
+            for path in exited:
+                os.remove(path)
+
+    def render(self):
+        """Render the merged metrics in the Prometheus text exposition format."""
+        lines = []
+        for name, metric in sorted(self.collect().items()):
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            for labels, value in sorted(metric["samples"], key=lambda s: s[0]):
+                labels = [tuple(pair) for pair in labels]
+                if metric["type"] == HISTOGRAM:
+                    for bound, count in zip(metric["buckets"], value):
+                        bucket_labels = _format_labels(labels + [("le", str(bound))])
+                        lines.append(f"{name}_bucket{bucket_labels} {count}")
+                    inf_labels = _format_labels(labels + [("le", "+Inf")])
+                    lines.append(f"{name}_bucket{inf_labels} {value[-1]}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {value[-2]}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {value[-1]}")
+                else:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _merge(snapshots):
+    merged = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.setdefault(
+                name,
+                {
+                    "type": metric["type"],
+                    "help": metric["help"],
+                    "buckets": metric["buckets"],
+                    "samples": {},
+                },
+            )
+            for labels, value in metric["samples"]:
+                key = tuple(tuple(pair) for pair in labels)
+                if key not in target["samples"]:
+                    target["samples"][key] = value
+                elif isinstance(value, list):
+                    target["samples"][key] = [
+                        a + b for a, b in zip(target["samples"][key], value)
+                    ]
+                else:
+                    target["samples"][key] += value
+
+    for metric in merged.values():
+        metric["samples"] = [
+            [list(key), value] for key, value in metric["samples"].items()
+        ]
+    return merged
+
+
+def _get_pid(path):
+    """Get the pid a snapshot is named after, None if it isn't a snapshot."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    return int(name) if name.isdigit() else None
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json(path, value):
+    # a temporary file per write, so that concurrent writers don't collide
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), prefix=".", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(value, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def _create_registry():
+    config = getattr(settings, "METRICS", {})
+    # snapshots are only written once share_across_workers() is called
+    registry = MetricsRegistry(flush_interval=config.get("FLUSH_INTERVAL", 5.0))
+    registry.register(
+        "http_requests_total",
+        COUNTER,
+        "Requests by route, method and status code.",
+    )
+    registry.register(
+        "http_request_duration_seconds",
+        HISTOGRAM,
+        "Request latency by route and method.",
+        buckets=LATENCY_BUCKETS,
+    )
+    registry.register(
+        "http_response_bytes_total",
+        COUNTER,
+        "Response body bytes by route and method.",
+    )
+    registry.register(
+        "db_queries_total",
+        COUNTER,
+        "Database queries by route and method.",
+    )
+    registry.register(
+        "db_query_duration_seconds_total",
+        COUNTER,
+        "Time spent in database queries by route and method.",
+    )
+    return registry
+
+
+def share_across_workers():
+    """
+    Write snapshots to METRICS['DIRECTORY'] and merge them when collecting.
+
+    Called by the WSGI and ASGI entry points only, so that tests and
+    management commands don't add to the server's totals.
+    """
+    registry.directory = getattr(settings, "METRICS", {}).get("DIRECTORY")
+
+
+registry = _create_registry()
+# keep the counts of a worker that is recycled between two flushes
+atexit.register(registry.flush, force=True)
@@ -0,0 +1,52 @@
+import time
+
+from django.db import connection
+
+from .metrics import registry
+
+
+class MetricsMiddleware:
+    """Record latency, database usage and response size per resolved route."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryCounter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = request.resolver_match
+        route = match.view_name if match else "unresolved"
+        labels = {"route": route, "method": request.method}
+
+        if response.streaming:
+            response_bytes = int(response.get("Content-Length", 0))
+        else:
+            response_bytes = len(response.content)
+
+        registry.inc(
+            "http_requests_total", {**labels, "status": str(response.status_code)}
+        )
+        registry.observe("http_request_duration_seconds", labels, duration)
+        registry.inc("http_response_bytes_total", labels, response_bytes)
+        registry.inc("db_queries_total", labels, queries.count)
+        registry.inc("db_query_duration_seconds_total", labels, queries.duration)
+        registry.flush()
+        return response
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
@@ -0,0 +1,116 @@
+import os
+import subprocess
+import sys
+import threading
+from tempfile import TemporaryDirectory
+
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from .metrics import (
+    ARCHIVE_NAME,
+    COUNTER,
+    HISTOGRAM,
+    MetricsRegistry,
+    registry,
+)
+
+
+def _make_registry(directory=None):
+    metrics = MetricsRegistry(directory=directory, flush_interval=0)
+    metrics.register("requests_total", COUNTER, "Requests.")
+    metrics.register("latency_seconds", HISTOGRAM, "Latency.", buckets=(0.1, 1.0))
+    return metrics
+
+
+def _get_sample(snapshot, name, **labels):
+    for sample_labels, value in snapshot[name]["samples"]:
+        if sorted(tuple(pair) for pair in sample_labels) == sorted(labels.items()):
+            return value
+    return None
+
+
+class MetricsRegistryTests(SimpleTestCase):
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_render(self):
+        metrics = _make_registry()
+        metrics.inc("requests_total", {"route": "home"}, 2)
+        metrics.observe("latency_seconds", {"route": "home"}, 0.5)
+
+        lines = metrics.render().splitlines()
+        self.assertIn('requests_total{route="home"} 2', lines)
+        self.assertIn('latency_seconds_bucket{route="home",le="0.1"} 0', lines)
+        self.assertIn('latency_seconds_bucket{route="home",le="1.0"} 1', lines)
+        self.assertIn('latency_seconds_bucket{route="home",le="+Inf"} 1', lines)
+        self.assertIn('latency_seconds_count{route="home"} 1', lines)
+
+    def test_snapshots_of_exited_processes_are_archived(self):
+        # a pid that is certainly not running anymore
+        process = subprocess.Popen([sys.executable, "-c", "pass"])
+        process.wait()
+        exited = _make_registry(self.directory)
+        exited.inc("requests_total", {"route": "home"}, 3)
+        exited.flush(force=True)
+        os.rename(
+            os.path.join(self.directory, f"{os.getpid()}.json"),
+            os.path.join(self.directory, f"{process.pid}.json"),
+        )
+
+        metrics = _make_registry(self.directory)
+        metrics.inc("requests_total", {"route": "home"}, 2)
+        for _ in range(2):
+            # the totals stay the same once the snapshot is archived
+            snapshot = metrics.collect()
+            self.assertEqual(_get_sample(snapshot, "requests_total", route="home"), 5)
+        names = [name for name in os.listdir(self.directory) if name.endswith("json")]
+        self.assertEqual(sorted(names), sorted([ARCHIVE_NAME, f"{os.getpid()}.json"]))
+
+    def test_concurrent_flushes(self):
+        metrics = _make_registry(self.directory)
+        errors = []
+
+        def flush():
+            try:
+                for _ in range(50):
+                    metrics.inc("requests_total", {"route": "home"})
+                    metrics.flush()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=flush) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        snapshot = metrics.collect()
+        self.assertEqual(_get_sample(snapshot, "requests_total", route="home"), 400)
+        self.assertEqual(
+            [name for name in os.listdir(self.directory) if name.endswith(".tmp")], []
+        )
+
+
+class MetricsEndpointTests(TestCase):
+    def test_requests_are_counted_per_route(self):
+        labels = {"route": "accounts:login", "method": "GET", "status": "200"}
+        before = _get_sample(registry.snapshot(), "http_requests_total", **labels)
+
+        self.client.get(reverse("accounts:login"))
+
+        after = _get_sample(registry.snapshot(), "http_requests_total", **labels)
+        self.assertEqual(after, (before or 0) + 1)
+
+    def test_token(self):
+        url = reverse("monitoring:metrics")
+        with self.settings(METRICS={"TOKEN": "secret"}):
+            self.assertEqual(self.client.get(url).status_code, 403)
+            response = self.client.get(url, HTTP_AUTHORIZATION="Bearer wrong")
+            self.assertEqual(response.status_code, 403)
+            response = self.client.get(url, HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"# TYPE http_requests_total counter", response.content)
@@ -0,0 +1,26 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from .metrics import registry
+
+
+def metrics(request):
+    """Expose the metrics of all workers in the Prometheus text format."""
+
+    if not _is_authorized(request):
+        return HttpResponseForbidden("You don't have permission to view metrics.")
+
+    return HttpResponse(
+        registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+def _is_authorized(request):
+    if request.user.is_authenticated and request.user.is_admin():
+        return True
+
+    token = getattr(settings, "METRICS", {}).get("TOKEN")
+    header = request.headers.get("Authorization", "")
+    return bool(token) and hmac.compare_digest(header, f"Bearer {token}")
@@ -0,0 +1,96 @@
+from django.urls import reverse
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework.views import APIView
+
+from .. import index
+
+DETAIL_VIEWS = {
+    "slide": "api:slide-detail",
+    "annotation": "api:annotation-detail",
+    "lecture": "api:lecture-detail",
+}
+
+
+class SearchView(APIView):
+    """Ranked full-text search over the slides, annotations and lectures."""
+
+    permission_classes = [IsAuthenticated]
+    default_limit = 20
+    max_limit = 100
+
+    def get(self, request):
+        query = request.query_params.get("q", "")
+        kinds = self._get_kinds(request)
+        limit = self._get_int("limit", self.default_limit, 1, self.max_limit)
+        offset = self._get_int("offset", 0, 0)
+
+        # one extra match tells whether there is a next page
+        matches = index.search(request.user, query, kinds, limit + 1, offset)
+        url = request.build_absolute_uri()
+        return Response(
+            {
+                "next": (
+                    replace_query_param(url, "offset", offset + limit)
+                    if len(matches) > limit
+                    else None
+                ),
+                "previous": self._get_previous_url(url, limit, offset),
+                "results": self._get_results(matches[:limit]),
+            }
+        )
+
+    def _get_kinds(self, request):
+        kinds = [
+            kind
+            for kind, (_, model) in index.KINDS.items()
+            if request.user.has_perm(
+                f"{model._meta.app_label}.view_{model._meta.model_name}"
+            )
+        ]
+        requested = request.query_params.getlist("type")
+        if requested:
+            unknown = set(requested) - set(index.KINDS)
+            if unknown:
+                raise ValidationError({"type": f"Unknown type: {', '.join(unknown)}."})
+            kinds = [kind for kind in kinds if kind in requested]
+        return kinds
+
+    def _get_int(self, name, default, minimum, maximum=None):
+        try:
+            value = int(self.request.query_params.get(name, default))
+        except ValueError:
+            raise ValidationError({name: "Must be an integer."})
+        value = max(value, minimum)
+        return min(value, maximum) if maximum else value
+
+    def _get_previous_url(self, url, limit, offset):
+        if offset <= 0:
+            return None
+        if offset <= limit:
+            return remove_query_param(url, "offset")
+        return replace_query_param(url, "offset", offset - limit)
+
+    def _get_results(self, matches):
+        objects = {}
+        for kind in {kind for kind, _ in matches}:
+            model = index.KINDS[kind][1]
+            ids = [pk for match_kind, pk in matches if match_kind == kind]
+            objects[kind] = model.objects.in_bulk(ids)
+
+        results = []
+        for kind, pk in matches:
+            obj = objects[kind].get(pk)
+            if obj is None:
+                continue
+            results.append(
+                {
+                    "type": kind,
+                    "id": pk,
+                    "name": obj.name,
+                    "url": reverse(DETAIL_VIEWS[kind], kwargs={"pk": pk}),
+                }
+            )
+        return results
@@ -0,0 +1,152 @@
+import re
+from functools import reduce
+from operator import and_
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from apps.database.models import Slide
+from apps.lectures.models import Lecture
+from apps.slide_viewer.models import Annotation
+
+TABLE = "search_index"
+
+# Every document's rowid is its object id times KIND_COUNT plus its kind, so a
+# document can be replaced or removed by rowid without a lookup.
+KIND_COUNT = 4
+KINDS = {
+    "slide": (1, Slide),
+    "annotation": (2, Annotation),
+    "lecture": (3, Lecture),
+}
+MODEL_KINDS = {model: kind for kind, (_, model) in KINDS.items()}
+
+# Matches in a title count ten times as much as matches in the body.
+RANKING = f"bm25({TABLE}, 10.0, 1.0)"
+TOKEN_PATTERN = re.compile(r"\w+")
+# shorter prefixes match too much of the index to rank it quickly
+MIN_PREFIX_LENGTH = 3
+
+
+def is_available(using=DEFAULT_DB_ALIAS):
+    return connections[using].vendor == "sqlite"
+
+
+def create_index(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Create the FTS5 table after migrating, and fill it on first creation."""
+    if not is_available(using):
+        return
+
+    with connections[using].cursor() as cursor:
+        if TABLE in connections[using].introspection.table_names(cursor):
+            return
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE {TABLE} USING fts5("
+            "title, body, tokenize = 'unicode61 remove_diacritics 2', prefix = '3')"
+        )
+    rebuild(using)
+
+
+def rebuild(using=DEFAULT_DB_ALIAS):
+    """Index every slide, annotation and lecture again from scratch."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+
+    count = 0
+    for _, model in KINDS.values():
+        queryset = model.objects.using(using).order_by()
+        if model is Slide:
+            queryset = queryset.prefetch_related("tags")
+        count += update_documents(queryset.iterator(chunk_size=2000), using)
+    return count
+
+
+def update_documents(objects, using=DEFAULT_DB_ALIAS):
+    """Add or replace the documents of slides, annotations or lectures."""
+    if not is_available(using):
+        return 0
+
+    rows = [(_get_rowid(obj), *_get_document(obj)) for obj in objects]
+    with connections[using].cursor() as cursor:
+        cursor.executemany(
+            f"DELETE FROM {TABLE} WHERE rowid = %s", [row[:1] for row in rows]
+        )
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (rowid, title, body) VALUES (%s, %s, %s)", rows
+        )
+    return len(rows)
+
+
+def delete_document(obj, using=DEFAULT_DB_ALIAS):
+    if not is_available(using):
+        return
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [_get_rowid(obj)])
+
+
+def search(user, query, kinds, limit, offset=0):
+    """
+    Get the ``(kind, id)`` of the best matches of ``query`` that ``user`` may view.
+
+    Viewability is checked inside the same query as the match, so every page
+    is full and ranked across slides, annotations and lectures.
+    """
+    terms = TOKEN_PATTERN.findall(query)
+    if not terms or not kinds:
+        return []
+    if not is_available():
+        return _search_without_index(user, terms, kinds, limit, offset)
+
+    # every term has to match, the last one may still be typed
+    match = " ".join(f'"{term}"' for term in terms)
+    if len(terms[-1]) >= MIN_PREFIX_LENGTH:
+        match += "*"
+
+    clauses, params = [], [match]
+    for kind in kinds:
+        code, model = KINDS[kind]
+        viewable = (
+            model.objects.viewable(user)
+            .filter(id=RawSQL(f"{TABLE}.rowid / {KIND_COUNT}", []))
+            .order_by()
+            .values("id")
+        )
+        sql, viewable_params = viewable.query.sql_with_params()
+        clauses.append(f"(rowid %% {KIND_COUNT} = {code} AND EXISTS ({sql}))")
+        params.extend(viewable_params)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s "
+            f"AND ({' OR '.join(clauses)}) ORDER BY {RANKING} LIMIT %s OFFSET %s",
+            params + [limit, offset],
+        )
+        rowids = [rowid for (rowid,) in cursor.fetchall()]
+
+    codes = {code: kind for kind, (code, _) in KINDS.items()}
+    return [(codes[rowid % KIND_COUNT], rowid // KIND_COUNT) for rowid in rowids]
+
+
+def _search_without_index(user, terms, kinds, limit, offset):
+    """Substring search by name for databases without FTS5, unranked."""
+    matches = []
+    for kind in kinds:
+        model = KINDS[kind][1]
+        condition = reduce(and_, (Q(name__icontains=term) for term in terms))
+        ids = model.objects.viewable(user).filter(condition).values_list("id")
+        matches.extend((kind, pk) for (pk,) in ids.distinct())
+    return matches[offset : offset + limit]
+
+
+def _get_rowid(obj):
+    return obj.pk * KIND_COUNT + KINDS[MODEL_KINDS[type(obj)]][0]
+
+
+def _get_document(obj):
+    if isinstance(obj, Slide):
+        body = [obj.information, *(tag.name for tag in obj.tags.all())]
+    else:
+        body = [obj.description]
+    return obj.name or "", "\n".join(filter(None, body))
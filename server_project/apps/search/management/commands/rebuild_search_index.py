@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from apps.search import index
+
+
+class Command(BaseCommand):
+    help = (
+        "Index every slide, annotation and lecture again, e.g. after they were "
+        "changed without signals by bulk_create() or update()."
+    )
+
+    def handle(self, *args, **options):
+        if not index.is_available():
+            raise CommandError("The search index needs an SQLite database.")
+
+        with transaction.atomic():
+            count = index.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} documents."))
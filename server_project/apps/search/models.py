@@ -0,0 +1,63 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from apps.database.models import Slide, Tag
+from apps.lectures.models import Lecture
+from apps.slide_viewer.models import Annotation
+from apps.slide_viewer.signals import annotations_imported
+from . import index
+
+
+@receiver(post_save, sender=Slide)
+@receiver(post_save, sender=Annotation)
+@receiver(post_save, sender=Lecture)
+def update_document(sender, instance, using, **kwargs):
+    index.update_documents([instance], using)
+
+
+@receiver(annotations_imported)
+def update_imported_annotations(sender, annotations, **kwargs):
+    index.update_documents(annotations)
+
+
+@receiver(post_delete, sender=Slide)
+@receiver(post_delete, sender=Annotation)
+@receiver(post_delete, sender=Lecture)
+def delete_document(sender, instance, using, **kwargs):
+    index.delete_document(instance, using)
+
+
+@receiver(m2m_changed, sender=Tag.slides.through)
+def update_tagged_slides(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if isinstance(instance, Slide):
+        if action.startswith("post_"):
+            index.update_documents([instance], using)
+        return
+
+    if action == "pre_clear":
+        instance._search_slide_ids = list(instance.slides.values_list("id", flat=True))
+    elif action == "post_clear":
+        _update_slides(instance._search_slide_ids, using)
+    elif action in ("post_add", "post_remove"):
+        _update_slides(pk_set, using)
+
+
+@receiver(post_save, sender=Tag)
+def update_renamed_tag(sender, instance, created, using, **kwargs):
+    if not created:
+        _update_slides(instance.slides.values_list("id", flat=True), using)
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tagged_slides(sender, instance, **kwargs):
+    instance._search_slide_ids = list(instance.slides.values_list("id", flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def update_untagged_slides(sender, instance, using, **kwargs):
+    _update_slides(instance._search_slide_ids, using)
+
+
+def _update_slides(ids, using):
+    slides = Slide.objects.using(using).filter(id__in=ids).prefetch_related("tags")
+    index.update_documents(slides, using)
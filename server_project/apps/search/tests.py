@@ -0,0 +1,170 @@
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from apps.accounts.models import GroupProfile, User
+from apps.database.models import Slide, Tag
+from apps.database.tests import LargeDatasetTestCase
+from apps.lectures.models import Lecture
+from apps.slide_viewer.models import Annotation
+from . import index
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "Admin", "User")
+        groups = []
+        for name in ("pathology", "anatomy"):
+            group = Group.objects.create(name=name)
+            GroupProfile.objects.create(
+                group=group, type=GroupProfile.TypeChoices.PUBLISHER
+            )
+            groups.append(group)
+        cls.publisher = User.objects.create_user("pathologist", "Patho", "Logist")
+        cls.publisher.groups.add(groups[0])
+        cls.publisher.save()  # creates the base lecture folder
+
+        students = Group.objects.create(name="students")
+        GroupProfile.objects.create(
+            group=students, type=GroupProfile.TypeChoices.VIEWER
+        )
+        cls.viewer = User.objects.create_user("student", "Stu", "Dent")
+        cls.viewer.groups.add(students)
+
+        pathology, anatomy = (group.profile.base_folder for group in groups)
+        slides = Slide.objects.bulk_create(
+            Slide(
+                name=name,
+                file=f"slides/{name.lower()}.svs",
+                image_root=f"images/{name.lower()}",
+                information="Liver tissue",
+                is_public=is_public,
+                folder=folder,
+            )
+            for name, folder, is_public in (
+                ("Cirrhosis", None, True),
+                ("Hepatitis", pathology, False),
+                ("Steatosis", anatomy, False),
+                ("Fibrosis", anatomy, True),
+            )
+        )
+        Annotation.objects.bulk_create(
+            Annotation(
+                name="Portal tract",
+                description="Liver cells",
+                author=author,
+                slide=slide,
+            )
+            for slide in slides
+            for author in (cls.admin, cls.publisher, cls.viewer)
+        )
+        lectures = Lecture.objects.bulk_create(
+            Lecture(
+                name=f"Liver {topic}",
+                author=cls.publisher,
+                folder=cls.publisher.base_lecture_folder,
+                is_active=is_active,
+            )
+            for topic, is_active in (
+                ("anatomy", True),
+                ("pathology", True),
+                ("histology", False),
+            )
+        )
+        for lecture in lectures[::2]:
+            lecture.groups.add(students)
+        # bulk_create() sends no signals
+        index.rebuild()
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, user, **params):
+        """Get the ``(type, id)`` of every result, following the next links."""
+        self.client.force_login(user)
+        url = reverse("api:search")
+        params.setdefault("limit", 100)
+
+        results = []
+        while url:
+            page = self.client.get(url, params).json()
+            results.extend((result["type"], result["id"]) for result in page["results"])
+            url, params = page["next"], None
+        return results
+
+    def test_results_are_viewable(self):
+        managers = {
+            "slide": Slide.objects,
+            "annotation": Annotation.objects,
+            "lecture": Lecture.objects,
+        }
+        for user in (self.admin, self.publisher, self.viewer):
+            for kind, manager in managers.items():
+                with self.subTest(user=user.username, type=kind):
+                    results = self.search(user, q="liver", type=kind)
+                    expected = manager.viewable(user)
+                    self.assertEqual(
+                        sorted(pk for _, pk in results),
+                        sorted(set(expected.values_list("id", flat=True))),
+                    )
+
+    def test_title_matches_rank_first(self):
+        slide = Slide.objects.filter(is_public=True).last()
+        slide.name = "Glomerulus"
+        slide.save()
+        Annotation.objects.filter(pk=Annotation.objects.first().pk).update(
+            description="Next to the glomerulus"
+        )
+        index.update_documents([Annotation.objects.first()])
+
+        results = self.search(self.viewer, q="glomerulus")
+        self.assertEqual(results[0], ("slide", slide.pk))
+
+    def test_prefix_of_last_term_matches(self):
+        results = self.search(self.admin, q="Live", type="lecture")
+        self.assertEqual(len(results), Lecture.objects.count())
+
+    def test_signals_keep_index_in_sync(self):
+        slide = Slide.objects.filter(is_public=True).first()
+        tag = Tag.objects.create(name="Nephropathology")
+
+        slide.tags.add(tag)
+        self.assertEqual(self.search(self.viewer, q="nephro"), [("slide", slide.pk)])
+
+        tag.name = "Hepatology"
+        tag.save()
+        self.assertEqual(self.search(self.viewer, q="nephro"), [])
+        self.assertEqual(self.search(self.viewer, q="hepato"), [("slide", slide.pk)])
+
+        tag.delete()
+        self.assertEqual(self.search(self.viewer, q="hepato"), [])
+
+        pk = slide.pk
+        slide.delete()
+        self.assertNotIn(("slide", pk), self.search(self.admin, q=slide.name))
+
+    def test_unknown_type_is_rejected(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("api:search"), {"q": "x", "type": "folder"})
+        self.assertEqual(response.status_code, 400)
+
+
+class SearchQueryCountTests(LargeDatasetTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # the data set is created with bulk_create(), which sends no signals
+        index.rebuild()
+
+    def test_search_admin(self):
+        self.assertBoundedRequest(self.admin, f"{reverse('api:search')}?q=generated")
+
+    def test_search_publisher(self):
+        self.assertBoundedRequest(
+            self.publisher, f"{reverse('api:search')}?q=generated"
+        )
+
+    def test_search_viewer(self):
+        self.assertBoundedRequest(self.viewer, f"{reverse('api:search')}?q=generated")
@@ -1,24 +1,113 @@
+from collections import Counter
+
 from rest_framework import serializers
 
-from ..models import Annotation
+from apps.database.api.mixins import SparseFieldsetsMixin
+from ..codec import decode_shape, encode_shape
+from ..models import Annotation, AnnotationRevision, AnnotationShape
+from ..simplify import apply_level, get_level
+
+
+def get_level_param(request):
+    """
+    Get the level of detail for ``?scale=``, the screen pixels per image
+    pixel of the viewer, or None for full detail.
+    """
+    if "scale" not in request.query_params:
+        return None
+    try:
+        return get_level(float(request.query_params["scale"]))
+    except ValueError:
+        raise serializers.ValidationError({"scale": "Expected a positive number."})
+
+
+def get_encoding_param(request):
+    """Whether ``?encoding=compact`` asks for shapes with encoded points."""
+    encoding = request.query_params.get("encoding", "json")
+    if encoding not in ("json", "compact"):
+        raise serializers.ValidationError({"encoding": "Expected json or compact."})
+    return encoding == "compact"
+
+
+def decode_shape_field(shape):
+    """Decode the points of a shape sent by a client, if they are encoded."""
+    try:
+        return decode_shape(shape)
+    except ValueError:
+        raise serializers.ValidationError("The encoded points are invalid.")
+
 
+def decode_shapes_field(shapes):
+    """Decode the shapes sent by a client, whose ids must be unique."""
+    counts = Counter(
+        str(shape["id"])
+        for shape in shapes
+        if isinstance(shape, dict) and "id" in shape
+    )
+    repeated = [shape_id for shape_id, count in counts.items() if count > 1]
+    if repeated:
+        raise serializers.ValidationError(
+            f"Shape ids must be unique, repeated: {', '.join(repeated)}."
+        )
+    return [decode_shape_field(shape) for shape in shapes]
+
+
+class AnnotationListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        annotations = list(data.all() if hasattr(data, "all") else data)
+        level = self.child.context.get("level")
+        if level is not None and "data" in self.child.fields:
+            # one query for the simplified shapes of every annotation
+            self.child.levels = AnnotationShape.objects.get_levels(
+                [annotation.pk for annotation in annotations], level
+            )
+        return super().to_representation(annotations)
+
+
+class AnnotationSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    heavy_fields = ("data",)
 
-class AnnotationSerializer(serializers.ModelSerializer):
     author = serializers.CharField(source="author.username", default=None)
 
+    levels = None
+
     class Meta:
         model = Annotation
+        list_serializer_class = AnnotationListSerializer
         fields = [
             "id",
             "name",
             "description",
             "data",
+            "version",
             "slide",
             "author",
             "created_at",
             "updated_at",
         ]
-        read_only_fields = ["author"]
+        read_only_fields = ["author", "version"]
+
+    def to_representation(self, instance):
+        """Apply the requested level of detail and encoding to the shapes."""
+        data = super().to_representation(instance)
+        level = self.context.get("level")
+        if level is not None and data.get("data"):
+            if self.levels is None:
+                self.levels = AnnotationShape.objects.get_levels([instance.pk], level)
+            points = self.levels.get(instance.pk, {})
+            data["data"] = [
+                apply_level(shape, points.get(str(shape.get("id"))))
+                for shape in data["data"]
+            ]
+        if isinstance(data.get("data"), list):
+            code = encode_shape if self.context.get("compact") else decode_shape
+            data["data"] = [code(shape) for shape in data["data"]]
+        return data
+
+    def validate_data(self, value):
+        if isinstance(value, list):
+            return decode_shapes_field(value)
+        return value
 
     def validate(self, attrs):
         user = self.context["request"].user
@@ -32,3 +121,43 @@ class AnnotationSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(errors)
 
         return super().validate(attrs)
+
+
+class ShapeOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=["add", "modify", "delete"])
+    id = serializers.CharField(required=False)
+    shape = serializers.DictField(required=False)
+
+    def validate(self, attrs):
+        if attrs["op"] != "add" and "id" not in attrs:
+            raise serializers.ValidationError({"id": "This field is required."})
+        if attrs["op"] != "delete" and "shape" not in attrs:
+            raise serializers.ValidationError({"shape": "This field is required."})
+        return attrs
+
+    def validate_shape(self, value):
+        return decode_shape_field(value)
+
+
+class AnnotationShapesSerializer(serializers.Serializer):
+    version = serializers.IntegerField(min_value=0)
+    operations = ShapeOperationSerializer(many=True, allow_empty=False)
+
+
+class AnnotationImportSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=100)
+    description = serializers.CharField(
+        required=False, allow_blank=True, allow_null=True
+    )
+    data = serializers.ListField(child=serializers.DictField(), required=False)
+
+    def validate_data(self, value):
+        return decode_shapes_field(value)
+
+
+class AnnotationRevisionSerializer(serializers.ModelSerializer):
+    snapshot = serializers.BooleanField(source="is_snapshot", read_only=True)
+
+    class Meta:
+        model = AnnotationRevision
+        fields = ["version", "name", "description", "snapshot", "size", "created_at"]
@@ -1,23 +1,84 @@
+import json
 import logging
+from collections import Counter
 
+from django.db import IntegrityError
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import timezone
-from rest_framework import viewsets
-from rest_framework.exceptions import PermissionDenied
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
 from rest_framework.permissions import IsAuthenticated, DjangoModelPermissions
 from rest_framework.response import Response
 
-from .serializers import AnnotationSerializer
-from ..models import Annotation
+from apps.caching.cache import get_or_set
+from apps.database.models import Folder, Slide
+from apps.lectures.models import Lecture, LectureContent
+from .serializers import (
+    AnnotationImportSerializer,
+    AnnotationRevisionSerializer,
+    AnnotationSerializer,
+    AnnotationShapesSerializer,
+    get_encoding_param,
+    get_level_param,
+)
+from ..codec import decode_shape, encode_shape
+from ..geojson import (
+    parse_feature_collection,
+    parse_ndjson,
+    stream_geojson,
+    stream_ndjson,
+)
+from ..models import (
+    Annotation,
+    AnnotationRevision,
+    AnnotationShape,
+    AnnotationShapeManager,
+    VersionConflict,
+)
+from ..overlay import (
+    FORMATS,
+    get_overlay_dzi,
+    get_tile_bounds,
+    get_tile_rect,
+    parse_dzi,
+    render_tile,
+)
+from ..simplify import get_level
 
 logger = logging.getLogger("django")
 
 
 class AnnotationViewSet(viewsets.ModelViewSet):
+    # the most annotations a single import may create
+    MAX_IMPORT_ANNOTATIONS = 10000
+
     serializer_class = AnnotationSerializer
     permission_classes = [IsAuthenticated, DjangoModelPermissions]
 
     def get_queryset(self):
-        return Annotation.objects.viewable(self.request.user)
+        queryset = Annotation.objects.viewable(self.request.user).select_related(
+            "author"
+        )
+        if self.action == "list":
+            queryset = queryset.defer(
+                *AnnotationSerializer.get_deferred_fields(self.request)
+            )
+        elif self.action == "shapes":
+            # the shapes are read after the version is claimed
+            queryset = queryset.defer("data")
+        elif self.action in ("overlay_dzi", "overlay_tile", "revisions", "revision"):
+            # the overlay reads the indexed shapes, revisions their own
+            queryset = queryset.defer("data")
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request.method == "GET":
+            context["level"] = get_level_param(self.request)
+            context["compact"] = get_encoding_param(self.request)
+        return context
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
@@ -55,6 +116,282 @@ class AnnotationViewSet(viewsets.ModelViewSet):
         )
         return Response(data)
 
+    @action(detail=True, methods=["patch"])
+    def shapes(self, request, pk=None):
+        """
+        Apply shape operations without sending the whole ``data`` array.
+
+        The body holds the ``version`` the edit is based on and a list of
+        ``operations``, each ``{"op": "add", "shape": {...}}``,
+        ``{"op": "modify", "id": ..., "shape": {...}}`` (merged into the
+        shape) or ``{"op": "delete", "id": ...}``. A stale version is
+        answered with 409 and the current version.
+        """
+        annotation = self.get_object()
+        self._check_edit_permissions(annotation)
+
+        serializer = AnnotationShapesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            added = annotation.apply_shape_operations(
+                serializer.validated_data["operations"],
+                serializer.validated_data["version"],
+            )
+        except VersionConflict as e:
+            return Response(
+                {"detail": str(e), "version": e.version},
+                status=status.HTTP_409_CONFLICT,
+            )
+        except ValueError as e:
+            raise ValidationError({"operations": str(e)})
+
+        logger.info(f"Annotation '{annotation.name}' patched by {request.user}")
+        return Response({"version": annotation.version, "added": added})
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """
+        Stream the viewable annotations of a ``?slide=``, a ``?folder=`` and
+        its subfolders or a ``?lecture=``, as a GeoJSON FeatureCollection or,
+        with ``?output=ndjson``, an annotation per line. Annotations are read
+        in chunks, so memory doesn't grow with the export.
+        """
+        output = request.query_params.get("output", "geojson")
+        if output not in ("geojson", "ndjson"):
+            raise ValidationError({"output": "Expected geojson or ndjson."})
+
+        annotations = self._get_export_scope(self.get_queryset())
+        annotations = annotations.order_by("slide", "pk").iterator(
+            chunk_size=AnnotationShapeManager.BATCH_SIZE
+        )
+        if output == "ndjson":
+            content = stream_ndjson(annotations, get_encoding_param(request))
+            content_type = "application/x-ndjson"
+        else:
+            content = stream_geojson(annotations)
+            content_type = "application/geo+json"
+
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response["Content-Disposition"] = (
+            f'attachment; filename="annotations.{output}"'
+        )
+        logger.info(f"Annotations exported as {output} by {request.user}")
+        return response
+
+    @action(detail=False, methods=["post"], url_path="import")
+    def import_annotations(self, request):
+        """
+        Create annotations on a ``?slide=`` in one transaction, from a GeoJSON
+        FeatureCollection, a JSON list of annotations or, sent as
+        ``application/x-ndjson``, an annotation per line. Nothing is created
+        unless every annotation is valid.
+        """
+        slide = self._get_param_object(Slide.objects.all(), "slide")
+        if slide is None:
+            raise ValidationError({"slide": "This parameter is required."})
+        if not slide.user_can_view(request.user):
+            raise PermissionDenied("You don't have permission to view this slide.")
+
+        try:
+            if "ndjson" in request.content_type:
+                items = parse_ndjson(request.body.decode().splitlines())
+            else:
+                items = json.loads(request.body)
+                if isinstance(items, dict):
+                    items = parse_feature_collection(items)
+        except (ValueError, UnicodeDecodeError) as e:
+            raise ValidationError({"detail": str(e) or "Invalid body."})
+        if not isinstance(items, list):
+            raise ValidationError({"detail": "Expected a list of annotations."})
+        if len(items) > self.MAX_IMPORT_ANNOTATIONS:
+            raise ValidationError(
+                {
+                    "detail": f"At most {self.MAX_IMPORT_ANNOTATIONS} annotations "
+                    "can be imported at once."
+                }
+            )
+
+        serializer = AnnotationImportSerializer(data=items, many=True)
+        serializer.is_valid(raise_exception=True)
+        annotations = serializer.validated_data
+
+        names = [annotation["name"] for annotation in annotations]
+        taken = set(
+            Annotation.objects.filter(
+                slide=slide, author=request.user, name__in=names
+            ).values_list("name", flat=True)
+        )
+        counts = Counter(names)
+        duplicates = sorted(
+            name for name, count in counts.items() if name in taken or count > 1
+        )
+        if duplicates:
+            raise ValidationError(
+                {"name": f"Annotation names must be unique: {', '.join(duplicates)}"}
+            )
+
+        created = Annotation.objects.bulk_import(slide, request.user, annotations)
+        logger.info(
+            f"{len(created)} annotations imported to '{slide}' by {request.user}"
+        )
+        return Response(
+            {"created": [annotation.pk for annotation in created]},
+            status=status.HTTP_201_CREATED,
+        )
+
+    @action(detail=True, methods=["get"], url_path="overlay.dzi")
+    def overlay_dzi(self, request, pk=None):
+        """
+        Get the DZI of a raster overlay of the annotation, for OpenSeadragon
+        to add over the slide. ``?output=webp`` asks for WebP tiles instead
+        of PNG.
+        """
+        output = request.query_params.get("output", "png")
+        if output not in FORMATS:
+            raise ValidationError({"output": "Expected png or webp."})
+
+        annotation = self.get_object()
+        _, dzi = self._get_slide_dzi(annotation)
+        return HttpResponse(
+            get_overlay_dzi(dzi, output), content_type="application/xml"
+        )
+
+    @action(
+        detail=True,
+        methods=["get"],
+        url_path=(
+            r"overlay_files/(?P<level>\d+)/(?P<col>\d+)_(?P<row>\d+)"
+            r"\.(?P<tile_format>png|webp)"
+        ),
+    )
+    def overlay_tile(self, request, level, col, row, tile_format, pk=None):
+        """
+        Get a tile of the raster overlay, drawn from the shapes intersecting
+        it at the level of detail of its zoom level, and cached until the
+        annotation or its slide changes.
+        """
+        annotation = self.get_object()
+        level, col, row = int(level), int(col), int(row)
+
+        def render():
+            slide, dzi = self._get_slide_dzi(annotation)
+            scale, rect = get_tile_rect(parse_dzi(dzi), level, col, row)
+            shapes = AnnotationShape.objects.intersecting(
+                slide, *get_tile_bounds(scale, rect)
+            ).filter(annotation=annotation)
+            detail = get_level(scale)
+            if detail is None:
+                rows = [(data, None) for data in shapes.values_list("data", flat=True)]
+            else:
+                rows = shapes.values_list("data", f"levels__{detail}")
+            return render_tile(rows, scale, rect, tile_format)
+
+        try:
+            tile = get_or_set(
+                [f"annotation:{annotation.pk}", f"slide:{annotation.slide_id}"],
+                "overlay-tile",
+                render,
+                params=(level, col, row, tile_format),
+            )
+        except ValueError as e:
+            raise NotFound(str(e))
+        return HttpResponse(tile, content_type=f"image/{tile_format}")
+
+    @action(detail=True, methods=["get"])
+    def revisions(self, request, pk=None):
+        """List the revisions of the annotation, without their shapes."""
+        annotation = self.get_object()
+        revisions = (
+            AnnotationRevision.objects.filter(annotation=annotation)
+            .annotate(
+                is_snapshot=ExpressionWrapper(
+                    Q(delta__isnull=True), output_field=BooleanField()
+                )
+            )
+            .defer("snapshot", "delta")
+        )
+        return Response(AnnotationRevisionSerializer(revisions, many=True).data)
+
+    @action(detail=True, methods=["get"], url_path=r"revisions/(?P<version>\d+)")
+    def revision(self, request, version, pk=None):
+        """Get a revision with its shapes, rebuilt from snapshot and deltas."""
+        annotation = self.get_object()
+        revision = self._get_revision(annotation, version)
+        revision.is_snapshot = revision.delta is None
+
+        data = AnnotationRevisionSerializer(revision).data
+        if isinstance(revision.data, list):
+            code = encode_shape if get_encoding_param(request) else decode_shape
+            data["data"] = [code(shape) for shape in revision.data]
+        else:
+            data["data"] = revision.data
+        return Response(data)
+
+    @action(
+        detail=True,
+        methods=["post"],
+        url_path=r"revisions/(?P<version>\d+)/restore",
+    )
+    def restore(self, request, version, pk=None):
+        """Save a revision as the newest version of the annotation."""
+        annotation = self.get_object()
+        self._check_edit_permissions(annotation)
+
+        try:
+            annotation.restore(int(version))
+        except AnnotationRevision.DoesNotExist as e:
+            raise NotFound(str(e))
+        except IntegrityError:
+            raise ValidationError(
+                {"name": "Another annotation on the slide has this name."}
+            )
+        logger.info(
+            f"Annotation '{annotation.name}' restored to version {version} "
+            f"by {request.user}"
+        )
+        return Response(self.get_serializer(annotation).data)
+
+    def _get_revision(self, annotation, version):
+        try:
+            return AnnotationRevision.objects.get_version(annotation, int(version))
+        except AnnotationRevision.DoesNotExist as e:
+            raise NotFound(str(e))
+
+    def _get_slide_dzi(self, annotation):
+        slide = annotation.slide
+        dzi = slide.get_dzi()
+        if dzi is None:
+            raise NotFound("DZI file not found.")
+        return slide, dzi
+
+    def _get_export_scope(self, annotations):
+        user = self.request.user
+        slide = self._get_param_object(Slide.objects.all(), "slide")
+        folder = self._get_param_object(Folder.objects.all(), "folder")
+        lecture = self._get_param_object(Lecture.objects.viewable(user), "lecture")
+        if sum(scope is not None for scope in (slide, folder, lecture)) != 1:
+            raise ValidationError(
+                {"detail": "Expected exactly one of slide, folder or lecture."}
+            )
+
+        if slide is not None:
+            return annotations.filter(slide=slide)
+        if folder is not None:
+            return annotations.filter(slide__folder__path__startswith=folder.path)
+        contents = LectureContent.objects.filter(lecture=lecture)
+        return annotations.filter(pk__in=contents.values("annotation"))
+
+    def _get_param_object(self, queryset, name):
+        if name not in self.request.query_params:
+            return None
+        try:
+            obj = queryset.filter(pk=int(self.request.query_params[name])).first()
+        except ValueError:
+            obj = None
+        if obj is None:
+            raise ValidationError({name: "Not found."})
+        return obj
+
     def _check_edit_permissions(self, annotation):
         if not annotation.user_can_edit(self.request.user):
             raise PermissionDenied("You don't have permission to edit this annotation.")
\ No newline at end of file
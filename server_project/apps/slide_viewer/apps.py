@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class SlideViewerConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.slide_viewer"
+
+    def ready(self):
+        from .spatial import create_index
+
+        post_migrate.connect(create_index, sender=self)
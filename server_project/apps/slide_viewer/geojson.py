@@ -0,0 +1,144 @@
+"""
+Conversion of annotations to and from GeoJSON features and NDJSON lines.
+
+Every shape becomes a feature, with level-0 pixel coordinates and y going
+down the slide. Points become a Point (or MultiPoint), polygons a Polygon
+with a closed ring and any other shape a LineString. Annotations without
+shapes become a feature without geometry, so they survive a round trip.
+"""
+
+import json
+
+from .codec import decode_shape, encode_shape
+
+GEOMETRY_TYPES = {
+    "Point": "point",
+    "MultiPoint": "point",
+    "Polygon": "polygon",
+    "LineString": "line",
+}
+
+
+def get_features(annotation):
+    properties = {
+        "annotation": annotation.pk,
+        "name": annotation.name,
+        "description": annotation.description,
+        "author": annotation.author.username if annotation.author else None,
+        "slide": annotation.slide_id,
+    }
+    shapes = [decode_shape(shape) for shape in annotation.data or []]
+    if not shapes:
+        yield {"type": "Feature", "geometry": None, "properties": properties}
+
+    for shape in shapes:
+        shape = dict(shape)
+        points = shape.pop("points", None)
+        yield {
+            "type": "Feature",
+            "geometry": _get_geometry(shape.get("type"), points),
+            "properties": {**properties, "shape": shape},
+        }
+
+
+def stream_geojson(annotations):
+    """Yield a FeatureCollection of annotations piece by piece."""
+    yield '{"type": "FeatureCollection", "features": [\n'
+    separator = ""
+    for annotation in annotations:
+        for feature in get_features(annotation):
+            yield separator + json.dumps(feature)
+            separator = ",\n"
+    yield "\n]}\n"
+
+
+def stream_ndjson(annotations, compact=False):
+    """Yield an annotation per line, as the annotation API represents it."""
+    code = encode_shape if compact else decode_shape
+    for annotation in annotations:
+        line = {
+            "id": annotation.pk,
+            "name": annotation.name,
+            "description": annotation.description,
+            "data": [code(shape) for shape in annotation.data or []],
+            "slide": annotation.slide_id,
+            "author": annotation.author.username if annotation.author else None,
+        }
+        yield json.dumps(line) + "\n"
+
+
+def parse_feature_collection(collection):
+    """
+    Group the features of a FeatureCollection into annotations, by their
+    ``annotation`` property, or by their name when they have none.
+    """
+    if (
+        not isinstance(collection, dict)
+        or collection.get("type") != "FeatureCollection"
+    ):
+        raise ValueError("Expected a GeoJSON FeatureCollection.")
+
+    annotations = {}
+    for i, feature in enumerate(collection.get("features") or []):
+        if not isinstance(feature, dict) or feature.get("type") != "Feature":
+            raise ValueError(f"Feature {i} is not a GeoJSON Feature.")
+        properties = feature.get("properties") or {}
+        key = properties.get("annotation") or properties.get("name")
+        annotation = annotations.setdefault(
+            key,
+            {
+                "name": properties.get("name"),
+                "description": properties.get("description"),
+                "data": [],
+            },
+        )
+        if feature.get("geometry"):
+            shape = dict(properties.get("shape") or {})
+            shape.setdefault("type", _get_shape_type(feature["geometry"], i))
+            shape["points"] = _get_points(feature["geometry"], i)
+            annotation["data"].append(shape)
+    return list(annotations.values())
+
+
+def parse_ndjson(lines):
+    """Parse an annotation per non-empty line."""
+    annotations = []
+    for i, line in enumerate(lines):
+        if line.strip():
+            try:
+                annotations.append(json.loads(line))
+            except json.JSONDecodeError:
+                raise ValueError(f"Line {i + 1} is not valid JSON.")
+    return annotations
+
+
+def _get_geometry(shape_type, points):
+    if not points:
+        return None
+    if shape_type == "point":
+        if len(points) == 1:
+            return {"type": "Point", "coordinates": points[0]}
+        return {"type": "MultiPoint", "coordinates": points}
+    if shape_type == "polygon":
+        ring = points if points[0] == points[-1] else [*points, points[0]]
+        return {"type": "Polygon", "coordinates": [ring]}
+    return {"type": "LineString", "coordinates": points}
+
+
+def _get_shape_type(geometry, i):
+    if geometry.get("type") not in GEOMETRY_TYPES:
+        raise ValueError(f"Feature {i} has an unsupported geometry.")
+    return GEOMETRY_TYPES[geometry["type"]]
+
+
+def _get_points(geometry, i):
+    coordinates = geometry.get("coordinates")
+    try:
+        if geometry["type"] == "Point":
+            return [coordinates]
+        if geometry["type"] == "Polygon":
+            # the outer ring, without the point closing it
+            return coordinates[0][:-1]
+        return list(coordinates)
+    except (TypeError, IndexError, KeyError):
+        raise ValueError(f"Feature {i} has invalid coordinates.")
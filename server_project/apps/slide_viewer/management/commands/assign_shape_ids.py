@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from apps.slide_viewer.models import Annotation
+
+
+class Command(BaseCommand):
+    help = (
+        "Give every shape of annotations saved before shapes had ids a stable "
+        "id, so they can be edited with shape operations."
+    )
+
+    def handle(self, *args, **options):
+        updated = 0
+        annotations = Annotation.objects.filter(data__isnull=False).only("data")
+        for annotation in annotations.iterator():
+            if all("id" in shape for shape in annotation.data):
+                continue
+            # the shapes themselves don't change, so neither does the version
+            annotation.save(update_fields=["data"])
+            updated += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Updated {updated} annotations."))
@@ -0,0 +1,67 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from apps.slide_viewer.models import Annotation, AnnotationShape
+
+
+class Command(BaseCommand):
+    help = (
+        "Rewrite shapes stored with JSON points in the compact "
+        "encoding, as migrating does once, and report the storage and parse "
+        "time before and after."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only measure, without writing anything.",
+        )
+
+    def handle(self, *args, **options):
+        for model in (Annotation, AnnotationShape):
+            self.compact(model, options["dry_run"])
+
+    def compact(self, model, dry_run):
+        field = model._meta.get_field("data")
+        table, column = model._meta.db_table, field.column
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT id, {column} FROM {table} WHERE {column} IS NOT NULL"
+            )
+            rows = cursor.fetchall()
+
+        before = after = parse_before = parse_after = 0
+        changed = []
+        for pk, text in rows:
+            if not isinstance(text, str):
+                # drivers decoding JSON columns themselves
+                text = json.dumps(text)
+            start = time.perf_counter()
+            value = json.loads(text)
+            parse_before += time.perf_counter() - start
+
+            compact = json.dumps(field.get_prep_value(value), cls=field.encoder)
+            start = time.perf_counter()
+            json.loads(compact)
+            parse_after += time.perf_counter() - start
+
+            before += len(text)
+            after += len(compact)
+            if compact != text:
+                changed.append((pk, value))
+
+        if not dry_run:
+            with transaction.atomic():
+                for pk, value in changed:
+                    model.objects.filter(pk=pk).update(data=value)
+
+        self.stdout.write(
+            f"{model.__name__}: {len(changed)} of {len(rows)} rows "
+            f"{'to rewrite' if dry_run else 'rewritten'}, "
+            f"{before / 1e6:.1f} MB -> {after / 1e6:.1f} MB, "
+            f"parse {parse_before * 1000:.0f} ms -> {parse_after * 1000:.0f} ms"
+        )
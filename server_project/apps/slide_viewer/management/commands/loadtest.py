@@ -0,0 +1,482 @@
+import http.cookiejar
+import json
+import math
+import random
+import re
+import secrets
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import xml.etree.ElementTree as ET
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.urls import reverse
+
+from apps.accounts.models import GroupProfile
+from apps.database.models import Slide
+
+User = get_user_model()
+
+QUERY_COUNT_HEADER = "X-Loadtest-Queries"
+PROFILES = ("constant", "linear", "step", "spike")
+DZI_NAMESPACE = "{http://schemas.microsoft.com/deepzoom/2008}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate a classroom of users opening slides and panning/zooming them "
+        "like OpenSeadragon does, and report latency, throughput, error rate and "
+        "database queries per endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            help="Base URL of a running server. If omitted, a local server is "
+            "started in-process and database queries are counted per request.",
+        )
+        parser.add_argument("--users", type=int, default=10)
+        parser.add_argument(
+            "--slides",
+            type=int,
+            nargs="*",
+            help="Slide ids to open. Defaults to every public slide.",
+        )
+        parser.add_argument("--duration", type=float, default=60.0, help="Seconds.")
+        parser.add_argument("--profile", choices=PROFILES, default="linear")
+        parser.add_argument(
+            "--ramp-up",
+            type=float,
+            default=10.0,
+            help="Seconds until every user is active.",
+        )
+        parser.add_argument(
+            "--steps",
+            type=int,
+            default=20,
+            help="Pan/zoom moves per slide before opening the next one.",
+        )
+        parser.add_argument(
+            "--think-time",
+            type=float,
+            default=0.5,
+            help="Mean pause between moves in seconds.",
+        )
+        parser.add_argument("--viewport", default="1280x800", help="WIDTHxHEIGHT")
+        parser.add_argument(
+            "--group",
+            default="Load Test",
+            help="Group for the synthetic users. A viewer group is created if missing.",
+        )
+        parser.add_argument("--username-prefix", default="loadtest")
+        parser.add_argument(
+            "--password",
+            help="Password of the users. Required with a remote --url, whose "
+            "users must already exist; a random one is generated otherwise.",
+        )
+        parser.add_argument(
+            "--keep-users",
+            action="store_true",
+            help="Keep the synthetic users when the run is finished.",
+        )
+        parser.add_argument("--seed", type=int)
+        parser.add_argument("--json", help="Also write the report to this file.")
+
+    def handle(self, *args, **options):
+        if options["users"] < 1:
+            raise CommandError("--users must be at least 1.")
+        try:
+            options["viewport"] = tuple(int(v) for v in options["viewport"].split("x"))
+        except ValueError:
+            raise CommandError("--viewport must look like 1280x800.")
+
+        base_url = options["url"]
+        usernames = [
+            f"{options['username_prefix']}{i}" for i in range(options["users"])
+        ]
+        if base_url and not _is_local(base_url):
+            # a remote server has its own database, with its own users and slides
+            if not options["password"] or not options["slides"]:
+                raise CommandError(
+                    "Users can't be created on a remote server. Create "
+                    f"{usernames[0]} to {usernames[-1]} there and pass their "
+                    "--password and the --slides to open."
+                )
+            self._run(options, base_url, usernames, options["password"])
+            return
+
+        if not options["slides"]:
+            options["slides"] = list(
+                Slide.objects.filter(is_public=True).values_list("id", flat=True)
+            )
+        if not options["slides"]:
+            raise CommandError("No slides to open. Pass --slides or publish a slide.")
+
+        password = options["password"] or secrets.token_urlsafe(16)
+        users, group = self._create_users(options, usernames, password)
+        try:
+            self._run(options, base_url, usernames, password)
+        finally:
+            if not options["keep_users"]:
+                User.objects.filter(pk__in=[user.pk for user in users]).delete()
+                if group:
+                    group.delete()
+
+    def _run(self, options, base_url, usernames, password):
+        server = None
+        if not base_url:
+            server, base_url = _serve()
+            self.stdout.write(f"Serving on {base_url}")
+
+        rng = random.Random(options["seed"])
+        stats = Stats()
+        deadline = time.monotonic() + options["duration"]
+        offsets = start_offsets(options["profile"], len(usernames), options["ramp_up"])
+
+        threads = []
+        for username, offset in zip(usernames, offsets):
+            client = ViewerClient(
+                base_url,
+                stats,
+                viewport=options["viewport"],
+                think_time=options["think_time"],
+                rng=random.Random(rng.random()),
+            )
+            thread = threading.Thread(
+                target=client.run,
+                args=(username, password, options["slides"]),
+                kwargs={
+                    "start_at": time.monotonic() + offset,
+                    "deadline": deadline,
+                    "steps": options["steps"],
+                },
+                daemon=True,
+            )
+            threads.append(thread)
+
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        if server:
+            server.shutdown()
+            server.server_close()
+
+        report = stats.report(elapsed)
+        report["options"] = {
+            key: options[key]
+            for key in (
+                "users",
+                "profile",
+                "ramp_up",
+                "duration",
+                "steps",
+                "think_time",
+            )
+        }
+        report["options"]["url"] = base_url
+        self._print_report(report)
+
+        if options["json"]:
+            with open(options["json"], "w") as f:
+                json.dump(report, f, indent=2)
+
+    def _create_users(self, options, usernames, password):
+        """Get the users, created if missing, and the group if it was created."""
+        group, created = Group.objects.get_or_create(name=options["group"])
+        if created:
+            GroupProfile.objects.create(
+                group=group, type=GroupProfile.TypeChoices.VIEWER
+            )
+
+        users = []
+        for i, username in enumerate(usernames):
+            user = User.objects.filter(username=username).first()
+            if user:
+                user.set_password(password)
+                user.save()
+            else:
+                user = User.objects.create_user(
+                    username, "Load", f"Test {i}", password=password
+                )
+            user.groups.add(group)
+            users.append(user)
+        return users, group if created else None
+
+    def _print_report(self, report):
+        self.stdout.write(
+            f"\n{report['requests']} requests in {report['elapsed']:.1f}s "
+            f"({report['throughput']:.1f} req/s), "
+            f"error rate {report['error_rate']:.2%}\n"
+        )
+        header = (
+            f"{'endpoint':<10}{'count':>8}{'errors':>8}{'p50 ms':>9}"
+            f"{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}"
+        )
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for name, row in report["endpoints"].items():
+            queries = "-" if row["queries"] is None else f"{row['queries']:.1f}"
+            self.stdout.write(
+                f"{name:<10}{row['count']:>8}{row['errors']:>8}"
+                f"{row['p50']:>9.1f}{row['p95']:>9.1f}{row['p99']:>9.1f}{queries:>9}"
+            )
+
+
+class Stats:
+    """Thread-safe collector of per-endpoint request samples."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def record(self, endpoint, latency, ok, queries=None):
+        with self._lock:
+            sample = self._samples.setdefault(
+                endpoint, {"latencies": [], "errors": 0, "queries": []}
+            )
+            sample["latencies"].append(latency * 1000)
+            if not ok:
+                sample["errors"] += 1
+            if queries is not None:
+                sample["queries"].append(queries)
+
+    def report(self, elapsed):
+        endpoints = {}
+        requests = errors = 0
+        for name, sample in sorted(self._samples.items()):
+            latencies = sorted(sample["latencies"])
+            queries = sample["queries"]
+            endpoints[name] = {
+                "count": len(latencies),
+                "errors": sample["errors"],
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "queries": sum(queries) / len(queries) if queries else None,
+            }
+            requests += len(latencies)
+            errors += sample["errors"]
+        return {
+            "elapsed": elapsed,
+            "requests": requests,
+            "errors": errors,
+            "throughput": requests / elapsed if elapsed else 0.0,
+            "error_rate": errors / requests if requests else 0.0,
+            "endpoints": endpoints,
+        }
+
+
+class DeepZoomGeometry:
+    """Tile layout of a DZI descriptor, computed the way OpenSeadragon does."""
+
+    def __init__(self, dzi):
+        root = ET.fromstring(dzi)
+        size = root.find(f"{DZI_NAMESPACE}Size")
+        self.width = int(size.get("Width"))
+        self.height = int(size.get("Height"))
+        self.tile_size = int(root.get("TileSize"))
+        self.format = root.get("Format")
+        self.max_level = math.ceil(math.log2(max(self.width, self.height)))
+
+    def level_size(self, level):
+        scale = 2 ** (self.max_level - level)
+        return math.ceil(self.width / scale), math.ceil(self.height / scale)
+
+    def visible_tiles(self, level, center, viewport):
+        """Tiles of ``level`` covering a viewport centered on a level-0 point."""
+        width, height = self.level_size(level)
+        scale = width / self.width
+        cx, cy = center[0] * scale, center[1] * scale
+        left = max(0, cx - viewport[0] / 2)
+        top = max(0, cy - viewport[1] / 2)
+        right = min(width, cx + viewport[0] / 2)
+        bottom = min(height, cy + viewport[1] / 2)
+        cols = range(int(left // self.tile_size), math.ceil(right / self.tile_size))
+        rows = range(int(top // self.tile_size), math.ceil(bottom / self.tile_size))
+        return [(col, row) for col in cols for row in rows]
+
+    def home_level(self, viewport):
+        """Lowest level that fills the viewport, as used for the home view."""
+        for level in range(self.max_level + 1):
+            width, height = self.level_size(level)
+            if width >= viewport[0] or height >= viewport[1]:
+                return level
+        return self.max_level
+
+
+class ViewerClient:
+    """One synthetic user browsing slides through the viewer."""
+
+    def __init__(self, base_url, stats, viewport, think_time, rng):
+        self.base_url = base_url.rstrip("/")
+        self.stats = stats
+        self.viewport = viewport
+        self.think_time = think_time
+        self.rng = rng
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies)
+        )
+
+    def run(self, username, password, slide_ids, start_at, deadline, steps):
+        time.sleep(max(0.0, start_at - time.monotonic()))
+        if not self.login(username, password):
+            return
+        while time.monotonic() < deadline:
+            self.view_slide(self.rng.choice(slide_ids), deadline, steps)
+
+    def login(self, username, password):
+        url = reverse("accounts:login")
+        page = self.request("login", url)
+        if page is None:
+            return False
+        match = re.search(rb'name="csrfmiddlewaretoken" value="([^"]+)"', page)
+        data = {
+            "username": username,
+            "password": password,
+            "csrfmiddlewaretoken": match.group(1).decode() if match else "",
+        }
+        body = self.request("login", url, data=urllib.parse.urlencode(data).encode())
+        return body is not None and any(
+            cookie.name == "sessionid" for cookie in self.cookies
+        )
+
+    def view_slide(self, slide_id, deadline, steps):
+        self.request("page", reverse("slide_viewer:slide-view", args=[slide_id]))
+
+        dzi_url = reverse("api:slide-dzi", kwargs={"pk": slide_id})
+        dzi = self.request("dzi", dzi_url)
+        if dzi is None:
+            return
+        geometry = DeepZoomGeometry(dzi)
+        # OpenSeadragon derives the tile URL from the descriptor URL.
+        tiles_url = re.sub(
+            r"([^/]+?)(\.(dzi|xml|js)?(\?[^/]*)?)?/?$", r"\1_files/", dzi_url
+        )
+        loaded = set()
+
+        level = geometry.home_level(self.viewport)
+        center = (geometry.width / 2, geometry.height / 2)
+        for _ in range(steps + 1):
+            if time.monotonic() >= deadline:
+                return
+            # The viewer blends the previous level while the sharper one loads.
+            for tile_level in (max(level - 1, 0), level):
+                tiles = geometry.visible_tiles(tile_level, center, self.viewport)
+                for col, row in tiles:
+                    if (tile_level, col, row) in loaded:
+                        continue
+                    loaded.add((tile_level, col, row))
+                    self.request(
+                        "tile",
+                        f"{tiles_url}{tile_level}/{col}_{row}.{geometry.format}",
+                    )
+            level, center = self._next_view(geometry, level, center)
+            if self.think_time:
+                time.sleep(self.rng.expovariate(1 / self.think_time))
+
+    def _next_view(self, geometry, level, center):
+        move = self.rng.choices(("zoom_in", "zoom_out", "pan"), weights=(4, 2, 4))[0]
+        if move == "zoom_in" and level < geometry.max_level:
+            level += 1
+        elif move == "zoom_out" and level > geometry.home_level(self.viewport):
+            level -= 1
+        else:
+            # Pan by up to half a viewport, measured in level-0 pixels.
+            scale = geometry.width / geometry.level_size(level)[0]
+            dx = self.rng.uniform(-0.5, 0.5) * self.viewport[0] * scale
+            dy = self.rng.uniform(-0.5, 0.5) * self.viewport[1] * scale
+            center = (
+                min(max(center[0] + dx, 0), geometry.width),
+                min(max(center[1] + dy, 0), geometry.height),
+            )
+        return level, center
+
+    def request(self, endpoint, path, data=None):
+        request = urllib.request.Request(self.base_url + path, data=data)
+        if data is not None:
+            request.add_header("Referer", self.base_url + path)
+        started = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=30) as response:
+                body = response.read()
+                queries = response.headers.get(QUERY_COUNT_HEADER)
+            ok = True
+        except (urllib.error.URLError, OSError) as e:
+            body = None
+            queries = getattr(e, "headers", None) and e.headers.get(QUERY_COUNT_HEADER)
+            ok = False
+        self.stats.record(
+            endpoint,
+            time.perf_counter() - started,
+            ok,
+            int(queries) if queries else None,
+        )
+        return body
+
+
+def start_offsets(profile, users, ramp_up):
+    """Seconds after the start at which each user becomes active."""
+    if profile == "constant" or users == 1:
+        return [0.0] * users
+    if profile == "linear":
+        return [ramp_up * i / (users - 1) for i in range(users)]
+    if profile == "step":
+        steps = min(4, users)
+        return [ramp_up * (i * steps // users) / (steps - 1) for i in range(users)]
+    # spike: a tenth of the class warms up, then everybody else arrives at once.
+    warm = max(1, users // 10)
+    return [0.0] * warm + [ramp_up] * (users - warm)
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(values)))
+    return values[rank - 1]
+
+
+def _is_local(url):
+    return urllib.parse.urlsplit(url).hostname in ("localhost", "127.0.0.1", "::1")
+
+
+def _serve():
+    """Start the project on a free local port, counting queries per request."""
+    application = get_wsgi_application()
+
+    def counting_application(environ, start_response):
+        queries = []
+
+        def counter(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        def counting_start_response(status, headers, exc_info=None):
+            headers = list(headers) + [(QUERY_COUNT_HEADER, str(len(queries)))]
+            return start_response(status, headers, exc_info)
+
+        with connection.execute_wrapper(counter):
+            return application(environ, counting_start_response)
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadedWSGIServer(
+        ("127.0.0.1", 0), QuietHandler, allow_reuse_address=False
+    )
+    server.set_app(counting_application)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
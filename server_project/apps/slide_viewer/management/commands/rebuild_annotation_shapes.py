@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.slide_viewer.models import Annotation, AnnotationShape
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the shape table used by viewport queries and levels of detail "
+        "from the data of every annotation, giving shapes without an id one."
+    )
+
+    def handle(self, *args, **options):
+        count = 0
+        for annotation in Annotation.objects.order_by("pk").iterator():
+            with transaction.atomic():
+                annotation.save(update_fields=["data"])
+                # unchanged shapes would keep rows of an older format
+                annotation.shapes.all().delete()
+                AnnotationShape.objects.sync(annotation)
+            count += 1
+
+        shapes = AnnotationShape.objects.count()
+        self.stdout.write(
+            self.style.SUCCESS(f"Indexed {shapes} shapes of {count} annotations.")
+        )
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.15 on 2026-10-19 02:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('database', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Annotation',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100, null=True)),
+                ('description', models.TextField(blank=True, help_text='Description of the annotation', null=True)),
+                ('data', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('author', models.ForeignKey(blank=True, db_column='created_by', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='annotations', to=settings.AUTH_USER_MODEL)),
+                ('slide', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='annotations', to='database.slide')),
+            ],
+            options={
+                'ordering': ('created_at',),
+                'unique_together': {('name', 'author', 'slide')},
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.15 on 2026-10-19 02:04
+
+import apps.slide_viewer.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0002_folder_paths_and_slide_metadata'),
+        ('slide_viewer', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='annotation',
+            name='version',
+            field=models.PositiveIntegerField(default=0, help_text='Incremented on every change, for optimistic concurrency.'),
+        ),
+        migrations.AlterField(
+            model_name='annotation',
+            name='data',
+            field=apps.slide_viewer.models.CompactPointsJSONField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='AnnotationRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('name', models.CharField(max_length=100, null=True)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('snapshot', models.JSONField(help_text='The whole data of a snapshot.', null=True)),
+                ('delta', models.JSONField(help_text='The changes from the previous version, or null.', null=True)),
+                ('size', models.PositiveIntegerField(help_text='Size of the snapshot or delta.')),
+                ('chain_size', models.PositiveIntegerField(default=0, help_text='Size of the deltas since the last snapshot.')),
+                ('chain_length', models.PositiveIntegerField(default=0, help_text='Number of deltas since the last snapshot.')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('annotation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='slide_viewer.annotation')),
+            ],
+            options={
+                'ordering': ('version',),
+                'unique_together': {('annotation', 'version')},
+            },
+        ),
+        migrations.CreateModel(
+            name='AnnotationShape',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shape_id', models.CharField(max_length=50)),
+                ('data', apps.slide_viewer.models.CompactPointsJSONField()),
+                ('min_x', models.FloatField()),
+                ('min_y', models.FloatField()),
+                ('max_x', models.FloatField()),
+                ('max_y', models.FloatField()),
+                ('levels', models.JSONField(default=list, help_text='Points simplified at every tolerance of simplify.TOLERANCES.')),
+                ('annotation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shapes', to='slide_viewer.annotation')),
+                ('slide', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='database.slide')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['slide', 'min_x', 'max_x'], name='slide_viewe_slide_i_ee8999_idx')],
+                'unique_together': {('annotation', 'shape_id')},
+            },
+        ),
+    ]
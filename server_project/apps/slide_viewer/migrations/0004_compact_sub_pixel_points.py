@@ -0,0 +1,43 @@
+# Generated by Django 5.1.15 on 2026-10-19 09:12
+
+from django.db import migrations
+
+from apps.slide_viewer.codec import is_encodable
+
+BATCH_SIZE = 500
+
+
+def compact_points(apps, schema_editor):
+    # 0003 left shapes with sub-pixel points as JSON, the data field now
+    # writes them in fixed point
+    for name in ("Annotation", "AnnotationShape"):
+        model = apps.get_model("slide_viewer", name)
+        pks = list(
+            model.objects.filter(data__isnull=False)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        for i in range(0, len(pks), BATCH_SIZE):
+            rows = model.objects.filter(pk__in=pks[i : i + BATCH_SIZE]).only("data")
+            model.objects.bulk_update(
+                [row for row in rows if _has_encodable_points(row.data)], ["data"]
+            )
+
+
+def _has_encodable_points(data):
+    shapes = data if isinstance(data, list) else [data]
+    return any(
+        isinstance(shape, dict) and is_encodable(shape.get("points"))
+        for shape in shapes
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('slide_viewer', '0003_compact_annotation_points'),
+    ]
+
+    operations = [
+        migrations.RunPython(compact_points, migrations.RunPython.noop),
+    ]
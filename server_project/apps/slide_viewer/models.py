@@ -1,7 +1,14 @@
+import uuid
+
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Exists, F, OuterRef, Q
 
 from apps.database.models import Slide
+from .codec import decode_shape, encode_shape
+from .revisions import apply_delta, get_delta, get_size
+from .signals import annotations_imported
+from .simplify import get_levels
 
 
 class AnnotationManager(models.Manager):
@@ -20,10 +27,79 @@ class AnnotationManager(models.Manager):
     def viewable(self, user):
         if user.is_admin():
             return self.all()
-        annotations = self.filter(author=user)
-        for slide in Slide.objects.viewable(user):
-            annotations |= self.viewable_by_slide(user, slide)
-        return annotations
+        # correlated, so filtering a few annotations doesn't scan every slide
+        viewable_slide = Slide.objects.viewable(user).filter(pk=OuterRef("slide"))
+        return self.filter(Q(author=user) | Exists(viewable_slide))
+
+    def bulk_import(self, slide, author, annotations):
+        """
+        Create annotations from dicts of name, description and data with a
+        few bulk_create() queries, in one transaction.
+
+        bulk_create() sends no post_save, so annotations_imported is sent
+        for whoever keeps data derived from annotations.
+        """
+        with transaction.atomic():
+            created = self.bulk_create(
+                (
+                    Annotation(
+                        name=annotation["name"],
+                        description=annotation.get("description"),
+                        data=prepare_shapes(annotation.get("data") or []),
+                        author=author,
+                        slide=slide,
+                    )
+                    for annotation in annotations
+                ),
+                batch_size=AnnotationShapeManager.BATCH_SIZE,
+            )
+            AnnotationShape.objects.create_for(created)
+            AnnotationRevision.objects.bulk_create(
+                (AnnotationRevision.build(annotation) for annotation in created),
+                batch_size=AnnotationShapeManager.BATCH_SIZE,
+            )
+            annotations_imported.send(sender=Annotation, annotations=created)
+        return created
+
+
+class CompactPointsJSONField(models.JSONField):
+    """
+    A JSONField of a shape or a list of shapes, storing their points in the
+    compact encoding of codec. Loaded shapes keep their points
+    encoded, so only code that needs the coordinates pays for decoding them.
+    """
+
+    def get_prep_value(self, value):
+        return super().get_prep_value(_map_shapes(value, encode_shape))
+
+
+def _map_shapes(value, function):
+    if isinstance(value, list):
+        return [function(shape) for shape in value]
+    return function(value)
+
+
+def prepare_shapes(shapes):
+    """
+    Encode shapes as they will be stored and give them ids if they have none,
+    or a new one if their id is taken by an earlier shape.
+    """
+    shapes = [encode_shape(shape) for shape in shapes]
+    shape_ids = set()
+    for shape in shapes:
+        if isinstance(shape, dict):
+            if str(shape.get("id")) in shape_ids or "id" not in shape:
+                shape["id"] = uuid.uuid4().hex
+            shape_ids.add(str(shape["id"]))
+    return shapes
+
+
+class VersionConflict(Exception):
+    """The annotation was changed since the version an edit was based on."""
+
+    def __init__(self, version):
+        super().__init__(f"The annotation is at version {version}.")
+        self.version = version
 
 
 class Annotation(models.Model):
@@ -34,7 +110,11 @@ class Annotation(models.Model):
         null=True,
         help_text="Description of the annotation",
     )
-    data = models.JSONField(blank=True, null=True)
+    data = CompactPointsJSONField(blank=True, null=True)
+    version = models.PositiveIntegerField(
+        default=0,
+        help_text="Incremented on every change, for optimistic concurrency.",
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -61,6 +141,97 @@ class Annotation(models.Model):
     def __str__(self):
         return f"{self.name} - {self.author} - {self.slide}"
 
+    def save(self, *args, **kwargs):
+        if isinstance(self.data, list):
+            self.data = prepare_shapes(self.data)
+
+        full_save = kwargs.get("update_fields") is None
+        bump_version = full_save and not self._state.adding
+        if bump_version:
+            # F() so concurrent saves never end up with the same version
+            self.version = F("version") + 1
+        with transaction.atomic():
+            previous = None
+            if bump_version:
+                # locked, so the revision is a delta from the version it replaces
+                previous = (
+                    Annotation.objects.select_for_update()
+                    .values_list("data", flat=True)
+                    .filter(pk=self.pk)
+                    .first()
+                )
+            super().save(*args, **kwargs)
+            if bump_version:
+                self.refresh_from_db(fields=["version"])
+            if full_save:
+                AnnotationShape.objects.sync(self)
+                AnnotationRevision.objects.record(self, previous)
+
+    def apply_shape_operations(self, operations, version):
+        """
+        Add, modify and delete shapes of ``data`` by shape id.
+
+        ``version`` is the version the operations were made against. The
+        version is claimed with a conditional UPDATE before the shapes are
+        read, so of two concurrent edits the second raises VersionConflict
+        instead of overwriting the first. Unknown shape ids raise ValueError
+        and leave the annotation unchanged.
+
+        Returns the ids of the added shapes.
+        """
+        with transaction.atomic():
+            claimed = Annotation.objects.filter(pk=self.pk, version=version).update(
+                version=version + 1
+            )
+            if not claimed:
+                current = Annotation.objects.values_list("version", flat=True).get(
+                    pk=self.pk
+                )
+                raise VersionConflict(current)
+
+            data = Annotation.objects.values_list("data", flat=True).get(pk=self.pk)
+            shapes = {}
+            for shape in data or []:
+                shapes[str(shape.setdefault("id", uuid.uuid4().hex))] = shape
+
+            added = []
+            changed = set()
+            for operation in operations:
+                shape_id = operation.get("id")
+                if operation["op"] == "add":
+                    shape_id = str(operation["shape"].get("id") or uuid.uuid4().hex)
+                    if shape_id in shapes:
+                        raise ValueError(f"Shape '{shape_id}' already exists.")
+                    shapes[shape_id] = {**operation["shape"], "id": shape_id}
+                    added.append(shape_id)
+                elif shape_id not in shapes:
+                    raise ValueError(f"Shape '{shape_id}' does not exist.")
+                elif operation["op"] == "modify":
+                    # a copy, data stays the previous version for the revision
+                    shapes[shape_id] = {
+                        **shapes[shape_id],
+                        **operation["shape"],
+                        "id": shape_id,
+                    }
+                else:
+                    del shapes[shape_id]
+                changed.add(shape_id)
+
+            self.data = list(shapes.values())
+            self.version = version + 1
+            self.save(update_fields=["data", "version", "updated_at"])
+            AnnotationShape.objects.sync(self, changed)
+            AnnotationRevision.objects.record(self, data)
+        return added
+
+    def restore(self, version):
+        """Save the name, description and data of a revision as a new version."""
+        revision = AnnotationRevision.objects.get_version(self, version)
+        self.name = revision.name
+        self.description = revision.description
+        self.data = revision.data
+        self.save()
+
     def user_can_edit(self, user):
         if user.is_admin():
             return True
@@ -68,3 +239,242 @@ class Annotation(models.Model):
 
     def user_can_view(self, user):
         return self.user_can_edit(user) or self.slide.user_can_view(user)
+
+
+def get_bounds(shape):
+    """Get the bounding box of a shape's points, or None if it has no points."""
+    try:
+        xs, ys = zip(*((float(x), float(y)) for x, y, *_ in shape["points"]))
+    except (KeyError, TypeError, ValueError):
+        return None
+    return {"min_x": min(xs), "min_y": min(ys), "max_x": max(xs), "max_y": max(ys)}
+
+
+class AnnotationShapeManager(models.Manager):
+    # stays below the number of parameters SQLite allows in a query
+    BATCH_SIZE = 500
+
+    def sync(self, annotation, shape_ids=None):
+        """
+        Update the rows of an annotation's shapes, or only of ``shape_ids``.
+
+        Shapes without points have no extent and get no row. Rows follow the
+        annotation when it moves to another slide.
+        """
+        self.filter(annotation=annotation).exclude(slide_id=annotation.slide_id).update(
+            slide_id=annotation.slide_id
+        )
+        shapes = {str(shape.get("id")): shape for shape in annotation.data or []}
+        if shape_ids is None:
+            # a full save mostly resends unchanged shapes, which keep their rows
+            stored = dict(
+                self.filter(annotation=annotation).values_list("shape_id", "data")
+            )
+            shape_ids = {
+                shape_id
+                for shape_id in shapes.keys() | stored.keys()
+                if shapes.get(shape_id) != stored.get(shape_id)
+            }
+            deleted = list(shape_ids & stored.keys())
+        else:
+            deleted = list(shape_ids)
+
+        for i in range(0, len(deleted), self.BATCH_SIZE):
+            self.filter(
+                annotation=annotation, shape_id__in=deleted[i : i + self.BATCH_SIZE]
+            ).delete()
+
+        shapes = [shapes[shape_id] for shape_id in shape_ids if shape_id in shapes]
+        self.bulk_create(self._build(annotation, shapes), batch_size=self.BATCH_SIZE)
+
+    def create_for(self, annotations):
+        """Create the rows of new annotations, like after a bulk_create()."""
+        rows = [
+            row
+            for annotation in annotations
+            for row in self._build(annotation, annotation.data or [])
+        ]
+        self.bulk_create(rows, batch_size=self.BATCH_SIZE)
+
+    def _build(self, annotation, shapes):
+        for encoded in shapes:
+            shape = decode_shape(encoded)
+            bounds = get_bounds(shape)
+            if bounds:
+                yield AnnotationShape(
+                    annotation=annotation,
+                    slide_id=annotation.slide_id,
+                    shape_id=str(shape.get("id")),
+                    data=encoded,
+                    levels=get_levels(shape),
+                    **bounds,
+                )
+
+    def get_levels(self, annotations, level):
+        """
+        Get the points of the shapes of annotations at a level of detail, by
+        annotation id and shape id. Only the points of that level are read.
+        """
+        levels = {}
+        rows = self.filter(annotation__in=annotations).values_list(
+            "annotation_id", "shape_id", f"levels__{level}"
+        )
+        for annotation_id, shape_id, points in rows:
+            if points:
+                levels.setdefault(annotation_id, {})[shape_id] = points
+        return levels
+
+    def intersecting(self, slide, min_x, min_y, max_x, max_y):
+        """Get the shapes on a slide whose bounding box intersects a rectangle."""
+        from .spatial import filter_intersecting
+
+        shapes = self.filter(slide=slide)
+        return filter_intersecting(shapes, slide.pk, min_x, min_y, max_x, max_y)
+
+
+class AnnotationShape(models.Model):
+    """
+    A shape of ``Annotation.data`` with its bounding box, kept in sync by
+    Annotation.save(), so viewport queries don't read whole annotations.
+    """
+
+    annotation = models.ForeignKey(
+        Annotation, on_delete=models.CASCADE, related_name="shapes"
+    )
+    slide = models.ForeignKey(
+        "database.Slide", on_delete=models.CASCADE, related_name="+"
+    )
+    shape_id = models.CharField(max_length=50)
+    data = CompactPointsJSONField()
+    min_x = models.FloatField()
+    min_y = models.FloatField()
+    max_x = models.FloatField()
+    max_y = models.FloatField()
+    levels = models.JSONField(
+        default=list,
+        help_text="Points simplified at every tolerance of simplify.TOLERANCES.",
+    )
+
+    objects = AnnotationShapeManager()
+
+    class Meta:
+        unique_together = ("annotation", "shape_id")
+        indexes = [models.Index(fields=["slide", "min_x", "max_x"])]
+
+    def __str__(self):
+        return f"{self.shape_id} - {self.annotation}"
+
+
+class AnnotationRevisionManager(models.Manager):
+    # the most deltas between two snapshots, however small they are
+    MAX_DELTAS = 200
+
+    def record(self, annotation, previous_data):
+        """
+        Record the current version of an annotation, as a delta from
+        ``previous_data`` when the previous version has a revision.
+
+        A snapshot of the whole data is taken instead once the deltas since
+        the last snapshot add up to its size, so snapshots take at most as
+        much space as the edits, and rebuilding a version reads at most
+        about twice the size of its data.
+        """
+        revision = AnnotationRevision.build(annotation)
+        latest = (
+            self.filter(annotation=annotation)
+            .order_by("-version")
+            .values("version", "chain_size", "chain_length")
+            .first()
+        )
+        delta = None
+        if latest and latest["version"] == annotation.version - 1:
+            delta = get_delta(previous_data, annotation.data)
+
+        if delta is not None and latest["chain_length"] < self.MAX_DELTAS:
+            size = get_size(delta)
+            if latest["chain_size"] + size < revision.size:
+                revision.snapshot = None
+                revision.delta = delta
+                revision.size = size
+                revision.chain_size = latest["chain_size"] + size
+                revision.chain_length = latest["chain_length"] + 1
+        revision.save()
+
+    def get_version(self, annotation, version):
+        """
+        Rebuild a version of an annotation from the snapshot before it and
+        the deltas after that snapshot. Raises DoesNotExist if the version
+        has no revision.
+        """
+        snapshot = (
+            self.filter(annotation=annotation, delta__isnull=True)
+            .filter(version__lte=version)
+            .order_by("-version")
+            .values_list("version", flat=True)
+            .first()
+        )
+        revisions = list(
+            self.filter(
+                annotation=annotation,
+                version__gte=snapshot if snapshot is not None else version,
+                version__lte=version,
+            ).order_by("version")
+        )
+        if snapshot is None or not revisions or revisions[-1].version != version:
+            raise AnnotationRevision.DoesNotExist(
+                f"Version {version} of {annotation} has no revision."
+            )
+
+        data = revisions[0].snapshot
+        for revision in revisions[1:]:
+            data = apply_delta(data, revision.delta)
+        revision = revisions[-1]
+        revision.data = data
+        return revision
+
+
+class AnnotationRevision(models.Model):
+    """
+    A version of an annotation, stored as a snapshot of its data or as a
+    delta from the previous version.
+    """
+
+    annotation = models.ForeignKey(
+        Annotation, on_delete=models.CASCADE, related_name="revisions"
+    )
+    version = models.PositiveIntegerField()
+    name = models.CharField(max_length=100, null=True)
+    description = models.TextField(blank=True, null=True)
+    snapshot = models.JSONField(null=True, help_text="The whole data of a snapshot.")
+    delta = models.JSONField(
+        null=True, help_text="The changes from the previous version, or null."
+    )
+    size = models.PositiveIntegerField(help_text="Size of the snapshot or delta.")
+    chain_size = models.PositiveIntegerField(
+        default=0, help_text="Size of the deltas since the last snapshot."
+    )
+    chain_length = models.PositiveIntegerField(
+        default=0, help_text="Number of deltas since the last snapshot."
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = AnnotationRevisionManager()
+
+    class Meta:
+        unique_together = ("annotation", "version")
+        ordering = ("version",)
+
+    def __str__(self):
+        return f"{self.annotation} - version {self.version}"
+
+    @classmethod
+    def build(cls, annotation):
+        """Build a snapshot revision of an annotation's current version."""
+        return cls(
+            annotation=annotation,
+            version=annotation.version,
+            name=annotation.name,
+            description=annotation.description,
+            snapshot=annotation.data,
+            size=get_size(annotation.data),
+        )
@@ -0,0 +1,146 @@
+"""
+Raster overlay tiles of an annotation, on the Deep Zoom grid of its slide.
+
+OpenSeadragon can add the overlay as a second tiled image over the slide, so
+dense annotations cost the browser an image per tile instead of a vector
+per shape. Tiles are transparent where there is no shape.
+"""
+
+import io
+import math
+import xml.etree.ElementTree as ET
+
+from PIL import Image, ImageColor, ImageDraw
+
+from .codec import decode_shape
+from .simplify import apply_level
+
+DZI_NAMESPACE = "http://schemas.microsoft.com/deepzoom/2008"
+FORMATS = {"png": "PNG", "webp": "WEBP"}
+
+DEFAULT_COLOR = (0, 200, 255)
+FILL_ALPHA = 64
+LINE_WIDTH = 2
+POINT_RADIUS = 4
+
+
+def parse_dzi(dzi):
+    """Get the size, tile size, overlap and format of a DZI file's content."""
+    try:
+        image = ET.fromstring(dzi)
+        size = image.find(f"{{{DZI_NAMESPACE}}}Size")
+        return {
+            "width": int(size.get("Width")),
+            "height": int(size.get("Height")),
+            "tile_size": int(image.get("TileSize")),
+            "overlap": int(image.get("Overlap")),
+            "format": image.get("Format"),
+        }
+    except (ET.ParseError, AttributeError, TypeError, ValueError):
+        raise ValueError("Invalid DZI file.")
+
+
+def get_overlay_dzi(dzi, image_format):
+    """Get the DZI of the slide with the format of the overlay tiles."""
+    ET.register_namespace("", DZI_NAMESPACE)
+    image = ET.fromstring(dzi)
+    image.set("Format", image_format)
+    return ET.tostring(image, encoding="UTF-8", xml_declaration=True)
+
+
+def get_tile_rect(geometry, level, col, row):
+    """
+    Get the scale of a level and the rectangle of a tile, in pixels of the
+    level, as OpenSeadragon lays out Deep Zoom tiles: every tile overlaps its
+    neighbours and the level's edges cut the last tiles short.
+    """
+    width, height = geometry["width"], geometry["height"]
+    tile_size, overlap = geometry["tile_size"], geometry["overlap"]
+    max_level = math.ceil(math.log2(max(width, height, 1)))
+    if not 0 <= level <= max_level:
+        raise ValueError(f"Level {level} does not exist.")
+
+    scale = 2.0 ** (level - max_level)
+    level_width = math.ceil(width * scale)
+    level_height = math.ceil(height * scale)
+    if not (0 <= col < math.ceil(level_width / tile_size)) or not (
+        0 <= row < math.ceil(level_height / tile_size)
+    ):
+        raise ValueError(f"Tile {col}_{row} does not exist.")
+
+    rect = (
+        col * tile_size - (overlap if col else 0),
+        row * tile_size - (overlap if row else 0),
+        min(level_width, (col + 1) * tile_size + overlap),
+        min(level_height, (row + 1) * tile_size + overlap),
+    )
+    return scale, rect
+
+
+def get_tile_bounds(scale, rect):
+    """Get the rectangle of a tile in slide pixels, with room for outlines."""
+    margin = LINE_WIDTH + POINT_RADIUS
+    x0, y0, x1, y1 = rect
+    return (
+        (x0 - margin) / scale,
+        (y0 - margin) / scale,
+        (x1 + margin) / scale,
+        (y1 + margin) / scale,
+    )
+
+
+def render_tile(shapes, scale, rect, image_format):
+    """
+    Draw shapes onto a transparent tile.
+
+    ``shapes`` are ``(data, points)`` pairs, ``points`` being the points of
+    a level of detail or None.
+    """
+    x0, y0, x1, y1 = rect
+    tile = Image.new("RGBA", (x1 - x0, y1 - y0), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(tile, "RGBA")
+    for data, points in shapes:
+        shape = decode_shape(apply_level(data, points))
+        _draw_shape(draw, shape, scale, x0, y0)
+
+    output = io.BytesIO()
+    if image_format == "webp":
+        # lossy WebP smears the edges of the shapes into the slide
+        tile.save(output, FORMATS[image_format], lossless=True, method=0)
+    else:
+        tile.save(output, FORMATS[image_format])
+    return output.getvalue()
+
+
+def _draw_shape(draw, shape, scale, x0, y0):
+    try:
+        points = [(x * scale - x0, y * scale - y0) for x, y, *_ in shape["points"]]
+    except (KeyError, TypeError, ValueError):
+        return
+    if not points:
+        return
+
+    color = _get_color(shape.get("color"))
+    if shape.get("type") == "point":
+        r = POINT_RADIUS
+        for x, y in points:
+            draw.ellipse((x - r, y - r, x + r, y + r), fill=(*color, 255))
+    elif shape.get("type") == "polygon" and len(points) > 2:
+        draw.polygon(
+            points,
+            fill=(*color, FILL_ALPHA),
+            outline=(*color, 255),
+            width=LINE_WIDTH,
+        )
+    elif len(points) > 1:
+        draw.line(points, fill=(*color, 255), width=LINE_WIDTH, joint="curve")
+    else:
+        x, y = points[0]
+        draw.point((x, y), fill=(*color, 255))
+
+
+def _get_color(color):
+    try:
+        return ImageColor.getrgb(color)[:3]
+    except (AttributeError, TypeError, ValueError):
+        return DEFAULT_COLOR
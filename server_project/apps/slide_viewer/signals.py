@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+# Sent with the created ``annotations`` by AnnotationManager.bulk_import().
+annotations_imported = Signal()
@@ -0,0 +1,73 @@
+import numpy as np
+
+# Tolerances in image pixels of the precomputed levels of detail. A viewer
+# zoomed out to ``scale`` screen pixels per image pixel can't tell apart
+# points closer than 1 / scale image pixels.
+TOLERANCES = (2, 8, 32, 128, 512)
+# Shapes with fewer points are sent as they are at every level.
+MIN_POINTS = 32
+
+
+def simplify(points, tolerance):
+    """
+    Get the indexes of the points kept by Douglas-Peucker simplification.
+
+    Every span is split at its point farthest from the line through its
+    ends, until no point is farther than ``tolerance``. The distances of a
+    span are computed at once with NumPy, so a 50k point outline takes a few
+    milliseconds.
+    """
+    xy = np.array([point[:2] for point in points], dtype=float)
+    keep = np.zeros(len(xy), dtype=bool)
+    keep[[0, -1]] = True
+
+    spans = [(0, len(xy) - 1)]
+    while spans:
+        start, end = spans.pop()
+        if end - start < 2:
+            continue
+        inner = xy[start + 1 : end] - xy[start]
+        direction = xy[end] - xy[start]
+        length = np.hypot(*direction)
+        if length:
+            cross = direction[0] * inner[:, 1] - direction[1] * inner[:, 0]
+            distances = np.abs(cross) / length
+        else:
+            # closed outlines start and end at the same point
+            distances = np.hypot(inner[:, 0], inner[:, 1])
+
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            spans.extend(((start, split), (split, end)))
+    return np.flatnonzero(keep)
+
+
+def get_levels(shape):
+    """Get the points of a shape at every tolerance, or [] for small shapes."""
+    points = shape.get("points")
+    if not isinstance(points, list) or len(points) < MIN_POINTS:
+        return []
+
+    levels = []
+    for tolerance in TOLERANCES:
+        # simplifying the finer level is faster and keeps the levels nested
+        points = [points[i] for i in simplify(points, tolerance)]
+        levels.append(points)
+    return levels
+
+
+def get_level(scale):
+    """Get the index of the coarsest level a scale can't tell from the shape."""
+    if scale <= 0:
+        raise ValueError("The scale must be positive.")
+    levels = [i for i, tolerance in enumerate(TOLERANCES) if tolerance * scale <= 1]
+    return levels[-1] if levels else None
+
+
+def apply_level(shape, points):
+    """Get a shape with the points of a level, if it has any."""
+    if not points:
+        return shape
+    return {**shape, "points": points}
@@ -0,0 +1,88 @@
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models.expressions import RawSQL
+
+from .models import AnnotationShape
+
+SHAPES = AnnotationShape._meta.db_table
+TABLE = f"{SHAPES}_rtree"
+# The slide is the first dimension, so a viewport only visits the boxes of
+# its own slide. R-tree coordinates are 32-bit floats, which represent
+# slide ids exactly up to 2**24.
+COLUMNS = "id, min_slide, max_slide, min_x, max_x, min_y, max_y"
+VALUES = (
+    "{0}.id, {0}.slide_id, {0}.slide_id, {0}.min_x, {0}.max_x, {0}.min_y, {0}.max_y"
+)
+TRIGGERS = {
+    f"{TABLE}_insert": (
+        f"AFTER INSERT ON {SHAPES} BEGIN "
+        f"INSERT INTO {TABLE} ({COLUMNS}) VALUES ({VALUES.format('new')}); END"
+    ),
+    f"{TABLE}_update": (
+        f"AFTER UPDATE ON {SHAPES} BEGIN "
+        f"DELETE FROM {TABLE} WHERE id = old.id; "
+        f"INSERT INTO {TABLE} ({COLUMNS}) VALUES ({VALUES.format('new')}); END"
+    ),
+    f"{TABLE}_delete": (
+        f"AFTER DELETE ON {SHAPES} BEGIN "
+        f"DELETE FROM {TABLE} WHERE id = old.id; END"
+    ),
+}
+
+
+def is_available(using=DEFAULT_DB_ALIAS):
+    return connections[using].vendor == "sqlite"
+
+
+def create_index(using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Create the R-tree of shape bounding boxes and the triggers filling it.
+
+    Runs after every migration: SQLite rebuilds a table to alter it, which
+    drops its triggers, so missing triggers are created again and the
+    R-tree is refilled.
+    """
+    if not is_available(using):
+        return
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING rtree({COLUMNS})"
+        )
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s",
+            [SHAPES],
+        )
+        if {name for name, in cursor.fetchall()} == set(TRIGGERS):
+            return
+
+        for name, trigger in TRIGGERS.items():
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(f"CREATE TRIGGER {name} {trigger}")
+        cursor.execute(f"DELETE FROM {TABLE}")
+        cursor.execute(
+            f"INSERT INTO {TABLE} ({COLUMNS}) "
+            f"SELECT {VALUES.format(SHAPES)} FROM {SHAPES}"
+        )
+
+
+def filter_intersecting(shapes, slide_id, min_x, min_y, max_x, max_y):
+    """
+    Filter shapes of a slide on their bounding box intersecting a rectangle.
+
+    On SQLite the R-tree finds the ids. It rounds boxes outwards to 32-bit
+    floats, so a shape within a fraction of a pixel of the rectangle may be
+    included too. Elsewhere the indexed bounds columns are compared.
+    """
+    if not is_available(shapes.db):
+        return shapes.filter(
+            max_x__gte=min_x, min_x__lte=max_x, max_y__gte=min_y, min_y__lte=max_y
+        )
+
+    # the exact bounds are left out, or SQLite scans the bounds index instead
+    return shapes.filter(
+        id__in=RawSQL(
+            f"SELECT id FROM {TABLE} WHERE min_slide <= %s AND max_slide >= %s "
+            "AND max_x >= %s AND min_x <= %s AND max_y >= %s AND min_y <= %s",
+            [slide_id, slide_id, min_x, max_x, min_y, max_y],
+        )
+    )
@@ -0,0 +1,110 @@
+// Decodes points encoded by apps/slide_viewer/codec.py: base64 of zigzag
+// varint deltas, x and y alternating, prefixed with "scale:" when they are
+// counted in fractions of a pixel.
+function decodePoints(encoded) {
+    const colon = encoded.lastIndexOf(':');
+    const scale = colon < 0 ? 1 : Number(encoded.slice(0, colon));
+    const base64 = encoded.slice(colon + 1);
+    const bytes = Uint8Array.from(atob(base64), c => c.charCodeAt(0));
+    const points = [];
+    let value = 0, shift = 0, x = 0, y = 0, dx = null;
+    for (const byte of bytes) {
+        // no bitwise operators, they would truncate to 32 bits
+        value += (byte & 0x7f) * 2 ** shift;
+        shift += 7;
+        if (byte < 0x80) {
+            const delta = value % 2 ? -(value + 1) / 2 : value / 2;
+            if (dx === null) {
+                dx = delta;
+            } else {
+                x += dx;
+                y += delta;
+                points.push([x / scale, y / scale]);
+                dx = null;
+            }
+            value = 0;
+            shift = 0;
+        }
+    }
+    return points;
+}
+
+function decodeShapes(shapes) {
+    if (!Array.isArray(shapes)) {
+        return shapes;
+    }
+    return shapes.map(shape => typeof shape.points === 'string'
+        ? {...shape, points: decodePoints(shape.points)}
+        : shape);
+}
+
+// Presents or follows the viewport of a live lecture, see apps/lectures/live.py.
+// The center and zoom are in level-0 pixels of the slide, so they don't depend
+// on the size of the window.
+function connectLive(viewer, options) {
+    const scheme = location.protocol === 'https:' ? 'wss://' : 'ws://';
+    const socket = new WebSocket(
+        scheme + location.host + '/ws/lectures/' + options.lecture + '/live/'
+        + (options.present ? '?role=present' : '')
+    );
+    const image = () => viewer.world.getItemAt(0);
+    let scheduled = false;
+
+    function sendViewport() {
+        scheduled = false;
+        if (socket.readyState !== WebSocket.OPEN || !image()) {
+            return;
+        }
+        const center = image().viewportToImageCoordinates(viewer.viewport.getCenter());
+        socket.send(JSON.stringify({
+            slide: options.slide,
+            annotation: options.annotation,
+            center: [center.x, center.y],
+            zoom: image().viewportToImageZoom(viewer.viewport.getZoom()),
+        }));
+    }
+
+    function scheduleViewport() {
+        // the server keeps the latest of rapid updates, don't flood it
+        if (!scheduled) {
+            scheduled = true;
+            setTimeout(sendViewport, 50);
+        }
+    }
+
+    function showViewport(message) {
+        if (message.slide !== options.slide || message.annotation !== options.annotation) {
+            const params = new URLSearchParams({lecture: options.lecture, live: ''});
+            if (message.annotation !== null) {
+                params.set('annotation', message.annotation);
+            }
+            location.href = options.slideUrl.replace(/\/0\/$/, '/' + message.slide + '/')
+                + '?' + params;
+            return;
+        }
+        if (!image()) {
+            return;
+        }
+        const center = image().imageToViewportCoordinates(message.center[0], message.center[1]);
+        viewer.viewport.panTo(center);
+        viewer.viewport.zoomTo(image().imageToViewportZoom(message.zoom));
+    }
+
+    if (options.present) {
+        socket.addEventListener('open', scheduleViewport);
+        viewer.addHandler('viewport-change', scheduleViewport);
+    } else {
+        socket.addEventListener('message', function (event) {
+            const message = JSON.parse(event.data);
+            if (message.type === 'viewport') {
+                showViewport(message);
+            }
+        });
+    }
+    return {
+        close: function () {
+            viewer.removeHandler('viewport-change', scheduleViewport);
+            socket.close();
+        },
+    };
+}
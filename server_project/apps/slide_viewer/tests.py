@@ -1,3 +1,1078 @@
-from django.test import TestCase
+import io
+import json
+import os
+from itertools import product
+from tempfile import TemporaryDirectory
 
-# Create your tests here.
+import numpy as np
+from PIL import Image
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from apps.accounts.models import GroupProfile, User
+from apps.database.models import Folder, Slide
+from .models import Annotation, AnnotationRevision, AnnotationShape
+from apps.database.tests import LargeDatasetTestCase
+from . import codec, revisions, simplify, spatial
+
+
+class ViewableAnnotationsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "Admin", "User")
+        groups = []
+        for name in ("pathology", "anatomy"):
+            group = Group.objects.create(name=name)
+            GroupProfile.objects.create(
+                group=group, type=GroupProfile.TypeChoices.PUBLISHER
+            )
+            groups.append(group)
+        cls.publisher = User.objects.create_user("pathologist", "Patho", "Logist")
+        cls.publisher.groups.add(groups[0])
+
+        students = Group.objects.create(name="students")
+        GroupProfile.objects.create(
+            group=students, type=GroupProfile.TypeChoices.VIEWER
+        )
+        cls.viewer = User.objects.create_user("student", "Stu", "Dent")
+        cls.viewer.groups.add(students)
+
+        # an annotation by every user on a public and a private slide at the
+        # root, in the publisher's folder and in another group's folder
+        folders = [None, groups[0].profile.base_folder, groups[1].profile.base_folder]
+        slides = Slide.objects.bulk_create(
+            Slide(
+                name=f"Slide {i}",
+                file=f"slides/{i}.svs",
+                is_public=is_public,
+                folder=folder,
+            )
+            for i, (folder, is_public) in enumerate(product(folders, (True, False)))
+        )
+        Annotation.objects.bulk_create(
+            Annotation(
+                name=f"Annotation {i}",
+                data=[{"type": "point", "points": [[i, i]]}],
+                author=author,
+                slide=slide,
+            )
+            for i, (slide, author) in enumerate(
+                product(slides, (cls.admin, cls.publisher, cls.viewer))
+            )
+        )
+
+    def legacy_viewable(self, user):
+        """The per-slide union that AnnotationManager.viewable used to build"""
+        if user.is_admin():
+            return Annotation.objects.all()
+        annotations = Annotation.objects.filter(author=user)
+        for slide in Slide.objects.viewable(user):
+            annotations |= Annotation.objects.viewable_by_slide(user, slide)
+        return annotations
+
+    def test_viewable_matches_legacy_semantics(self):
+        for user in (self.admin, self.publisher, self.viewer):
+            with self.subTest(user=user.username):
+                self.assertQuerySetEqual(
+                    Annotation.objects.viewable(user),
+                    self.legacy_viewable(user),
+                    ordered=False,
+                )
+
+    def test_viewable_matches_user_can_view(self):
+        for user in (self.admin, self.publisher, self.viewer):
+            with self.subTest(user=user.username):
+                expected = {
+                    annotation.pk
+                    for annotation in Annotation.objects.all()
+                    if annotation.user_can_view(user)
+                }
+                viewable = Annotation.objects.viewable(user).values_list(
+                    "pk", flat=True
+                )
+                self.assertEqual(set(viewable), expected)
+
+    def test_viewable_is_a_single_query(self):
+        with self.assertNumQueries(1):
+            list(Annotation.objects.viewable(self.viewer))
+
+
+class AnnotationQueryCountTests(LargeDatasetTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # one cell every 100 pixels, saved one by one to fill the shape table
+        cls.cells = Annotation.objects.create(
+            name="Cells",
+            data=[
+                {"type": "point", "points": [[x * 100, y * 100]]}
+                for x in range(20)
+                for y in range(20)
+            ],
+            author=cls.publisher,
+            slide=Slide.objects.filter(is_public=True).first(),
+        )
+
+    def get_shapes_url(self):
+        url = reverse("api:slide-shapes", kwargs={"pk": self.cells.slide_id})
+        return f"{url}?bbox=0,0,2000,2000"
+
+    def test_annotation_list_admin(self):
+        self.assertBoundedRequest(self.admin, reverse("api:annotation-list"))
+
+    def test_annotation_list_publisher(self):
+        self.assertBoundedRequest(self.publisher, reverse("api:annotation-list"))
+
+    def test_annotation_list_viewer(self):
+        self.assertBoundedRequest(self.viewer, reverse("api:annotation-list"))
+
+    def test_slide_annotations_viewer(self):
+        slide = Slide.objects.filter(is_public=True, annotations__isnull=False)[0]
+        url = reverse("api:slide-annotations", kwargs={"pk": slide.pk})
+        self.assertBoundedRequest(self.viewer, url)
+
+    def test_slide_shapes_admin(self):
+        self.assertBoundedRequest(self.admin, self.get_shapes_url())
+
+    def test_slide_shapes_publisher(self):
+        self.assertBoundedRequest(self.publisher, self.get_shapes_url())
+
+    def test_slide_shapes_viewer(self):
+        self.assertBoundedRequest(self.viewer, self.get_shapes_url())
+
+
+class AnnotationShapesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        group = Group.objects.create(name="pathology")
+        GroupProfile.objects.create(
+            group=group, type=GroupProfile.TypeChoices.PUBLISHER
+        )
+        cls.publisher = User.objects.create_user("pathologist", "Patho", "Logist")
+        cls.publisher.groups.add(group)
+
+        students = Group.objects.create(name="students")
+        GroupProfile.objects.create(
+            group=students, type=GroupProfile.TypeChoices.VIEWER
+        )
+        cls.viewer = User.objects.create_user("student", "Stu", "Dent")
+        cls.viewer.groups.add(students)
+        (cls.slide,) = Slide.objects.bulk_create(
+            [
+                Slide(
+                    name="Liver",
+                    file="slides/liver.svs",
+                    folder=group.profile.base_folder,
+                )
+            ]
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.annotation = Annotation.objects.create(
+            name="Outline",
+            data=[
+                {"type": "point", "points": [[0, 0]]},
+                {"type": "polygon", "points": [[0, 0], [1, 0], [1, 1]]},
+            ],
+            author=self.publisher,
+            slide=self.slide,
+        )
+        self.url = reverse("api:annotation-shapes", kwargs={"pk": self.annotation.pk})
+        self.client.force_login(self.publisher)
+
+    def patch(self, version, *operations):
+        return self.client.patch(
+            self.url,
+            {"version": version, "operations": list(operations)},
+            content_type="application/json",
+        )
+
+    def test_saved_shapes_get_ids(self):
+        point, polygon = self.annotation.data
+        self.assertNotEqual(point["id"], polygon["id"])
+        self.assertEqual(self.annotation.version, 0)
+
+    def test_operations(self):
+        point, polygon = self.annotation.data
+        response = self.patch(
+            0,
+            {"op": "add", "shape": {"type": "point", "points": [[5, 5]]}},
+            {"op": "modify", "id": polygon["id"], "shape": {"points": [[2, 2]]}},
+            {"op": "delete", "id": point["id"]},
+        )
+        self.assertEqual(response.status_code, 200)
+        added = response.json()["added"]
+        self.assertEqual(response.json()["version"], 1)
+
+        self.annotation.refresh_from_db()
+        self.assertEqual(self.annotation.version, 1)
+        self.assertEqual(
+            [codec.decode_shape(shape) for shape in self.annotation.data],
+            [
+                {"type": "polygon", "points": [[2, 2]], "id": polygon["id"]},
+                {"type": "point", "points": [[5, 5]], "id": added[0]},
+            ],
+        )
+
+    def test_stale_version_conflicts(self):
+        point, _ = self.annotation.data
+        response = self.patch(0, {"op": "delete", "id": point["id"]})
+        self.assertEqual(response.status_code, 200)
+
+        response = self.patch(0, {"op": "add", "shape": {"type": "point"}})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["version"], 1)
+        self.annotation.refresh_from_db()
+        self.assertEqual(len(self.annotation.data), 1)
+
+    def test_unknown_shape_changes_nothing(self):
+        point, _ = self.annotation.data
+        response = self.patch(
+            0,
+            {"op": "delete", "id": point["id"]},
+            {"op": "modify", "id": "missing", "shape": {}},
+        )
+        self.assertEqual(response.status_code, 400)
+
+        self.annotation.refresh_from_db()
+        self.assertEqual(self.annotation.version, 0)
+        self.assertEqual(len(self.annotation.data), 2)
+
+    def test_full_update_bumps_version(self):
+        response = self.client.patch(
+            reverse("api:annotation-detail", kwargs={"pk": self.annotation.pk}),
+            {"data": []},
+            content_type="application/json",
+        )
+        self.assertEqual(response.json()["version"], 1)
+        self.assertEqual(self.patch(0, {"op": "add", "shape": {}}).status_code, 409)
+
+    def test_only_editors_can_patch(self):
+        self.annotation.slide.is_public = True
+        self.annotation.slide.save()
+
+        self.client.force_login(self.viewer)
+        response = self.patch(0, {"op": "add", "shape": {}})
+        self.assertEqual(response.status_code, 403)
+
+
+class ViewportShapesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        group = Group.objects.create(name="pathology")
+        GroupProfile.objects.create(
+            group=group, type=GroupProfile.TypeChoices.PUBLISHER
+        )
+        cls.publisher = User.objects.create_user("pathologist", "Patho", "Logist")
+        cls.publisher.groups.add(group)
+
+        students = Group.objects.create(name="students")
+        GroupProfile.objects.create(
+            group=students, type=GroupProfile.TypeChoices.VIEWER
+        )
+        cls.viewer = User.objects.create_user("student", "Stu", "Dent")
+        cls.viewer.groups.add(students)
+        cls.slide, cls.other_slide, cls.third_slide, cls.private = (
+            Slide.objects.bulk_create(
+                Slide(
+                    name=f"Slide {i}",
+                    file=f"slides/{i}.svs",
+                    is_public=i < 3,
+                    folder=group.profile.base_folder,
+                )
+                for i in range(4)
+            )
+        )
+
+    def setUp(self):
+        cache.clear()
+        # one cell every 100 pixels, and an outline around all of them
+        cells = [
+            {"type": "point", "points": [[x * 100, y * 100]]}
+            for x in range(20)
+            for y in range(20)
+        ]
+        outline = {"type": "polygon", "points": [[0, 0], [2000, 0], [2000, 2000]]}
+        for slide in (self.slide, self.other_slide):
+            self.annotation = Annotation.objects.create(
+                name="Cells",
+                data=[*cells, outline],
+                author=self.publisher,
+                slide=slide,
+            )
+        self.url = reverse("api:slide-shapes", kwargs={"pk": self.slide.pk})
+
+    def get_shapes(self, bbox, user=None):
+        self.client.force_login(user or self.viewer)
+        response = self.client.get(self.url, {"bbox": bbox})
+        return response.json()["results"]
+
+    def test_only_intersecting_shapes(self):
+        shapes = self.get_shapes("150,150,350,350")
+        points = sorted(tuple(shape["points"][0]) for shape in shapes)
+        expected = [(x, y) for x in (200, 300) for y in (200, 300)]
+        self.assertEqual(points, sorted(expected + [(0, 0)]))
+        self.assertTrue(all(s["annotation"] != self.annotation.pk for s in shapes))
+
+    def test_shape_operations_move_shapes(self):
+        annotation = Annotation.objects.get(slide=self.slide)
+        cell = annotation.data[0]
+        annotation.apply_shape_operations(
+            [
+                {"op": "modify", "id": cell["id"], "shape": {"points": [[5000, 5000]]}},
+                {"op": "add", "shape": {"points": [[5100, 5100]]}},
+            ],
+            annotation.version,
+        )
+
+        shapes = self.get_shapes("4900,4900,6000,6000")
+        self.assertEqual(
+            sorted(shape["points"] for shape in shapes),
+            [[[5000, 5000]], [[5100, 5100]]],
+        )
+        self.assertEqual(len(self.get_shapes("-1,-1,1,1")), 1)
+
+    def test_shapes_follow_a_moved_annotation(self):
+        annotation = Annotation.objects.get(slide=self.other_slide)
+        annotation.slide = self.third_slide
+        annotation.save()
+
+        for slide, count in ((self.other_slide, 0), (annotation.slide, 5)):
+            shapes = AnnotationShape.objects.intersecting(slide, 150, 150, 350, 350)
+            self.assertEqual(shapes.count(), count)
+
+    def test_rtree_follows_the_shape_table(self):
+        if not spatial.is_available():
+            self.skipTest("The R-tree needs SQLite.")
+
+        def count_rtree():
+            with connection.cursor() as cursor:
+                cursor.execute(f"SELECT count(*) FROM {spatial.TABLE}")
+                return cursor.fetchone()[0]
+
+        self.assertEqual(count_rtree(), AnnotationShape.objects.count())
+        Annotation.objects.filter(slide=self.other_slide).delete()
+        self.assertEqual(count_rtree(), AnnotationShape.objects.count())
+
+        # an altered table loses its triggers
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TRIGGER {spatial.TABLE}_insert")
+            cursor.execute(f"DELETE FROM {spatial.TABLE}")
+        spatial.create_index()
+        self.assertEqual(count_rtree(), AnnotationShape.objects.count())
+        self.assertEqual(len(self.get_shapes("150,150,350,350")), 5)
+
+    def test_invalid_bbox(self):
+        self.client.force_login(self.viewer)
+        response = self.client.get(self.url, {"bbox": "1,2,3"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_private_slide_not_found(self):
+        self.client.force_login(self.viewer)
+        url = reverse("api:slide-shapes", kwargs={"pk": self.private.pk})
+        self.assertEqual(self.client.get(url, {"bbox": "0,0,1,1"}).status_code, 404)
+
+
+class LevelOfDetailTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        group = Group.objects.create(name="pathology")
+        GroupProfile.objects.create(
+            group=group, type=GroupProfile.TypeChoices.PUBLISHER
+        )
+        cls.publisher = User.objects.create_user("pathologist", "Patho", "Logist")
+        cls.publisher.groups.add(group)
+
+        students = Group.objects.create(name="students")
+        GroupProfile.objects.create(
+            group=students, type=GroupProfile.TypeChoices.VIEWER
+        )
+        cls.viewer = User.objects.create_user("student", "Stu", "Dent")
+        cls.viewer.groups.add(students)
+        (cls.slide,) = Slide.objects.bulk_create(
+            [Slide(name="Liver", file="slides/liver.svs", is_public=True)]
+        )
+
+    def setUp(self):
+        cache.clear()
+        # a circle of radius 10000 with a vertex every ~1.2 pixels
+        angles = np.linspace(0, 2 * np.pi, 50000)
+        outline = np.stack([np.cos(angles), np.sin(angles)], axis=1) * 10000
+        self.annotation = Annotation.objects.create(
+            name="Tumor",
+            data=[
+                {"type": "polygon", "points": outline.round(1).tolist()},
+                {"type": "point", "points": [[0, 0]]},
+            ],
+            author=self.publisher,
+            slide=self.slide,
+        )
+        self.client.force_login(self.viewer)
+
+    def test_simplify_keeps_the_outline(self):
+        points = codec.decode_shape(self.annotation.data[0])["points"]
+        for tolerance in simplify.TOLERANCES:
+            with self.subTest(tolerance=tolerance):
+                kept = simplify.simplify(points, tolerance)
+                self.assertLess(len(kept), len(points) / 10)
+                self.assertEqual(kept[0], 0)
+                self.assertEqual(kept[-1], len(points) - 1)
+                # a chord of the circle is at most the tolerance inside it
+                xy = np.array(points)[kept]
+                middles = (xy[1:] + xy[:-1]) / 2
+                self.assertLessEqual(
+                    10000 - np.hypot(middles[:, 0], middles[:, 1]).min(),
+                    tolerance + 1,
+                )
+
+    def test_get_level(self):
+        self.assertIsNone(simplify.get_level(1))
+        self.assertIsNone(simplify.get_level(0.6))
+        self.assertEqual(simplify.get_level(0.5), 0)
+        self.assertEqual(simplify.get_level(0.01), 2)
+        self.assertEqual(simplify.get_level(0.0001), len(simplify.TOLERANCES) - 1)
+
+    def test_annotation_detail_at_scale(self):
+        url = reverse("api:annotation-detail", kwargs={"pk": self.annotation.pk})
+        full = self.client.get(url).json()["data"]
+        coarse = self.client.get(url, {"scale": 0.01}).json()["data"]
+
+        self.assertEqual(len(full[0]["points"]), 50000)
+        self.assertLess(len(coarse[0]["points"]), 500)
+        self.assertEqual(coarse[0]["id"], full[0]["id"])
+        self.assertEqual(coarse[1], full[1])
+
+    def test_slide_annotations_at_scale(self):
+        url = reverse("api:slide-annotations", kwargs={"pk": self.slide.pk})
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(url, {"scale": 0.001}).json()
+        self.assertLess(len(data[0]["data"][0]["points"]), 100)
+
+        table = AnnotationShape._meta.db_table
+        self.assertEqual(len([q for q in queries if table in q["sql"]]), 1)
+
+    def test_viewport_at_scale(self):
+        url = reverse("api:slide-shapes", kwargs={"pk": self.slide.pk})
+        params = {"bbox": "9000,-100,11000,100", "scale": 0.1}
+        shapes = self.client.get(url, params).json()["results"]
+        self.assertEqual(len(shapes), 1)
+        self.assertLess(len(shapes[0]["points"]), 2000)
+
+    def test_operations_update_levels(self):
+        polygon = self.annotation.data[0]
+        self.annotation.apply_shape_operations(
+            [{"op": "modify", "id": polygon["id"], "shape": {"points": [[1, 1]] * 3}}],
+            self.annotation.version,
+        )
+        url = reverse("api:annotation-detail", kwargs={"pk": self.annotation.pk})
+        data = self.client.get(url, {"scale": 0.01}).json()["data"]
+        self.assertEqual(data[0]["points"], [[1, 1]] * 3)
+
+    def test_invalid_scale(self):
+        url = reverse("api:annotation-detail", kwargs={"pk": self.annotation.pk})
+        self.assertEqual(self.client.get(url, {"scale": "0"}).status_code, 400)
+
+
+class CompactPointsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        group = Group.objects.create(name="pathology")
+        GroupProfile.objects.create(
+            group=group, type=GroupProfile.TypeChoices.PUBLISHER
+        )
+        cls.publisher = User.objects.create_user("pathologist", "Patho", "Logist")
+        cls.publisher.groups.add(group)
+
+        students = Group.objects.create(name="students")
+        GroupProfile.objects.create(
+            group=students, type=GroupProfile.TypeChoices.VIEWER
+        )
+        cls.viewer = User.objects.create_user("student", "Stu", "Dent")
+        cls.viewer.groups.add(students)
+        (cls.slide,) = Slide.objects.bulk_create(
+            [Slide(name="Liver", file="slides/liver.svs", is_public=True)]
+        )
+
+    def setUp(self):
+        cache.clear()
+        rng = np.random.default_rng(0)
+        steps = rng.integers(-3, 4, size=(5000, 2))
+        self.points = (steps.cumsum(axis=0) + 100000).tolist()
+        self.annotation = Annotation.objects.create(
+            name="Outline",
+            data=[{"type": "polygon", "points": self.points}],
+            author=self.publisher,
+            slide=self.slide,
+        )
+        self.url = reverse("api:annotation-detail", kwargs={"pk": self.annotation.pk})
+        self.client.force_login(self.publisher)
+
+    def test_round_trip(self):
+        for points in (
+            [[0, 0]],
+            [[-5, 3], [2**33, -(2**33)], [0, 0]],
+            [[1.4, 2.6], [-1.5, 0.5]],
+            self.points,
+        ):
+            with self.subTest(points=points[:3]):
+                decoded = codec.decode_points(codec.encode_points(points))
+                self.assertEqual(decoded, [[round(x), round(y)] for x, y in points])
+
+                decoded = codec.decode_points(codec.encode_points(points, 16))
+                np.testing.assert_allclose(decoded, points, atol=1 / 32)
+
+    def test_sub_pixel_points_are_stored_in_fixed_point(self):
+        shapes = [
+            {"type": "polygon", "points": [[1.25, 2.5], [3, 4]]},
+            {"type": "point", "points": [[5.0, 6.0]]},
+        ]
+        self.annotation.data = shapes
+        self.annotation.save()
+
+        self.annotation.refresh_from_db()
+        polygon, point = self.annotation.data
+        self.assertTrue(polygon["points"].startswith("16:"))
+        self.assertEqual(codec.decode_shape(polygon)["points"], shapes[0]["points"])
+        self.assertEqual(point["points"], codec.encode_points([[5, 6]]))
+
+    def test_freehand_stored_compact(self):
+        # a stroke traced while zoomed out, in level-0 pixels of a 40x scan
+        rng = np.random.default_rng(0)
+        steps = rng.normal(scale=6.0, size=(2000, 2)) / 3.7
+        points = (steps.cumsum(axis=0) + [48213.7, 30911.2]).tolist()
+        self.annotation.data = [{"type": "freehand", "points": points}]
+        self.annotation.save()
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT data FROM slide_viewer_annotation WHERE id = %s",
+                [self.annotation.pk],
+            )
+            stored = cursor.fetchone()[0]
+        self.assertLess(len(stored), len(json.dumps(points)) / 8)
+
+        self.annotation.refresh_from_db()
+        shape = codec.decode_shape(self.annotation.data[0])
+        np.testing.assert_allclose(shape["points"], points, atol=1 / 32)
+
+    def test_stored_compact(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT data FROM slide_viewer_annotation WHERE id = %s",
+                [self.annotation.pk],
+            )
+            stored = cursor.fetchone()[0]
+        self.assertLess(len(stored), len(json.dumps(self.points)) / 4)
+
+        self.annotation.refresh_from_db()
+        shape = codec.decode_shape(self.annotation.data[0])
+        self.assertEqual(shape["points"], self.points)
+
+    def test_json_and_compact_views(self):
+        shape = self.client.get(self.url).json()["data"][0]
+        self.assertEqual(shape["points"], self.points)
+
+        shape = self.client.get(self.url, {"encoding": "compact"}).json()["data"][0]
+        self.assertEqual(codec.decode_points(shape["points"]), self.points)
+
+    def test_compact_input(self):
+        points = [[10, 10], [20, 10], [20, 20]]
+        response = self.client.patch(
+            self.url,
+            {"data": [{"type": "polygon", "points": codec.encode_points(points)}]},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.annotation.refresh_from_db()
+        self.assertEqual(codec.decode_shape(self.annotation.data[0])["points"], points)
+
+        response = self.client.patch(
+            self.url,
+            {"data": [{"type": "polygon", "points": "not base64!"}]},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_viewer_inlines_compact_points(self):
+        url = reverse(
+            "slide_viewer:slide-view", kwargs={"slide_id": self.annotation.slide_id}
+        )
+        response = self.client.get(url, {"annotation": self.annotation.pk})
+        encoded = codec.encode_points(self.points)
+        self.assertContains(response, encoded)
+        self.assertNotContains(response, json.dumps(self.points[0]))
+
+
+class AnnotationTransferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        group = Group.objects.create(name="pathology")
+        GroupProfile.objects.create(
+            group=group, type=GroupProfile.TypeChoices.PUBLISHER
+        )
+        cls.publisher = User.objects.create_user("pathologist", "Patho", "Logist")
+        cls.publisher.groups.add(group)
+
+        liver = Folder.objects.create(name="Liver", parent=group.profile.base_folder)
+        cls.source, cls.target = Slide.objects.bulk_create(
+            [
+                Slide(
+                    name="Cirrhosis",
+                    file="slides/cirrhosis.svs",
+                    is_public=True,
+                    folder=Folder.objects.create(name="Cirrhosis", parent=liver),
+                ),
+                Slide(name="Hepatitis", file="slides/hepatitis.svs", is_public=True),
+            ]
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.shapes = [
+            {"type": "polygon", "points": [[0, 0], [10, 0], [10, 10]], "color": "red"},
+            {"type": "point", "points": [[5, 5]]},
+            {"type": "line", "points": [[1, 2], [3, 4]]},
+        ]
+        Annotation.objects.create(
+            name="Tumor", data=self.shapes, author=self.publisher, slide=self.source
+        )
+        Annotation.objects.create(
+            name="Empty", data=[], author=self.publisher, slide=self.source
+        )
+        self.export_url = reverse("api:annotation-export")
+        self.import_url = reverse("api:annotation-import-annotations")
+        self.client.force_login(self.publisher)
+
+    def _import(self, body, content_type="application/json"):
+        return self.client.post(
+            f"{self.import_url}?slide={self.target.pk}",
+            body,
+            content_type=content_type,
+        )
+
+    def _stream(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode()
+
+    def test_geojson_round_trip(self):
+        response = self.client.get(self.export_url, {"slide": self.source.pk})
+        collection = json.loads(self._stream(response))
+        self.assertEqual(collection["type"], "FeatureCollection")
+        geometries = [feature["geometry"] for feature in collection["features"]]
+        self.assertEqual(
+            geometries,
+            [
+                {
+                    "type": "Polygon",
+                    "coordinates": [[[0, 0], [10, 0], [10, 10], [0, 0]]],
+                },
+                {"type": "Point", "coordinates": [5, 5]},
+                {"type": "LineString", "coordinates": [[1, 2], [3, 4]]},
+                None,
+            ],
+        )
+
+        response = self._import(json.dumps(collection))
+        self.assertEqual(response.status_code, 201)
+        imported = Annotation.objects.get(slide=self.target, name="Tumor")
+        shapes = [codec.decode_shape(shape) for shape in imported.data]
+        for shape in shapes:
+            shape.pop("id")
+        self.assertEqual(shapes, self.shapes)
+        self.assertTrue(
+            Annotation.objects.filter(slide=self.target, name="Empty").exists()
+        )
+        self.assertEqual(AnnotationShape.objects.filter(annotation=imported).count(), 3)
+
+    def test_ndjson_round_trip(self):
+        response = self.client.get(
+            self.export_url, {"slide": self.source.pk, "output": "ndjson"}
+        )
+        lines = self._stream(response).splitlines()
+        names = [json.loads(line)["name"] for line in lines]
+        self.assertEqual(names, ["Tumor", "Empty"])
+
+        response = self._import("\n".join(lines), "application/x-ndjson")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()["created"]), 2)
+
+    def test_folder_scope(self):
+        folder = self.source.folder
+        while folder.parent is not None:
+            folder = folder.parent
+        response = self.client.get(self.export_url, {"folder": folder.pk})
+        self.assertEqual(len(json.loads(self._stream(response))["features"]), 4)
+
+        response = self.client.get(self.export_url)
+        self.assertEqual(response.status_code, 400)
+
+    def test_import_is_atomic(self):
+        annotations = [{"name": f"Region {i}", "data": self.shapes} for i in range(50)]
+        annotations.append({"name": "Region 0"})
+        response = self._import(json.dumps(annotations))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Annotation.objects.filter(slide=self.target).exists())
+
+        response = self._import(json.dumps(annotations[:-1]))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Annotation.objects.filter(slide=self.target).count(), 50)
+        self.assertEqual(
+            AnnotationShape.objects.filter(slide=self.target).count(), 150
+        )
+
+        response = self._import(json.dumps(annotations[:1]))
+        self.assertEqual(response.status_code, 400)
+
+    def test_import_rejects_invalid_shapes(self):
+        response = self._import(
+            json.dumps([{"name": "Bad", "data": [{"points": "not base64!"}]}])
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class OverlayTileTests(TestCase):
+
+    DZI = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<Image Format="jpeg" Overlap="1" TileSize="254" '
+        'xmlns="http://schemas.microsoft.com/deepzoom/2008">'
+        '<Size Height="800" Width="1000"/></Image>'
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        group = Group.objects.create(name="pathology")
+        GroupProfile.objects.create(
+            group=group, type=GroupProfile.TypeChoices.PUBLISHER
+        )
+        cls.publisher = User.objects.create_user("pathologist", "Patho", "Logist")
+        cls.publisher.groups.add(group)
+
+        students = Group.objects.create(name="students")
+        GroupProfile.objects.create(
+            group=students, type=GroupProfile.TypeChoices.VIEWER
+        )
+        cls.viewer = User.objects.create_user("student", "Stu", "Dent")
+        cls.viewer.groups.add(students)
+        cls.slide, cls.private = Slide.objects.bulk_create(
+            [
+                Slide(
+                    name="Liver",
+                    file="slides/liver.svs",
+                    image_root="images/liver",
+                    is_public=True,
+                ),
+                Slide(
+                    name="Kidney",
+                    file="slides/kidney.svs",
+                    folder=group.profile.base_folder,
+                ),
+            ]
+        )
+
+    def setUp(self):
+        cache.clear()
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings = self.settings(MEDIA_ROOT=media_root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        os.makedirs(self.slide.get_image_directory())
+        with open(self.slide.get_dzi_path(), "w") as f:
+            f.write(self.DZI)
+
+        self.annotation = Annotation.objects.create(
+            name="Region",
+            data=[
+                {
+                    "type": "polygon",
+                    "points": [[10, 10], [100, 10], [100, 100], [10, 100]],
+                    "color": "#ff0000",
+                },
+                {"type": "point", "points": [[600, 600]]},
+            ],
+            author=self.publisher,
+            slide=self.slide,
+        )
+        self.client.force_login(self.viewer)
+
+    def _tile_url(self, level, col, row, tile_format="png"):
+        return reverse(
+            "api:annotation-overlay-tile",
+            kwargs={
+                "pk": self.annotation.pk,
+                "level": level,
+                "col": col,
+                "row": row,
+                "tile_format": tile_format,
+            },
+        )
+
+    def _get_tile(self, *args):
+        response = self.client.get(self._tile_url(*args))
+        self.assertEqual(response.status_code, 200)
+        return Image.open(io.BytesIO(response.content))
+
+    def test_overlay_dzi(self):
+        url = reverse("api:annotation-overlay-dzi", kwargs={"pk": self.annotation.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Format="png"', response.content)
+        self.assertIn(b'Width="1000"', response.content)
+
+        response = self.client.get(url, {"output": "webp"})
+        self.assertIn(b'Format="webp"', response.content)
+
+    def test_tiles_follow_the_dzi_grid(self):
+        tile = self._get_tile(10, 0, 0)
+        self.assertEqual(tile.mode, "RGBA")
+        self.assertEqual(tile.size, (255, 255))
+        self.assertEqual(tile.getpixel((50, 50))[:3], (255, 0, 0))
+        self.assertGreater(tile.getpixel((50, 50))[3], 0)
+        self.assertEqual(tile.getpixel((200, 200))[3], 0)
+
+        # the last tiles are cut short, and overlap the previous ones
+        tile = self._get_tile(10, 3, 3)
+        self.assertEqual(tile.size, (1000 - 761, 800 - 761))
+
+        # 600 px is at 300 px on the level below, in the second tile
+        tile = self._get_tile(9, 1, 1)
+        self.assertGreater(tile.getpixel((300 - 253, 300 - 253))[3], 0)
+
+        response = self.client.get(self._tile_url(10, 4, 0))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(self._tile_url(11, 0, 0))
+        self.assertEqual(response.status_code, 404)
+
+    def test_webp_tiles(self):
+        tile = self._get_tile(10, 0, 0, "webp")
+        self.assertEqual(tile.format, "WEBP")
+        self.assertEqual(tile.getpixel((50, 50))[:3], (255, 0, 0))
+
+    def test_tiles_are_cached_until_the_annotation_changes(self):
+        self._get_tile(10, 0, 0)
+        with CaptureQueriesContext(connection) as queries:
+            self._get_tile(10, 0, 0)
+        self.assertFalse(
+            [q for q in queries if "slide_viewer_annotationshape" in q["sql"]]
+        )
+
+        self.annotation.data = [{"type": "point", "points": [[600, 600]]}]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.annotation.save()
+        self.assertEqual(self._get_tile(10, 0, 0).getpixel((50, 50))[3], 0)
+
+    def test_private_annotations_stay_hidden(self):
+        self.annotation.slide = self.private
+        self.annotation.save()
+        response = self.client.get(self._tile_url(10, 0, 0))
+        self.assertEqual(response.status_code, 404)
+
+
+class AnnotationRevisionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        group = Group.objects.create(name="pathology")
+        GroupProfile.objects.create(
+            group=group, type=GroupProfile.TypeChoices.PUBLISHER
+        )
+        cls.publisher = User.objects.create_user("pathologist", "Patho", "Logist")
+        cls.publisher.groups.add(group)
+
+        students = Group.objects.create(name="students")
+        GroupProfile.objects.create(
+            group=students, type=GroupProfile.TypeChoices.VIEWER
+        )
+        cls.viewer = User.objects.create_user("student", "Stu", "Dent")
+        cls.viewer.groups.add(students)
+        (cls.slide,) = Slide.objects.bulk_create(
+            [Slide(name="Liver", file="slides/liver.svs", is_public=True)]
+        )
+
+    def setUp(self):
+        cache.clear()
+        rng = np.random.default_rng(0)
+        self.annotation = Annotation.objects.create(
+            name="Cells",
+            data=[
+                {"type": "polygon", "points": rng.integers(0, 10**5, (50, 2)).tolist()}
+                for _ in range(100)
+            ],
+            author=self.publisher,
+            slide=self.slide,
+        )
+        self.client.force_login(self.publisher)
+
+    def _url(self, name, **kwargs):
+        kwargs["pk"] = self.annotation.pk
+        return reverse(f"api:annotation-{name}", kwargs=kwargs)
+
+    def _get_data(self, version):
+        response = self.client.get(self._url("revision", version=version))
+        self.assertEqual(response.status_code, 200)
+        return response.json()["data"]
+
+    def _edit(self, i):
+        shape = self.annotation.data[i]
+        response = self.client.patch(
+            self._url("shapes"),
+            {
+                "version": self.annotation.version,
+                "operations": [
+                    {"op": "modify", "id": shape["id"], "shape": {"color": "red"}}
+                ],
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.annotation.refresh_from_db()
+
+    def test_edits_are_stored_as_deltas(self):
+        history = [self.client.get(self._url("detail")).json()["data"]]
+        for i in range(20):
+            self._edit(i)
+            history.append(self.client.get(self._url("detail")).json()["data"])
+
+        revisions = self.client.get(self._url("revisions")).json()
+        self.assertEqual([r["version"] for r in revisions], list(range(21)))
+        self.assertTrue(revisions[0]["snapshot"])
+        self.assertFalse(any(r["snapshot"] for r in revisions[1:]))
+        # 20 revisions take about as much space as a couple of copies
+        snapshot = revisions[0]["size"]
+        self.assertLess(sum(r["size"] for r in revisions), 1.5 * snapshot)
+
+        for version in (0, 7, 20):
+            self.assertEqual(self._get_data(version), history[version])
+
+    def test_snapshot_once_deltas_add_up(self):
+        # replacing every shape makes a delta as large as the data
+        self.annotation.data = [
+            {"type": "point", "points": [[i, i]]} for i in range(100)
+        ]
+        self.annotation.save()
+        self._edit(0)
+        revisions = self.client.get(self._url("revisions")).json()
+        self.assertEqual([r["snapshot"] for r in revisions], [True, True, False])
+
+    def test_full_saves_record_deletions_and_order(self):
+        first, second, *rest = self.annotation.data
+        self.annotation.data = [second, first, *rest[:-1]]
+        self.annotation.save()
+
+        revision = AnnotationRevision.objects.get(annotation=self.annotation, version=1)
+        self.assertEqual(revision.delta["set"], [])
+        self.assertEqual(revision.delta["delete"], [rest[-1]["id"]])
+        self.assertEqual(
+            [codec.decode_shape(shape) for shape in self.annotation.data],
+            self._get_data(1),
+        )
+
+    def test_shape_ids_stay_unique(self):
+        first, second = self.annotation.data[:2]
+        data = [first, {**second, "id": first["id"]}]
+        response = self.client.patch(
+            self._url("detail"), {"data": data}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+        self.annotation.data = data
+        self.annotation.save()
+        self.assertEqual(self.annotation.data[0], first)
+        self.assertNotEqual(self.annotation.data[1]["id"], first["id"])
+        self.assertEqual(
+            self._get_data(1), [codec.decode_shape(s) for s in self.annotation.data]
+        )
+        # rows stored before ids were checked get a snapshot, not a delta
+        legacy = [first, {**second, "id": first["id"]}]
+        self.assertIsNone(revisions.get_delta(self.annotation.data, legacy))
+
+    def test_restore(self):
+        original = self._get_data(0)
+        self._edit(0)
+        self.annotation.name = "Renamed"
+        self.annotation.save()
+
+        response = self.client.post(self._url("restore", version=0))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["name"], "Cells")
+        self.assertEqual(response.json()["version"], 3)
+        self.assertEqual(response.json()["data"], original)
+        self.assertEqual(self._get_data(3), original)
+
+        response = self.client.post(self._url("restore", version=9))
+        self.assertEqual(response.status_code, 404)
+
+        self.client.force_login(self.viewer)
+        response = self.client.post(self._url("restore", version=0))
+        self.assertEqual(response.status_code, 403)
+
+
+class LoadtestCommandTests(TransactionTestCase):
+    """Run the load test against its in-process server, which needs committed data"""
+
+    def setUp(self):
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings = self.settings(
+            MEDIA_ROOT=media_root.name, ALLOWED_HOSTS=["127.0.0.1"]
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        (slide,) = Slide.objects.bulk_create(
+            [
+                Slide(
+                    name="Liver",
+                    file="slides/liver.svs",
+                    image_root="images/liver",
+                    is_public=True,
+                )
+            ]
+        )
+        os.makedirs(slide.get_image_directory())
+        with open(slide.get_dzi_path(), "w") as f:
+            f.write(
+                '<Image Format="jpeg" Overlap="1" TileSize="254" '
+                'xmlns="http://schemas.microsoft.com/deepzoom/2008">'
+                '<Size Height="400" Width="600"/></Image>'
+            )
+
+    def test_smoke(self):
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, "report.json")
+            call_command(
+                "loadtest",
+                "--users=2",
+                "--duration=1",
+                "--ramp-up=0",
+                "--steps=1",
+                "--think-time=0",
+                "--seed=1",
+                f"--json={path}",
+                stdout=io.StringIO(),
+            )
+            with open(path) as f:
+                report = json.load(f)
+
+        endpoints = report["endpoints"]
+        self.assertEqual(endpoints["login"]["errors"], 0)
+        self.assertGreater(endpoints["page"]["count"], 0)
+        self.assertEqual(endpoints["dzi"]["errors"], 0)
+        # queries are counted by the in-process server
+        self.assertIsNotNone(endpoints["dzi"]["queries"])
+        self.assertIn("tile", endpoints)
+        # the synthetic users are removed, with their group
+        self.assertFalse(User.objects.filter(username__startswith="loadtest"))
+        self.assertFalse(Group.objects.filter(name="Load Test"))
+
+    def test_remote_server_needs_existing_users(self):
+        with self.assertRaisesMessage(CommandError, "there and pass their"):
+            call_command("loadtest", "--url=https://microscope.example.org")
+        self.assertFalse(User.objects.filter(username__startswith="loadtest"))
@@ -7,6 +7,8 @@ from django.shortcuts import get_object_or_404
 from django.views.generic import TemplateView
 
 from apps.database.models import Slide
+from apps.lectures.models import Lecture
+from apps.slide_viewer.codec import encode_shape
 from apps.slide_viewer.models import Annotation
 
 logger = logging.getLogger("django")
@@ -35,9 +37,29 @@ class SlideView(LoginRequiredMixin, PermissionRequiredMixin, TemplateView):
 
         context["slide"] = slide
         context["annotation"] = annotation
+        # inlined with encoded points, which viewer.js decodes
+        data = annotation.data if annotation else None
+        if isinstance(data, list):
+            data = [encode_shape(shape) for shape in data]
+        context["annotation_data"] = data
         context["editable"] = slide.user_can_edit(self.request.user)
+        context.update(self.get_live_context(slide))
         return context
 
+    def get_live_context(self, slide):
+        """Get the lecture the slide is viewed in, to present or follow it live"""
+        lecture_id = self.request.GET.get("lecture", "")
+        if not lecture_id.isdigit():
+            return {}
+        lecture = Lecture.objects.filter(pk=lecture_id, contents__slide=slide).first()
+        if lecture is None or not lecture.user_can_view(self.request.user):
+            return {}
+        return {
+            "lecture": lecture,
+            "live_present": lecture.user_can_edit(self.request.user),
+            "live_join": "live" in self.request.GET,
+        }
+
 
 def save_annotation(request, slide_id):
     """Save an annotation for a slide."""
@@ -6,5 +6,6 @@ urlpatterns = [
     path("lectures/", include("apps.lectures.api.urls")),
     path("database/", include("apps.database.api.urls")),
     path("viewer/", include("apps.slide_viewer.api.urls")),
+    path("search/", include("apps.search.api.urls")),
     # path("accounts/", include("apps.accounts.api.urls")),
 ]
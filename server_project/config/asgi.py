@@ -2,6 +2,8 @@
 ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP goes to Django, WebSockets to the live lectures of apps.lectures.live,
+whose connections of a lecture must all reach the same process.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -13,4 +15,16 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# imported once the apps are loaded
+from apps.lectures.live import live_lecture_application  # noqa: E402
+from apps.monitoring.metrics import share_across_workers  # noqa: E402
+
+share_across_workers()
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "websocket":
+        return await live_lecture_application(scope, receive, send)
+    return await django_application(scope, receive, send)
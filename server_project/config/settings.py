@@ -27,12 +27,14 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 secrets_file_path = os.path.join(BASE_DIR, "secrets.json")
 
 
-def get_secret(setting):
+def get_secret(setting, required=True):
     try:
         with open(secrets_file_path) as f:
             secrets = json.loads(f.read())
         return secrets[setting]
     except KeyError:
+        if not required:
+            return None
         error_msg = "Set the {} environment variable".format(setting)
         raise ImproperlyConfigured(error_msg)
 
@@ -103,12 +105,16 @@ INSTALLED_APPS = [
     "django.contrib.staticfiles",
     "rest_framework",
     "apps.accounts",
+    "apps.caching",
     "apps.database",
     "apps.lectures",
+    "apps.monitoring",
+    "apps.search",
     "apps.slide_viewer",
 ]
 
 MIDDLEWARE = [
+    "apps.monitoring.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -191,6 +197,16 @@ else:
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media/")
 
+# Trash
+# Slide image directories are renamed into MEDIA_ROOT/.trash when a slide is
+# deleted or its file replaced, and a thread of the worker removes them at
+# FILES_PER_SECOND. uWSGI runs it only with enable-threads; anything left
+# behind is removed by `manage.py reclaim_image_directories --reclaim`.
+
+TRASH = {
+    "FILES_PER_SECOND": 1000,
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -216,12 +232,58 @@ REST_FRAMEWORK = {
     "DEFAULT_FILTER_BACKENDS": [
         "django_filters.rest_framework.DjangoFilterBackend",
     ],
+    "DEFAULT_PAGINATION_CLASS": "apps.database.api.pagination.CursorPagination",
+    "PAGE_SIZE": 100,
 }
 if not DEBUG:
     REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"].remove(
         "rest_framework.renderers.BrowsableAPIRenderer"
     )
 
+# Metrics
+# Every worker started through config.wsgi or config.asgi writes its counters
+# to DIRECTORY so that the metrics endpoint can report totals across all uWSGI
+# workers. Tests and management commands only count in memory.
+
+METRICS = {
+    "DIRECTORY": os.path.join(BASE_DIR, "logs", "metrics"),
+    "FLUSH_INTERVAL": 5,  # seconds
+    "TOKEN": get_secret("METRICS_TOKEN", required=False),
+}
+
+# Cache
+# Invalidation bumps version counters stored in the cache itself, so every
+# process serving the site has to share one cache: the uWSGI workers and the
+# ASGI server of live lectures. "file" (the default) does on a single host,
+# "database" (after `manage.py createcachetable`) across hosts. "locmem" keeps
+# a separate cache in every process, and only suits a lone runserver.
+# Permission checks never read the cache, so a stale entry can only show
+# outdated content, not grant access.
+
+CACHE_BACKENDS = {
+    "locmem": (
+        "django.core.cache.backends.locmem.LocMemCache",
+        "virtual-microscope",
+    ),
+    "file": (
+        "django.core.cache.backends.filebased.FileBasedCache",
+        os.path.join(BASE_DIR, "cache"),
+    ),
+    "database": ("django.core.cache.backends.db.DatabaseCache", "cache_table"),
+}
+CACHE_BACKEND, CACHE_LOCATION = CACHE_BACKENDS[
+    get_secret("CACHE_BACKEND", required=False) or "file"
+]
+
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKEND,
+        "LOCATION": CACHE_LOCATION,
+        "TIMEOUT": 60 * 60,  # seconds
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    }
+}
+
 # Bootstrap Messages
 
 messages.DEFAULT_TAGS.update(
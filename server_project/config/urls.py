@@ -28,4 +28,5 @@ urlpatterns = [
     path("accounts/", include("apps.accounts.urls")),
     path("lectures/", include("apps.lectures.urls")),
     path("api/", include("config.api_urls")),
+    path("metrics/", include("apps.monitoring.urls")),
 ]
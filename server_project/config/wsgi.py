@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# imported once the apps are loaded
+from apps.monitoring.metrics import share_across_workers  # noqa: E402
+
+share_across_workers()